@@ -0,0 +1,114 @@
+"""
+Batch Operations Module
+Runs lists of delete, rename and create-folder operations on a bounded worker
+pool and reports a result per operation, so bulk changes take one request
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from delete_engine import get_delete_engine
+from file_operations import FileOperations
+
+# Operations running at once per batch
+BATCH_WORKERS = 8
+
+# Largest batch accepted
+MAX_BATCH_OPERATIONS = 10000
+
+
+class BatchRunner:
+    def __init__(self, file_ops=None, max_workers=BATCH_WORKERS):
+        """Initialize the runner; its worker pool is shared by every batch"""
+        self.file_ops = file_ops or FileOperations()
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+    
+    def run(self, operations, default_directory=None, deletions=None, cancel_event=None):
+        """Yield a result dict per operation, in the order they finish
+        
+        Operations are dicts with 'op' and its arguments:
+        {'op': 'delete', 'path'}, {'op': 'rename', 'path', 'new_name'} or
+        {'op': 'create_folder', 'name', 'path' (the parent folder, default
+        default_directory)}. Each result has the operation's 'index', 'op'
+        and 'path', and either 'success' or 'error'. At most max_workers
+        operations run at a time; closing the generator or setting
+        cancel_event leaves the rest unstarted, and closing it returns
+        once the operations already running finish. With a StagedDelete in
+        deletions, deleted items are staged into it for the caller to
+        reclaim, instead of being deleted on the spot.
+        """
+        pending = {}
+        queued = iter(enumerate(operations))
+        try:
+            while True:
+                # Keep a bounded number of operations in flight
+                while len(pending) < self.max_workers * 2:
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    try:
+                        index, operation = next(queued)
+                    except StopIteration:
+                        break
+                    pending[self._pool.submit(self.apply, operation, default_directory, deletions)] = (index, operation)
+                if not pending:
+                    return
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, operation = pending.pop(future)
+                    result = {
+                        'index': index,
+                        'op': operation.get('op') if isinstance(operation, dict) else None,
+                        'path': operation.get('path') if isinstance(operation, dict) else None
+                    }
+                    try:
+                        result['success'] = future.result()
+                    except Exception as e:
+                        result['error'] = str(e)
+                    yield result
+        finally:
+            # Running operations can't be cancelled; wait so none stages a deletion after this
+            wait([future for future in pending if not future.cancel()])
+    
+    def apply(self, operation, default_directory=None, deletions=None):
+        """Run one operation and return its success message; raises on failure (worker thread)"""
+        if not isinstance(operation, dict):
+            raise Exception('Operation must be an object')
+        op = operation.get('op')
+        path = operation.get('path')
+        
+        if op == 'delete':
+            if not path:
+                raise Exception('Path is required')
+            if deletions is None:
+                self.file_ops.delete_item(Path(path))
+            else:
+                try:
+                    get_delete_engine().stage_item(path, deletions)
+                except OSError as e:
+                    raise Exception(f"Cannot delete item: {e}")
+            return 'Item deleted successfully'
+        
+        if op == 'rename':
+            new_name = operation.get('new_name')
+            if not path or not new_name:
+                raise Exception('Both path and new_name are required')
+            old = Path(path)
+            self.file_ops.rename_item(old, old.parent / new_name)
+            return 'Item renamed successfully'
+        
+        if op == 'create_folder':
+            name = operation.get('name')
+            if not name:
+                raise Exception('Folder name is required')
+            parent = Path(path) if path else default_directory
+            if parent is None:
+                raise Exception('Path is required')
+            self.file_ops.create_folder(Path(parent) / name)
+            return 'Folder created successfully'
+        
+        raise Exception(f"Unknown operation: {op}")
+    
+    def shutdown(self):
+        """Stop the worker pool"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
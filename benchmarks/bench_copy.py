@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Copy Engine Benchmark
+Compares shutil.copytree with the parallel CopyEngine on a many-small-files
+tree and a few-large-files tree, reporting wall time and throughput.
+
+Usage: python benchmarks/bench_copy.py [small_files] [large_files] [large_size_mb] [workers]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Add the parent directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from copy_engine import CopyEngine
+from utils import Utils
+
+
+def make_small_tree(root, count, size=4096, per_dir=500):
+    """Create count small files spread over subfolders"""
+    payload = os.urandom(size)
+    for i in range(count):
+        folder = os.path.join(root, f"dir_{i // per_dir:04d}")
+        if i % per_dir == 0:
+            os.makedirs(folder)
+        with open(os.path.join(folder, f"file_{i:06d}.dat"), 'wb') as f:
+            f.write(payload)
+
+
+def make_large_tree(root, count, size_mb):
+    """Create count large files"""
+    os.makedirs(root)
+    block = os.urandom(1 << 20)
+    for i in range(count):
+        with open(os.path.join(root, f"large_{i}.bin"), 'wb') as f:
+            for _ in range(size_mb):
+                f.write(block)
+
+
+def tree_totals(root):
+    """Count files and bytes below root"""
+    files = total = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            files += 1
+            total += os.path.getsize(os.path.join(directory, name))
+    return files, total
+
+
+def report(label, seconds, files, total):
+    utils = Utils()
+    rate = utils.format_size(int(total / seconds)) if seconds > 0 else '-'
+    print(f"  {label:<26} {seconds:>8.3f} s {files / seconds:>10.0f} files/s {rate:>10}/s")
+
+
+def run(label, source, workdir, workers):
+    files, total = tree_totals(source)
+    print(f"{label}: {files} files, {Utils().format_size(total)}")
+    
+    dest = os.path.join(workdir, 'copy_shutil')
+    start = time.perf_counter()
+    shutil.copytree(source, dest)
+    report('shutil.copytree', time.perf_counter() - start, files, total)
+    shutil.rmtree(dest)
+    
+    dest = os.path.join(workdir, 'copy_engine')
+    engine = CopyEngine(max_workers=workers)
+    stats = engine.copy([(source, dest)])
+    report(f'CopyEngine ({workers} workers)', stats['seconds'], stats['files'], stats['bytes'])
+    shutil.rmtree(dest)
+
+
+def main():
+    small_files = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    large_files = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    large_size_mb = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        small = os.path.join(workdir, 'small')
+        make_small_tree(small, small_files)
+        run('Many small files', small, workdir, workers)
+        shutil.rmtree(small)
+        
+        large = os.path.join(workdir, 'large')
+        make_large_tree(large, large_files, large_size_mb)
+        run('Few large files', large, workdir, workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Row Formatting Benchmark
+Compares the original per-row size/date formatting with the memoized
+formatters and the column API in Utils. Reports milliseconds per 10k rows.
+
+Usage: python benchmarks/bench_formatting.py [rows] [repeats]
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+# Add the parent directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import Utils, minute_text, size_bucket_text
+
+
+def legacy_format_size(size_bytes):
+    """format_size as it was before the lookup tables"""
+    if size_bytes is None:
+        return ""
+    if size_bytes == 0:
+        return "0 B"
+    size_names = ["B", "KB", "MB", "GB", "TB", "PB"]
+    i = 0
+    size = float(size_bytes)
+    while size >= 1024.0 and i < len(size_names) - 1:
+        size /= 1024.0
+        i += 1
+    if i == 0:
+        return f"{int(size)} {size_names[i]}"
+    return f"{size:.1f} {size_names[i]}"
+
+
+def legacy_format_mtime(mtime):
+    """Date formatting as the views did it: a datetime and strftime per row"""
+    return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M')
+
+
+def make_columns(count):
+    """Build size and mtime columns shaped like a real folder"""
+    random.seed(1)
+    now = time.time()
+    sizes = [None if i % 20 == 0 else int(random.lognormvariate(9, 3)) for i in range(count)]
+    # Files arrive in bursts (checkouts, downloads, builds) spread over three years
+    bursts = [now - random.uniform(0, 3 * 365 * 86400) for _ in range(max(count // 50, 1))]
+    mtimes = [random.choice(bursts) + random.uniform(0, 120) for _ in range(count)]
+    return sizes, mtimes
+
+
+def measure(label, func, count, repeats):
+    """Run func repeats times and print the best time per 10k rows"""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<30} {best * 10000 / count * 1000:>8.2f} ms/10k rows")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    utils = Utils()
+    sizes, mtimes = make_columns(count)
+    print(f"Formatting {count} rows (best of {repeats})")
+    
+    measure('legacy per row', lambda: [(legacy_format_size(s), legacy_format_mtime(m))
+                                       for s, m in zip(sizes, mtimes)], count, repeats)
+    
+    size_bucket_text.cache_clear()
+    minute_text.cache_clear()
+    measure('memoized per row (cold)', lambda: [(utils.format_size(s), utils.format_timestamp(m))
+                                                for s, m in zip(sizes, mtimes)], count, 1)
+    measure('memoized per row (warm)', lambda: [(utils.format_size(s), utils.format_timestamp(m))
+                                                for s, m in zip(sizes, mtimes)], count, repeats)
+    measure('column API (warm)', lambda: (utils.format_sizes(sizes), utils.format_timestamps(mtimes)),
+            count, repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Directory Listing Benchmark
+Compares the legacy iterdir-based listing with the os.scandir listing engine.
+Reports wall time and stat-family syscalls per 10k entries.
+
+Usage: python benchmarks/bench_listing.py [entries] [repeats]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add the parent directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_operations import FileOperations
+
+
+class SyscallCounter:
+    """Count stat-family calls made through os.stat, os.lstat and DirEntry.stat"""
+    
+    def __init__(self):
+        self.counts = {'stat': 0, 'readdir': 0}
+        self._originals = {}
+    
+    def __enter__(self):
+        counter = self
+        real_stat = os.stat
+        real_lstat = os.lstat
+        real_scandir = os.scandir
+        real_listdir = os.listdir
+        
+        class CountingEntry:
+            __slots__ = ('_entry',)
+            
+            def __init__(self, entry):
+                self._entry = entry
+            
+            @property
+            def name(self):
+                return self._entry.name
+            
+            @property
+            def path(self):
+                return self._entry.path
+            
+            def is_dir(self, *, follow_symlinks=True):
+                # d_type answers this without a syscall except for symlinks
+                if follow_symlinks and self._entry.is_symlink():
+                    counter.counts['stat'] += 1
+                return self._entry.is_dir(follow_symlinks=follow_symlinks)
+            
+            def is_file(self, *, follow_symlinks=True):
+                if follow_symlinks and self._entry.is_symlink():
+                    counter.counts['stat'] += 1
+                return self._entry.is_file(follow_symlinks=follow_symlinks)
+            
+            def is_symlink(self):
+                return self._entry.is_symlink()
+            
+            def stat(self, *, follow_symlinks=True):
+                counter.counts['stat'] += 1
+                return self._entry.stat(follow_symlinks=follow_symlinks)
+        
+        class CountingScandir:
+            def __init__(self, path):
+                counter.counts['readdir'] += 1
+                self._it = real_scandir(path)
+            
+            def __enter__(self):
+                return self
+            
+            def __exit__(self, *exc):
+                self._it.close()
+            
+            def __iter__(self):
+                for entry in self._it:
+                    yield CountingEntry(entry)
+        
+        def counting_stat(*args, **kwargs):
+            counter.counts['stat'] += 1
+            return real_stat(*args, **kwargs)
+        
+        def counting_lstat(*args, **kwargs):
+            counter.counts['stat'] += 1
+            return real_lstat(*args, **kwargs)
+        
+        def counting_listdir(*args, **kwargs):
+            counter.counts['readdir'] += 1
+            return real_listdir(*args, **kwargs)
+        
+        self._originals = {'stat': real_stat, 'lstat': real_lstat,
+                           'scandir': real_scandir, 'listdir': real_listdir}
+        os.stat = counting_stat
+        os.lstat = counting_lstat
+        os.scandir = CountingScandir
+        os.listdir = counting_listdir
+        return self
+    
+    def __exit__(self, *exc):
+        for name, func in self._originals.items():
+            setattr(os, name, func)
+
+
+def legacy_directory_contents(file_ops, path):
+    """The original iterdir-based listing, kept here as the baseline"""
+    path = Path(path)
+    items = []
+    for item in sorted(path.iterdir(), key=lambda x: (x.is_file(), x.name.lower())):
+        try:
+            stat = item.stat()
+            items.append({
+                'name': item.name,
+                'type': 'Folder' if item.is_dir() else file_ops.get_file_type(item),
+                'size': stat.st_size if item.is_file() else None,
+                'modified': datetime.fromtimestamp(stat.st_mtime),
+                'path': item
+            })
+        except (OSError, PermissionError):
+            continue
+    return items
+
+
+def populate(directory, count):
+    """Create a mix of files and folders to list"""
+    extensions = ['.txt', '.py', '.jpg', '.json', '']
+    for i in range(count):
+        if i % 10 == 0:
+            os.mkdir(os.path.join(directory, f"folder_{i:06d}"))
+        else:
+            name = f"file_{i:06d}{extensions[i % len(extensions)]}"
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(b'x' * (i % 512))
+
+
+def measure(label, func, count, repeats):
+    """Run a listing function and print time and syscalls per 10k entries"""
+    with SyscallCounter() as counter:
+        func()
+    
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    
+    scale = 10000 / count
+    print(f"{label:<32} {best * scale * 1000:>10.1f} ms/10k "
+          f"{counter.counts['stat'] * scale:>10.0f} stat/10k "
+          f"{counter.counts['readdir']:>4} readdir")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    file_ops = FileOperations()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        populate(directory, count)
+        print(f"Listing {count} entries in {directory} (best of {repeats})")
+        measure('legacy iterdir', lambda: legacy_directory_contents(file_ops, directory), count, repeats)
+        measure('scandir scan_directory', lambda: file_ops.scan_directory(directory), count, repeats)
+        measure('scandir get_directory_contents', lambda: file_ops.get_directory_contents(directory), count, repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Listing Memory Benchmark
+Measures the memory held by a large directory listing in the legacy per-item
+dict form, as compact record tuples, as Entry objects and as a columnar
+Listing, using tracemalloc on synthetic entries (no disk access).
+
+Usage: python benchmarks/bench_memory.py [entries]
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+# Add the parent directory to Python path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from listing import Entry, Listing, type_for_name
+
+EXTENSIONS = ('.txt', '.py', '.jpg', '.json', '.dat', '')
+
+
+def make_records(count):
+    """Build compact (name, is_dir, size, mtime) records like a large folder"""
+    now = time.time()
+    records = []
+    for i in range(count):
+        is_dir = i % 20 == 0
+        name = f"folder_{i:07d}" if is_dir else f"file_{i:07d}{EXTENSIONS[i % len(EXTENSIONS)]}"
+        records.append((name, is_dir, None if is_dir else i * 37, now - i))
+    return records
+
+
+def legacy_items(directory, records):
+    """Build the per-item dicts get_directory_contents used to return"""
+    return [{
+        'name': name,
+        'type': 'Folder' if is_dir else type_for_name(name),
+        'size': size,
+        'modified': datetime.fromtimestamp(mtime),
+        'path': directory / name
+    } for name, is_dir, size, mtime in records]
+
+
+def measure(label, build, count):
+    """Report the memory held by what build() returns"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<22} {held / 1024 / 1024:>9.1f} MB {held / count:>8.0f} B/entry {seconds * 1000:>9.1f} ms")
+    del result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = Path('/data/large_folder')
+    records = make_records(count)
+    print(f"Listing of {count} entries (memory held, excluding the shared input records)")
+    
+    measure('dict items (legacy)', lambda: legacy_items(directory, records), count)
+    measure('record tuples', lambda: [(name, is_dir, size, mtime) for name, is_dir, size, mtime in records], count)
+    measure('Entry objects', lambda: [Entry.from_record(directory, record) for record in records], count)
+    measure('Listing columns', lambda: Listing(directory, records), count)
+    
+    # Only rendered rows are formatted; show the cost of one 500-row page
+    entries = [Entry.from_record(directory, record) for record in records[:500]]
+    start = time.perf_counter()
+    rows = [(entry.name, entry.size_text, entry.type, entry.modified_text) for entry in entries]
+    print(f"Formatting one 500-row page: {(time.perf_counter() - start) * 1000:.1f} ms ({len(rows)} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Content Search Module
+Searches inside files like grep: files are memory-mapped and scanned with
+bytes.find or a compiled regex across a process pool, and matches are
+streamed back as workers finish
+"""
+
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from file_operations import FileOperations
+
+# Files larger than this are not searched
+MAX_FILE_SIZE = 64 * 1024 * 1024
+
+# Bytes read from the start of a file to tell text from binary
+SNIFF_SIZE = 8192
+
+# Matching lines reported per file
+MAX_MATCHES_PER_FILE = 100
+
+# Longest line text returned with a match
+MAX_LINE_LENGTH = 300
+
+# Files and bytes handed to a worker per task, so small files don't cost one round trip each
+BATCH_FILES = 64
+BATCH_BYTES = 16 * 1024 * 1024
+
+# Compiled patterns, per process
+_patterns = {}
+
+
+def compile_pattern(pattern, regex=False, ignore_case=True):
+    """Compile a search term into a bytes regex, or None when a plain bytes.find will do
+    
+    Raises re.error for an invalid regular expression.
+    """
+    key = (pattern, regex, ignore_case)
+    if key not in _patterns:
+        if not regex and not ignore_case:
+            _patterns[key] = None
+        else:
+            source = pattern.encode('utf-8') if regex else re.escape(pattern.encode('utf-8'))
+            flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+            _patterns[key] = re.compile(source, flags)
+    return _patterns[key]
+
+
+def check_pattern(pattern, regex=False, ignore_case=True):
+    """Raise ValueError if pattern is not a valid search term"""
+    try:
+        compile_pattern(pattern, regex, ignore_case)
+    except re.error as e:
+        raise ValueError(f"Invalid regular expression: {e}")
+
+
+def scan_buffer(buf, needle, compiled, max_matches):
+    """Find matching lines in a bytes-like buffer; returns [(line_number, line)]
+    
+    Each line is reported once, like grep.
+    """
+    matches = []
+    line_number = 1
+    counted = 0
+    pos = 0
+    size = len(buf)
+    
+    while pos <= size and len(matches) < max_matches:
+        if compiled is None:
+            start = buf.find(needle, pos)
+            if start < 0:
+                break
+        else:
+            match = compiled.search(buf, pos)
+            if match is None:
+                break
+            start = match.start()
+        
+        line_start = buf.rfind(b'\n', 0, start) + 1
+        line_end = buf.find(b'\n', start)
+        if line_end < 0:
+            line_end = size
+        
+        line_number += buf[counted:line_start].count(b'\n')
+        counted = line_start
+        
+        text = buf[line_start:min(line_end, line_start + MAX_LINE_LENGTH)]
+        matches.append((line_number, text.decode('utf-8', 'replace').rstrip('\r')))
+        pos = line_end + 1
+    
+    return matches
+
+
+def search_file(path, pattern, regex=False, ignore_case=True,
+                max_matches=MAX_MATCHES_PER_FILE, max_file_size=MAX_FILE_SIZE):
+    """Search one file; binary, empty, oversized and unreadable files give no matches"""
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0 or size > max_file_size:
+                return []
+            
+            # A NUL byte near the start means binary, as grep decides it
+            if b'\0' in f.read(SNIFF_SIZE):
+                return []
+            
+            compiled = compile_pattern(pattern, regex, ignore_case)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return scan_buffer(mm, pattern.encode('utf-8'), compiled, max_matches)
+    except (OSError, ValueError):
+        return []
+
+
+def search_batch(paths, pattern, regex, ignore_case, max_matches, max_file_size):
+    """Search several files (worker process); returns [(path, matches)] for files that match"""
+    results = []
+    for path in paths:
+        matches = search_file(path, pattern, regex, ignore_case, max_matches, max_file_size)
+        if matches:
+            results.append((path, matches))
+    return results
+
+
+class ContentSearch:
+    def __init__(self, max_workers=None, max_file_size=MAX_FILE_SIZE, file_ops=None):
+        """Initialize the search; the worker pool is started on first use"""
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_file_size = max_file_size
+        self.file_ops = file_ops or FileOperations()
+        self._pool = None
+        self._lock = threading.Lock()
+    
+    def _get_pool(self):
+        """Get the worker pool, starting it if needed"""
+        with self._lock:
+            if self._pool is None:
+                try:
+                    # Spawned workers don't inherit the parent's threads, locks or Tk state
+                    context = multiprocessing.get_context('spawn')
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+                except (OSError, NotImplementedError, ImportError):
+                    # No process support here (e.g. serverless); threads still overlap the I/O
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='grep')
+            return self._pool
+    
+    def _use_threads(self):
+        """Replace a process pool whose workers could not run with a thread pool"""
+        with self._lock:
+            if not isinstance(self._pool, ThreadPoolExecutor):
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='grep')
+    
+    def close(self):
+        """Stop the worker pool"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+    
+    def _batches(self, root, max_depth=None, deadline=None):
+        """Group the searchable files below root into batches for the workers"""
+        batch = []
+        batch_bytes = 0
+        for directory, (name, is_dir, size, mtime) in self.file_ops.walk_directory(root, max_depth, deadline):
+            # The walk already knows the size, so oversized files are never opened
+            if is_dir or not size or size > self.max_file_size:
+                continue
+            batch.append(os.path.join(directory, name))
+            batch_bytes += size
+            if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                yield batch
+                batch = []
+                batch_bytes = 0
+        if batch:
+            yield batch
+    
+    def search(self, root, pattern, regex=False, ignore_case=True,
+               max_matches=MAX_MATCHES_PER_FILE, cancel_event=None, max_depth=None, deadline=None):
+        """Yield (path, line_number, line) for every match below root as workers find them
+        
+        Raises ValueError for an invalid regular expression before any
+        work starts. max_depth limits the folder levels searched, as in
+        walk_directory, and the search ends once time.monotonic() passes
+        deadline. Closing the generator or setting cancel_event stops
+        queueing work and drops what is still pending.
+        """
+        if not pattern:
+            return
+        check_pattern(pattern, regex, ignore_case)
+        
+        args = (pattern, regex, ignore_case, max_matches, self.max_file_size)
+        pending = {}
+        try:
+            for batch in self._batches(root, max_depth, deadline):
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                pending[self._get_pool().submit(search_batch, batch, *args)] = batch
+                
+                # Keep a bounded number of batches in flight, yielding results as they finish
+                while len(pending) >= self.max_workers * 2:
+                    timeout = max(deadline - time.monotonic(), 0) if deadline is not None else None
+                    done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                    if not done:
+                        return
+                    yield from self._matches(done, pending, args)
+            
+            while pending:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                yield from self._matches(done, pending, args)
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    def _matches(self, done, pending, args):
+        """Flatten finished batches into (path, line_number, line) tuples"""
+        for future in done:
+            batch = pending.pop(future)
+            try:
+                results = future.result()
+            except BrokenProcessPool:
+                # Worker processes can't start here; search this batch inline and use threads from now on
+                self._use_threads()
+                results = search_batch(batch, *args)
+            for path, matches in results:
+                for line_number, line in matches:
+                    yield path, line_number, line
@@ -0,0 +1,259 @@
+"""
+Copy Engine Module
+Copies files and directory trees concurrently on a bounded worker pool,
+using kernel-side copies (copy_file_range / sendfile) where available
+"""
+
+import errno
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from stat import S_ISREG
+
+# Default number of concurrent file copies; copying is bound by per-file latency
+DEFAULT_WORKERS = 8
+
+# Kernel-side file copies (copy_file_range / file-to-file sendfile) are Linux only
+USE_KERNEL_COPY = sys.platform.startswith('linux')
+
+# Largest single kernel copy request
+KERNEL_CHUNK = 1 << 30
+
+# Errors meaning "this kernel copy method can't handle these files", not a real failure
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP}
+
+# Opening a FIFO that was swapped in for a planned file must not block; regular files ignore O_NONBLOCK
+SOURCE_FLAGS = os.O_RDONLY | getattr(os, 'O_NONBLOCK', 0) | getattr(os, 'O_BINARY', 0)
+
+# FIFOs, sockets and devices would block or never end, like shutil.copytree's SpecialFileError
+SPECIAL_FILE_ERROR = "Not a regular file"
+
+
+def kernel_copy(fsrc, fdst):
+    """Copy the contents of one open file to another inside the kernel
+    
+    Tries copy_file_range, then sendfile, then a userspace loop, and
+    returns the number of bytes copied.
+    """
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    
+    if hasattr(os, 'copy_file_range'):
+        copied = 0
+        try:
+            while True:
+                sent = os.copy_file_range(infd, outfd, KERNEL_CHUNK)
+                if sent == 0:
+                    return copied
+                copied += sent
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS or copied:
+                raise
+    
+    if hasattr(os, 'sendfile'):
+        copied = 0
+        try:
+            while True:
+                sent = os.sendfile(outfd, infd, copied, KERNEL_CHUNK)
+                if sent == 0:
+                    return copied
+                copied += sent
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS or copied:
+                raise
+        os.lseek(infd, 0, os.SEEK_SET)
+    
+    copied = 0
+    while True:
+        chunk = fsrc.read(1 << 20)
+        if not chunk:
+            return copied
+        fdst.write(chunk)
+        copied += len(chunk)
+
+
+class CopyEngine:
+    def __init__(self, max_workers=DEFAULT_WORKERS, progress=None, cancel_event=None, symlinks=False):
+        """Initialize the engine
+        
+        progress, if given, is called as progress(bytes_copied, files_copied)
+        from worker threads. Setting cancel_event stops queueing new files.
+        With symlinks, links are recreated as links instead of copying
+        what they point to.
+        """
+        self.max_workers = max_workers
+        self.progress = progress
+        self.symlinks = symlinks
+        self.cancel_event = cancel_event or threading.Event()
+        self._lock = threading.Lock()
+        self._reset()
+    
+    def _reset(self):
+        """Clear counters before a run"""
+        self.bytes_copied = 0
+        self.files_copied = 0
+        self.errors = []
+        # Destinations of the copied pairs that this run created, rather than found already there
+        self.created = set()
+        self._destinations = set()
+        self.started = None
+        self.finished = None
+    
+    def stats(self):
+        """Get throughput statistics for the last run"""
+        end = self.finished or time.perf_counter()
+        seconds = end - self.started if self.started is not None else 0.0
+        return {
+            'files': self.files_copied,
+            'bytes': self.bytes_copied,
+            'seconds': seconds,
+            'bytes_per_second': self.bytes_copied / seconds if seconds > 0 else 0.0,
+            'files_per_second': self.files_copied / seconds if seconds > 0 else 0.0,
+            'errors': len(self.errors)
+        }
+    
+    def copy(self, pairs):
+        """Copy (source, destination) pairs of files or folders concurrently
+        
+        Folders are copied recursively like shutil.copytree and files like
+        shutil.copy2. Nothing that already exists is written over: files
+        are created with O_EXCL and folders with makedirs(exist_ok=False),
+        and the destinations this run created are left in self.created.
+        Returns stats(); raises shutil.Error listing every file that
+        failed once the whole run has finished.
+        """
+        self._reset()
+        pairs = [(os.fspath(source), os.fspath(destination)) for source, destination in pairs]
+        self._destinations = {destination for source, destination in pairs}
+        self.started = time.perf_counter()
+        slots = threading.BoundedSemaphore(self.max_workers * 4)
+        copied_dirs = []
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='copy') as pool:
+            def submit(src, dst):
+                slots.acquire()
+                try:
+                    pool.submit(self._copy_file, src, dst).add_done_callback(lambda f: slots.release())
+                except RuntimeError:
+                    slots.release()
+                    raise
+            
+            for source, destination in pairs:
+                if self.cancel_event.is_set():
+                    break
+                if self.symlinks and os.path.islink(source):
+                    self._copy_link(source, destination)
+                elif os.path.isdir(source):
+                    real_source = os.path.realpath(source)
+                    if os.path.commonpath([real_source, os.path.realpath(destination)]) == real_source:
+                        self.errors.append((source, destination, "Cannot copy a folder into itself"))
+                        continue
+                    self._walk(source, destination, submit, copied_dirs)
+                elif os.path.isfile(source):
+                    submit(source, destination)
+                else:
+                    self.errors.append((source, destination, SPECIAL_FILE_ERROR))
+        
+        # Directory timestamps are copied last, after their contents are written
+        for src, dst in reversed(copied_dirs):
+            try:
+                shutil.copystat(src, dst)
+            except OSError as e:
+                self.errors.append((src, dst, str(e)))
+        
+        self.finished = time.perf_counter()
+        if self.errors:
+            raise shutil.Error(self.errors)
+        return self.stats()
+    
+    def _walk(self, source, destination, submit, copied_dirs):
+        """Create the destination folders and queue every file below source"""
+        stack = [(source, destination)]
+        while stack:
+            if self.cancel_event.is_set():
+                return
+            
+            src_dir, dst_dir = stack.pop()
+            try:
+                os.makedirs(dst_dir, exist_ok=False)
+                self._created(dst_dir)
+                copied_dirs.append((src_dir, dst_dir))
+                with os.scandir(src_dir) as it:
+                    entries = list(it)
+            except OSError as e:
+                self.errors.append((src_dir, dst_dir, str(e)))
+                continue
+            
+            for entry in entries:
+                dst = os.path.join(dst_dir, entry.name)
+                if self.symlinks and entry.is_symlink():
+                    self._copy_link(entry.path, dst)
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                    is_file = not is_dir and entry.is_file()
+                except OSError:
+                    is_dir = is_file = False
+                if is_dir:
+                    stack.append((entry.path, dst))
+                elif is_file:
+                    submit(entry.path, dst)
+                else:
+                    self.errors.append((entry.path, dst, SPECIAL_FILE_ERROR))
+    
+    def _created(self, dst):
+        """Note that dst was created by this run, if it is one of the copied destinations"""
+        if dst in self._destinations:
+            with self._lock:
+                self.created.add(dst)
+    
+    def _copy_link(self, src, dst):
+        """Recreate a symlink, pointing where the original does"""
+        try:
+            os.symlink(os.readlink(src), dst)
+        except OSError as e:
+            with self._lock:
+                self.errors.append((src, dst, str(e)))
+            return
+        self._created(dst)
+    
+    def _copy_file(self, src, dst):
+        """Copy one file with its metadata (worker thread)"""
+        if self.cancel_event.is_set():
+            return
+        
+        try:
+            fd = os.open(src, SOURCE_FLAGS)
+            try:
+                # The file may have been replaced since it was listed
+                if not S_ISREG(os.fstat(fd).st_mode):
+                    raise OSError(errno.EINVAL, SPECIAL_FILE_ERROR, src)
+                fsrc = os.fdopen(fd, 'rb')
+            except BaseException:
+                os.close(fd)
+                raise
+            with fsrc:
+                # Exclusive create: a file that appeared at dst since it was planned is never replaced
+                with open(dst, 'xb') as fdst:
+                    self._created(dst)
+                    if USE_KERNEL_COPY:
+                        size = kernel_copy(fsrc, fdst)
+            if not USE_KERNEL_COPY:
+                # shutil.copyfile already uses the platform's fast path here; dst is the file created above
+                shutil.copyfile(src, dst)
+                size = os.path.getsize(dst)
+            shutil.copystat(src, dst)
+        except OSError as e:
+            with self._lock:
+                self.errors.append((src, dst, str(e)))
+            return
+        
+        with self._lock:
+            self.bytes_copied += size
+            self.files_copied += 1
+            bytes_copied, files_copied = self.bytes_copied, self.files_copied
+        
+        if self.progress is not None:
+            self.progress(bytes_copied, files_copied)
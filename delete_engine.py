@@ -0,0 +1,617 @@
+"""
+Delete Engine Module
+Deletes items by first renaming them into a hidden staging folder on the same
+filesystem, so they disappear at once, then reclaiming the space in the
+background with a parallel scandir/unlink walk. Until an item is reclaimed its
+deletion can be undone by renaming it back, by this process or, through the
+registry of staged deletions, by any other.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from stat import S_ISDIR
+from move_planner import plan_destinations, rename_noreplace
+from utils import Utils
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: registry updates are only serialised between threads
+    fcntl = None
+
+# Number of directories emptied concurrently
+DEFAULT_WORKERS = 8
+
+# Seconds a deletion can be undone before its space starts being reclaimed
+RECLAIM_DELAY = 10.0
+
+# Staging folders created beside the deleted items, as a last resort
+STAGING_NAME = '.filepilot-trash'
+
+# Windows can't check whether another process is alive, so its leftovers are reclaimed by age
+LEFTOVER_AGE = 24 * 3600
+
+# Suffix of a staged item claimed for reclaiming, so a restore elsewhere can no longer take it
+RECLAIMING_SUFFIX = '.reclaiming'
+
+# Open, unlink and rmdir by name relative to an open directory, so no path is resolved twice
+USE_DIR_FD = ({os.open, os.unlink, os.rmdir} <= os.supports_dir_fd and os.scandir in os.supports_fd
+              and hasattr(os, 'O_NOFOLLOW'))
+DIR_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_NOFOLLOW', 0)
+
+# Item states
+STAGED = 'staged'
+DIRECT = 'direct'
+RECLAIMED = 'reclaimed'
+RESTORED = 'restored'
+FAILED = 'failed'
+
+
+def process_alive(pid):
+    """Whether a process with this id is running (POSIX only)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # It exists but belongs to someone else
+        return True
+    return True
+
+
+class StagedItem:
+    __slots__ = ('original', 'staged', 'state', 'error')
+    
+    def __init__(self, original, staged, state):
+        """Initialize an item; staged is None when it could not be staged and is deleted in place"""
+        self.original = original
+        self.staged = staged
+        self.state = state
+        self.error = None
+
+
+class StagedDelete:
+    def __init__(self):
+        """Initialize an empty deletion"""
+        self.id = uuid.uuid4().hex
+        self.items = []
+        self.errors = []
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+        # Held while space is being reclaimed, so a restore waits for the walk to stop
+        self._reclaiming = threading.Lock()
+    
+    def add(self, item):
+        """Add an item (thread-safe)"""
+        with self._lock:
+            self.items.append(item)
+    
+    def counts(self):
+        """Get the number of items in each state"""
+        counts = {}
+        with self._lock:
+            for item in self.items:
+                counts[item.state] = counts.get(item.state, 0) + 1
+        return counts
+
+
+class DeleteEngine:
+    def __init__(self, max_workers=DEFAULT_WORKERS, registry_path=None):
+        """Initialize the engine
+
+        The registry lists staging folders, so leftovers can be
+        reclaimed, and the items of each deletion still in its undo
+        window, so any process can undo it.
+        """
+        self.max_workers = max_workers
+        self.registry_path = registry_path
+        if registry_path is None:
+            try:
+                self.registry_path = Utils().get_cache_dir() / 'trash_dirs.json'
+            except OSError:
+                self.registry_path = None
+        self._lock = threading.Lock()
+        # Staging folder chosen per device (None: stage beside each item)
+        self._staging = {}
+    
+    def stage(self, paths, batch=None):
+        """Rename paths into staging folders and return the StagedDelete holding them
+        
+        Items that can't be staged on their own filesystem are deleted in
+        place when the batch is reclaimed, and can't be restored. Items
+        that can't be found are recorded in batch.errors.
+        """
+        batch = batch or StagedDelete()
+        for path in paths:
+            try:
+                self.stage_item(path, batch)
+            except OSError as e:
+                with batch._lock:
+                    batch.errors.append((os.path.abspath(path), str(e)))
+        return batch
+    
+    def stage_item(self, path, batch):
+        """Stage one item into batch and return its StagedItem; raises OSError if it can't be found"""
+        path = os.path.abspath(path)
+        stat = os.lstat(path)
+        
+        staged = None
+        staging_dir = self._staging_dir(path, stat.st_dev)
+        if staging_dir is not None:
+            staged = os.path.join(staging_dir, f"{int(time.time())}.{os.getpid()}.{uuid.uuid4().hex}")
+            try:
+                rename_noreplace(path, staged)
+            except OSError:
+                # e.g. a mount point, or a folder holding the staging folder
+                staged = None
+        item = StagedItem(path, staged, STAGED if staged is not None else DIRECT)
+        batch.add(item)
+        return item
+    
+    def _staging_dir(self, path, dev):
+        """Get a staging folder on the filesystem of path, creating it if needed, or None
+        
+        The cache directory is used when it shares the filesystem, then a
+        per-user folder at the filesystem's mount point, and as a last
+        resort a folder beside the item, removed again once it is empty.
+        """
+        with self._lock:
+            shared = self._staging.get(dev, False)
+        if shared:
+            return shared
+        
+        if shared is False:
+            candidates = []
+            try:
+                candidates.append(str(Utils().get_cache_dir('trash')))
+            except OSError:
+                pass
+            if hasattr(os, 'getuid'):
+                mount = os.path.dirname(path)
+                while not os.path.ismount(mount):
+                    mount = os.path.dirname(mount)
+                candidates.append(os.path.join(mount, f"{STAGING_NAME}-{os.getuid()}"))
+            shared = next((candidate for candidate in candidates if self._usable(candidate, dev)), None)
+            with self._lock:
+                self._staging[dev] = shared
+            if shared is not None:
+                self._register(shared)
+                return shared
+        
+        beside = os.path.join(os.path.dirname(path), STAGING_NAME)
+        if path != beside and self._usable(beside, dev):
+            self._register(beside)
+            return beside
+        return None
+    
+    @staticmethod
+    def _usable(staging_dir, dev):
+        """Whether staging_dir exists or can be created on device dev"""
+        try:
+            os.makedirs(staging_dir, exist_ok=True)
+            return os.stat(staging_dir).st_dev == dev
+        except OSError:
+            return False
+    
+    def _register(self, staging_dir):
+        """Remember a staging folder in the registry"""
+        def add(registry):
+            if staging_dir not in registry['dirs']:
+                registry['dirs'].append(staging_dir)
+        self._update_registry(add)
+    
+    @contextmanager
+    def _registry_lock(self):
+        """Hold the registry against other threads and, where supported, other processes"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.registry_path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+    
+    def _load_registry(self):
+        """Get the registry: {'dirs': [staging folders], 'deletions': {id: record}}"""
+        try:
+            with open(self.registry_path) as f:
+                registry = json.load(f)
+        except (OSError, ValueError):
+            registry = {}
+        if isinstance(registry, list):
+            # Written before deletions were recorded
+            registry = {'dirs': registry}
+        registry.setdefault('dirs', [])
+        registry.setdefault('deletions', {})
+        return registry
+    
+    def _update_registry(self, change):
+        """Apply change(registry) to the registry and save it; returns what change returned"""
+        if self.registry_path is None:
+            return None
+        try:
+            with self._registry_lock():
+                registry = self._load_registry()
+                result = change(registry)
+                tmp_path = f"{self.registry_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(registry, f)
+                os.replace(tmp_path, self.registry_path)
+                return result
+        except OSError:
+            return None
+    
+    def record(self, batch):
+        """Record a batch's staged items in the registry, so any process can restore them"""
+        items = [[item.original, item.staged] for item in batch.items if item.state == STAGED]
+        if not items:
+            return
+        
+        def add(registry):
+            registry['deletions'][batch.id] = {'created': time.time(), 'pid': os.getpid(), 'items': items}
+        self._update_registry(add)
+    
+    def _forget(self, batch_id):
+        """Drop a batch from the registry once it is reclaimed or restored"""
+        self._update_registry(lambda registry: registry['deletions'].pop(batch_id, None))
+    
+    def restore_recorded(self, batch_id):
+        """Put back what is left of a deletion recorded in the registry, whichever process staged it
+        
+        Items already claimed for reclaiming stay deleted. Returns the
+        number of items restored, or None if the deletion is not recorded.
+        """
+        record = self._update_registry(lambda registry: registry['deletions'].pop(batch_id, None))
+        if record is None:
+            return None
+        batch = StagedDelete()
+        restored = 0
+        for original, staged in record['items']:
+            item = StagedItem(original, staged, STAGED)
+            batch.add(item)
+            if self._put_back(item):
+                item.state = RESTORED
+                restored += 1
+        self._tidy(batch)
+        return restored
+    
+    def reclaim(self, batch, progress=None, delay=0):
+        """Delete a batch's items for good, once delay seconds pass without a restore
+        
+        progress(bytes_done, files_done) is called as files are removed.
+        Returns False if the batch was restored first. Items that could
+        not be removed completely are put back where they were and keep
+        the error in item.error.
+        """
+        if delay and batch.stop_event.wait(delay):
+            return False
+        
+        totals = {'files': 0, 'bytes': 0}
+        
+        def on_removed(files, size):
+            totals['files'] += files
+            totals['bytes'] += size
+            if progress is not None:
+                progress(totals['bytes'], totals['files'])
+        
+        try:
+            with batch._reclaiming:
+                return self._reclaim_items(batch, on_removed)
+        finally:
+            if not batch.stop_event.is_set():
+                self._forget(batch.id)
+    
+    def _reclaim_items(self, batch, on_removed):
+        """Remove each staged or direct item of a batch (holding batch._reclaiming)"""
+        for item in list(batch.items):
+            if batch.stop_event.is_set():
+                return False
+            if item.state == STAGED:
+                # Claim the item first; a restore from another process can only win before this rename
+                claimed = item.staged + RECLAIMING_SUFFIX
+                try:
+                    os.rename(item.staged, claimed)
+                except FileNotFoundError:
+                    item.state = RESTORED
+                    continue
+                except OSError as e:
+                    item.error = str(e)
+                    item.state = FAILED
+                    continue
+                item.staged = claimed
+            elif item.state != DIRECT:
+                continue
+            target = item.staged or item.original
+            errors = self.remove_tree(target, on_removed, batch.stop_event)
+            if errors:
+                item.error = errors[0]
+                # Show what is left where the user left it
+                if item.state == STAGED:
+                    self._put_back(item)
+                item.state = FAILED
+            elif not os.path.lexists(target):
+                item.state = RECLAIMED
+        self._tidy(batch)
+        return not batch.stop_event.is_set()
+    
+    def restore(self, batch):
+        """Stop reclaiming a batch and put every staged item that is left back
+        
+        An item interrupted part way is put back with what remains of it.
+        Returns the number of items restored.
+        """
+        batch.stop_event.set()
+        restored = 0
+        with batch._reclaiming:
+            for item in batch.items:
+                if item.state != STAGED:
+                    continue
+                # Gone from staging without being claimed: another process restored it from the registry
+                if self._put_back(item) or not os.path.lexists(item.staged):
+                    item.state = RESTORED
+                    restored += 1
+            self._tidy(batch)
+        self._forget(batch.id)
+        return restored
+    
+    def _put_back(self, item):
+        """Rename a staged item back to its path, or a free "name (n)" beside it if that is taken"""
+        if not os.path.lexists(item.staged):
+            return False
+        destination = item.original
+        for attempt in range(3):
+            try:
+                rename_noreplace(item.staged, destination)
+                item.original = destination
+                return True
+            except FileExistsError:
+                destination = plan_destinations([(item.staged, item.original)])[0][1]
+            except OSError as e:
+                item.error = str(e)
+                return False
+        return False
+    
+    def _tidy(self, batch):
+        """Remove staging folders created beside items once they are empty"""
+        for item in batch.items:
+            if item.staged is not None:
+                staging_dir = os.path.dirname(item.staged)
+                if os.path.basename(staging_dir) == STAGING_NAME:
+                    try:
+                        os.rmdir(staging_dir)
+                    except OSError:
+                        pass
+    
+    def remove_tree(self, root, progress=None, stop_event=None):
+        """Remove a file or folder tree, emptying folders in parallel
+        
+        Each folder is listed and its files unlinked on a worker; folders
+        are removed bottom-up as their last subfolder goes. Like
+        shutil.rmtree, every folder is opened relative to its parent's
+        descriptor without following symlinks and checked against the
+        (device, inode) its parent listed, so a folder swapped for a link
+        mid-way never leads the walk out of the tree. Pending folders are
+        taken deepest first, which keeps the number of open folders small.
+        Stops between folders once stop_event is set. Returns a list of
+        error messages.
+        """
+        try:
+            stat = os.lstat(root)
+            if not S_ISDIR(stat.st_mode):
+                os.unlink(root)
+                if progress is not None:
+                    progress(1, stat.st_size)
+                return []
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            return [str(e)]
+        
+        errors = []
+        # Open descriptors of folders listed but not yet removed (None without dir_fd support)
+        fds = {}
+        remaining = {}
+        parents = {}
+        stack = [(root, None, (stat.st_dev, stat.st_ino))]
+        pending = {}
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='delete')
+        try:
+            while stack or pending:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                
+                while stack and len(pending) < self.max_workers * 2:
+                    path, parent, expected = stack.pop()
+                    pending[pool.submit(self._clear_directory, path, fds.get(parent), expected)] = path
+                
+                done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    fd, files, size, subdirs, failed = future.result()
+                    errors.extend(failed)
+                    if progress is not None and files:
+                        progress(files, size)
+                    
+                    if fd is not False:
+                        fds[path] = fd
+                        remaining[path] = len(subdirs)
+                        for name, expected in subdirs:
+                            child = os.path.join(path, name)
+                            parents[child] = path
+                            stack.append((child, path, expected))
+                    else:
+                        # Gone, or not safe to enter; its parent's rmdir reports what is left
+                        remaining[path] = None
+                    
+                    # Remove folders bottom-up as they empty
+                    while path is not None and remaining.get(path, 0) in (0, None):
+                        opened = remaining.pop(path) == 0
+                        parent = parents.pop(path, None)
+                        if opened:
+                            self._close(fds.pop(path, None))
+                            try:
+                                self._rmdir(path, fds.get(parent) if parent is not None else None)
+                            except FileNotFoundError:
+                                pass
+                            except OSError as e:
+                                errors.append(str(e))
+                        path = parent
+                        if path is not None:
+                            remaining[path] -= 1
+        finally:
+            # Wait for running workers, so nothing is unlinked after this returns
+            pool.shutdown(wait=True, cancel_futures=True)
+            for future in pending:
+                if future.done() and not future.cancelled():
+                    self._close(future.result()[0])
+            for fd in fds.values():
+                self._close(fd)
+        return errors
+    
+    @staticmethod
+    def _close(fd):
+        """Close a folder descriptor from _clear_directory, if it is one"""
+        if fd is not None and fd is not False:
+            os.close(fd)
+    
+    @staticmethod
+    def _rmdir(path, parent_fd):
+        """Remove an empty folder, by name inside its parent's descriptor when there is one"""
+        if parent_fd is None:
+            os.rmdir(path)
+        else:
+            os.rmdir(os.path.basename(path), dir_fd=parent_fd)
+    
+    def _clear_directory(self, path, parent_fd, expected):
+        """Unlink everything but subfolders in one directory (worker thread)
+        
+        The folder is opened by name inside parent_fd (by path for the
+        root) without following symlinks, and must still be the (device,
+        inode) in expected. Returns (fd, files, size, [(subfolder name,
+        (device, inode))], error messages); fd is the open folder, None
+        without dir_fd support, or False if it could not be entered.
+        """
+        files = size = 0
+        subdirs = []
+        errors = []
+        fd = None
+        try:
+            if USE_DIR_FD:
+                fd = os.open(path if parent_fd is None else os.path.basename(path), DIR_FLAGS, dir_fd=parent_fd)
+                stat = os.fstat(fd)
+            else:
+                stat = os.lstat(path)
+            if (stat.st_dev, stat.st_ino) != expected or not S_ISDIR(stat.st_mode):
+                self._close(fd)
+                return False, files, size, subdirs, [f"Cannot delete {path}: it was replaced while being deleted"]
+        except FileNotFoundError:
+            self._close(fd)
+            return False, files, size, subdirs, errors
+        except OSError as e:
+            self._close(fd)
+            return False, files, size, subdirs, [f"{path}: {e.strerror}"]
+        
+        try:
+            with os.scandir(fd if fd is not None else path) as it:
+                for entry in it:
+                    try:
+                        entry_stat = entry.stat(follow_symlinks=False)
+                        if S_ISDIR(entry_stat.st_mode):
+                            subdirs.append((entry.name, (entry_stat.st_dev, entry_stat.st_ino)))
+                            continue
+                        os.unlink(entry.name if fd is not None else entry.path, dir_fd=fd)
+                    except FileNotFoundError:
+                        continue
+                    except OSError as e:
+                        errors.append(f"{os.path.join(path, entry.name)}: {e.strerror}")
+                        continue
+                    files += 1
+                    size += entry_stat.st_size
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            errors.append(str(e))
+        return fd, files, size, subdirs, errors
+    
+    def reclaim_leftovers(self):
+        """Delete items left in registered staging folders by processes that have exited
+        
+        Items of recorded deletions still in their undo window are left
+        for restore_recorded until the window closes.
+        """
+        if self.registry_path is None:
+            return
+        while True:
+            wait = self._reclaim_leftovers_once()
+            if wait is None:
+                return
+            time.sleep(wait)
+    
+    def _prune_registry(self, registry):
+        """Forget staging folders that were removed once empty, and deletions with nothing left"""
+        registry['dirs'] = [staging_dir for staging_dir in registry['dirs'] if os.path.isdir(staging_dir)]
+        for batch_id, record in list(registry['deletions'].items()):
+            if not any(os.path.lexists(staged) or os.path.lexists(staged + RECLAIMING_SUFFIX)
+                       for original, staged in record['items']):
+                del registry['deletions'][batch_id]
+        return registry
+    
+    def _reclaim_leftovers_once(self):
+        """Reclaim the leftovers that are due; returns the seconds until the rest are, or None"""
+        registry = self._update_registry(self._prune_registry)
+        if registry is None:
+            return None
+        
+        undo_until = {}
+        for record in registry['deletions'].values():
+            for original, staged in record['items']:
+                undo_until[staged] = record['created'] + RECLAIM_DELAY
+        wait = None
+        for staging_dir in registry['dirs']:
+            try:
+                names = os.listdir(staging_dir)
+            except OSError:
+                continue
+            for name in names:
+                try:
+                    created, pid = (int(part) for part in name.split('.')[:2])
+                except ValueError:
+                    continue
+                if pid == os.getpid():
+                    continue
+                if os.name == 'posix' and process_alive(pid):
+                    continue
+                if os.name != 'posix' and time.time() - created < LEFTOVER_AGE:
+                    continue
+                left = undo_until.get(os.path.join(staging_dir, name), 0) - time.time()
+                if left > 0:
+                    wait = left if wait is None else min(wait, left)
+                    continue
+                self.remove_tree(os.path.join(staging_dir, name))
+            if os.path.basename(staging_dir) == STAGING_NAME:
+                try:
+                    os.rmdir(staging_dir)
+                except OSError:
+                    pass
+        self._update_registry(self._prune_registry)
+        return wait
+
+
+_shared_engine = None
+_shared_lock = threading.Lock()
+
+
+def get_delete_engine():
+    """Get the process-wide delete engine, reclaiming earlier leftovers in the background once"""
+    global _shared_engine
+    with _shared_lock:
+        if _shared_engine is None:
+            _shared_engine = DeleteEngine()
+            threading.Thread(target=_shared_engine.reclaim_leftovers, name='reclaim-leftovers',
+                             daemon=True).start()
+        return _shared_engine
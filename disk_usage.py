@@ -0,0 +1,392 @@
+"""
+Disk Usage Module
+Builds an in-memory tree of sizes and file counts per directory by walking a
+subtree once across a thread pool. Totals are added to every ancestor as each
+directory is read, so the tree can be browsed while the scan runs, and the
+per-directory results are saved so a rescan only reads directories whose
+mtime changed. Records are also saved while a scan runs, so another process
+sharing the cache directory can rebuild and browse the same tree.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from stat import S_ISDIR, S_ISREG
+from file_index import subtree_bounds
+from utils import Utils
+
+# Number of directories read concurrently
+DEFAULT_WORKERS = 8
+
+# Children listed per node in a snapshot
+SNAPSHOT_CHILDREN = 200
+
+# Seconds between saves of the directories read so far while a scan runs
+SAVE_INTERVAL = 1.0
+
+# A scan not saved for this long was left unfinished by a process that stopped
+STALE_SCAN_AGE = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_dirs (
+    path TEXT PRIMARY KEY,
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    files INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    links TEXT NOT NULL,
+    subdirs TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS usage_scans (
+    root TEXT PRIMARY KEY,
+    scanning INTEGER NOT NULL,
+    complete INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+class UsageStore:
+    def __init__(self, db_path=None):
+        """Initialize the store, creating the database under the cache dir if needed"""
+        self.db_path = str(db_path or Utils().get_cache_dir() / 'disk_usage.sqlite3')
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        """Open a connection to the store database"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def load(self, root):
+        """Get the saved directory records of root and everything below it, keyed by path"""
+        prefix, upper = subtree_bounds(root)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                'SELECT path, dev, ino, mtime_ns, files, size, links, subdirs FROM usage_dirs '
+                'WHERE path = ? OR (path >= ? AND path < ?)', (root, prefix, upper)).fetchall()
+        finally:
+            conn.close()
+        return {path: ((dev, ino, mtime_ns), files, size, [tuple(link) for link in json.loads(links)],
+                       json.loads(subdirs))
+                for path, dev, ino, mtime_ns, files, size, links, subdirs in rows}
+    
+    def scan_state(self, root):
+        """Get (scanning, complete, updated) for the last scan of root, or None"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT scanning, complete, updated FROM usage_scans WHERE root = ?',
+                               (root,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return bool(row[0]), bool(row[1]), row[2]
+    
+    def save(self, root, records, complete, scanning=False):
+        """Save directory records keyed by path and the state of root's scan
+
+        A complete scan replaces everything below root.
+        """
+        conn = self._connect()
+        try:
+            conn.execute('INSERT OR REPLACE INTO usage_scans (root, scanning, complete, updated) '
+                         'VALUES (?, ?, ?, ?)', (root, int(scanning), int(complete), time.time()))
+            if complete:
+                prefix, upper = subtree_bounds(root)
+                conn.execute('DELETE FROM usage_dirs WHERE path = ? OR (path >= ? AND path < ?)',
+                             (root, prefix, upper))
+            conn.executemany(
+                'INSERT OR REPLACE INTO usage_dirs (path, dev, ino, mtime_ns, files, size, links, subdirs) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(path, key[0], key[1], key[2], files, size, json.dumps(links), json.dumps(subdirs))
+                 for path, (key, files, size, links, subdirs) in records.items()])
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class UsageNode:
+    __slots__ = ('name', 'parent', 'children', 'files', 'size', 'dirs', 'scanned')
+    
+    def __init__(self, name, parent=None):
+        """Initialize an empty directory node; totals include everything below it"""
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.files = 0
+        self.size = 0
+        self.dirs = 0
+        self.scanned = False
+    
+    @property
+    def path(self):
+        """Full path of the directory"""
+        parts = []
+        node = self
+        while node is not None:
+            parts.append(node.name)
+            node = node.parent
+        return os.path.join(*reversed(parts))
+
+
+class UsageTree:
+    def __init__(self, root, store=None, max_workers=DEFAULT_WORKERS):
+        """Initialize the tree of root; store, if given, persists scans between runs"""
+        self.root_path = os.path.abspath(root)
+        self.store = store
+        self.max_workers = max_workers
+        self.root = UsageNode(self.root_path)
+        self.scanning = False
+        self.complete = False
+        self.reused = 0
+        self.read = 0
+        # When the saved scan this tree was rebuilt from was last written (see from_store)
+        self.updated = None
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_store(cls, root, store, state=None):
+        """Rebuild the tree of root from its saved scan, or None if it was never scanned
+
+        The scan may be running in another process; the tree then holds
+        the folders it has saved so far. state is store.scan_state(root),
+        if the caller has already read it.
+        """
+        root = os.path.abspath(root)
+        state = state or store.scan_state(root)
+        if state is None:
+            return None
+        scanning, complete, updated = state
+        records = store.load(root)
+        
+        tree = cls(root, store)
+        tree.scanning = scanning and time.time() - updated < STALE_SCAN_AGE
+        tree.complete = complete and not scanning
+        tree.updated = updated
+        root_record = records.get(root)
+        if root_record is None:
+            return tree
+        root_dev = root_record[0][0]
+        seen_links = set()
+        stack = [(tree.root, root)]
+        while stack:
+            node, node_path = stack.pop()
+            key, files, size, links, subdirs = records[node_path]
+            for dev, ino, link_size in links:
+                if (dev, ino) not in seen_links:
+                    seen_links.add((dev, ino))
+                    size += link_size
+            node.scanned = True
+            for name in subdirs:
+                child_path = os.path.join(node_path, name)
+                child_record = records.get(child_path)
+                # As in scan, only folders on root's filesystem belong to the tree
+                if child_record is not None and child_record[0][0] == root_dev:
+                    child = node.children[name] = UsageNode(name, node)
+                    stack.append((child, child_path))
+            
+            ancestor = node
+            while ancestor is not None:
+                ancestor.files += files
+                ancestor.size += size
+                ancestor.dirs += len(node.children)
+                ancestor = ancestor.parent
+        return tree
+    
+    def scan(self, cancel_event=None, progress=None):
+        """Walk the subtree, staying on root's filesystem, and fill in the tree
+        
+        Directories whose (dev, inode, mtime) match the saved record are
+        not read again; as with the size engine, a file growing in place
+        is only noticed once its folder changes. progress(files, size) is
+        called as directories finish; setting cancel_event stops the walk
+        with partial totals. Returns False if cancelled.
+        """
+        try:
+            root_stat = os.lstat(self.root_path)
+        except OSError as e:
+            raise Exception(f"Cannot access directory: {e}")
+        if not S_ISDIR(root_stat.st_mode):
+            raise Exception(f"Not a directory: {self.root_path}")
+        
+        known = {}
+        if self.store is not None:
+            try:
+                known = self.store.load(self.root_path)
+            except sqlite3.Error:
+                known = {}
+        
+        with self._lock:
+            self.root = UsageNode(self.root_path)
+            self.scanning = True
+            self.complete = False
+            self.reused = self.read = 0
+        
+        records = {}
+        unsaved = {}
+        last_save = time.monotonic()
+        seen_links = set()
+        root_dev = root_stat.st_dev
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='usage')
+        pending = {pool.submit(self._read_directory, self.root_path, root_stat, known.get(self.root_path), root_dev):
+                   self.root}
+        cancelled = False
+        try:
+            while pending:
+                if cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                    break
+                
+                done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = pending.pop(future)
+                    node_path = node.path
+                    record, children, reused = future.result()
+                    records[node_path] = unsaved[node_path] = record
+                    key, files, size, links, subdirs = record
+                    # Files with several hard links count once, in the first folder they are seen in
+                    for dev, ino, link_size in links:
+                        if (dev, ino) not in seen_links:
+                            seen_links.add((dev, ino))
+                            size += link_size
+                    
+                    with self._lock:
+                        if reused:
+                            self.reused += 1
+                        else:
+                            self.read += 1
+                        node.scanned = True
+                        for name, child_stat in children:
+                            child = node.children[name] = UsageNode(name, node)
+                            child_path = os.path.join(node_path, name)
+                            pending[pool.submit(self._read_directory, child_path, child_stat,
+                                                known.get(child_path), root_dev)] = child
+                        
+                        # Add this folder's own files to it and every ancestor
+                        ancestor = node
+                        while ancestor is not None:
+                            ancestor.files += files
+                            ancestor.size += size
+                            ancestor.dirs += len(children)
+                            ancestor = ancestor.parent
+                
+                if progress is not None and done:
+                    progress(self.root.files, self.root.size)
+                
+                # Save as the scan goes, so other processes can browse it too
+                if self.store is not None and time.monotonic() - last_save >= SAVE_INTERVAL:
+                    try:
+                        self.store.save(self.root_path, unsaved, False, scanning=True)
+                        unsaved = {}
+                    except sqlite3.Error:
+                        pass
+                    last_save = time.monotonic()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            with self._lock:
+                self.scanning = False
+                self.complete = not cancelled
+            if self.store is not None:
+                try:
+                    self.store.save(self.root_path, records, not cancelled)
+                except sqlite3.Error:
+                    pass
+        return not cancelled
+    
+    def _read_directory(self, path, stat, known, root_dev):
+        """Get the record of one directory and the (name, stat) of its subfolders (worker thread)
+        
+        The record is (key, files, size, links, subdirs) with the totals of
+        the entries directly inside the directory.
+        """
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        reused = known is not None and known[0] == key
+        if reused:
+            record = known
+        else:
+            files = size = 0
+            links = []
+            subdirs = []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            entry_stat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        mode = entry_stat.st_mode
+                        if S_ISDIR(mode):
+                            subdirs.append(entry.name)
+                        elif S_ISREG(mode):
+                            files += 1
+                            if entry_stat.st_nlink > 1:
+                                links.append((entry_stat.st_dev, entry_stat.st_ino, entry_stat.st_size))
+                            else:
+                                size += entry_stat.st_size
+            except OSError:
+                # Unreadable folders count as empty
+                pass
+            record = (key, files, size, links, subdirs)
+        
+        children = []
+        for name in record[4]:
+            try:
+                child_stat = os.lstat(os.path.join(path, name))
+            except OSError:
+                continue
+            # Stay on one filesystem, and skip anything that stopped being a folder
+            if S_ISDIR(child_stat.st_mode) and child_stat.st_dev == root_dev:
+                children.append((name, child_stat))
+        return record, children, reused
+    
+    def find(self, path):
+        """Get the node for path, or None if it is outside the tree or not reached yet"""
+        relative = os.path.relpath(os.path.abspath(path), self.root_path)
+        if relative.startswith(os.pardir):
+            return None
+        node = self.root
+        if relative != os.curdir:
+            for name in relative.split(os.sep):
+                node = node.children.get(name)
+                if node is None:
+                    return None
+        return node
+    
+    def snapshot(self, path=None, limit=SNAPSHOT_CHILDREN):
+        """Get a JSON-friendly view of one node and its largest children, or None"""
+        with self._lock:
+            node = self.root if path is None else self.find(path)
+            if node is None:
+                return None
+            children = sorted(node.children.values(), key=lambda child: child.size, reverse=True)
+            return {
+                'path': node.path,
+                'parent': node.parent.path if node.parent is not None else None,
+                'size': node.size,
+                'files': node.files,
+                'dirs': node.dirs,
+                'scanned': node.scanned,
+                'scanning': self.scanning,
+                'complete': self.complete,
+                'children': [{
+                    'name': child.name,
+                    'path': child.path,
+                    'size': child.size,
+                    'files': child.files,
+                    'dirs': child.dirs,
+                    'share': round(child.size * 100 / node.size, 1) if node.size else 0.0
+                } for child in children[:limit]],
+                'more_children': max(len(children) - limit, 0)
+            }
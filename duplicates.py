@@ -0,0 +1,235 @@
+"""
+Duplicate Finder Module
+Finds identical files in stages: files are grouped by size, then by a hash of
+their first and last 64 KB, and only the remaining candidates are hashed in
+full. Hashes are BLAKE2b, computed on a thread pool and cached in SQLite by
+(device, inode, size, mtime) so repeat scans only hash changed files.
+"""
+
+import os
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from hashlib import blake2b
+from file_operations import FileOperations
+from utils import Utils
+
+# Bytes hashed from each end of a file by the partial hash
+PARTIAL_SIZE = 64 * 1024
+
+# Read size for full hashes
+CHUNK_SIZE = 1024 * 1024
+
+# BLAKE2b digest length in bytes
+DIGEST_SIZE = 32
+
+# Hash kinds stored in the cache
+PARTIAL = 'partial'
+FULL = 'full'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest BLOB NOT NULL,
+    PRIMARY KEY (dev, ino, kind)
+);
+"""
+
+
+def partial_hash(path, size):
+    """Hash the first and last PARTIAL_SIZE bytes of a file (all of it if small), or None"""
+    digest = blake2b(digest_size=DIGEST_SIZE)
+    try:
+        with open(path, 'rb') as f:
+            if size <= 2 * PARTIAL_SIZE:
+                digest.update(f.read())
+            else:
+                digest.update(f.read(PARTIAL_SIZE))
+                f.seek(-PARTIAL_SIZE, os.SEEK_END)
+                digest.update(f.read(PARTIAL_SIZE))
+    except OSError:
+        return None
+    return digest.digest()
+
+
+def full_hash(path, size):
+    """Hash a whole file in CHUNK_SIZE reads into one reused buffer, or None"""
+    digest = blake2b(digest_size=DIGEST_SIZE)
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    try:
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                digest.update(view[:read])
+    except OSError:
+        return None
+    return digest.digest()
+
+
+class HashCache:
+    def __init__(self, db_path=None):
+        """Initialize the cache, creating the database under the cache dir if needed"""
+        self.db_path = str(db_path or Utils().get_cache_dir() / 'hashes.sqlite3')
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        """Open a connection to the cache database"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def get_many(self, kind, keys):
+        """Get cached digests for (dev, ino, size, mtime_ns) keys still matching the file"""
+        found = {}
+        conn = self._connect()
+        try:
+            for key in keys:
+                row = conn.execute(
+                    'SELECT digest FROM hashes WHERE dev = ? AND ino = ? AND kind = ? AND size = ? AND mtime_ns = ?',
+                    (key[0], key[1], kind, key[2], key[3])).fetchone()
+                if row is not None:
+                    found[key] = row[0]
+        finally:
+            conn.close()
+        return found
+    
+    def put_many(self, kind, digests):
+        """Store digests keyed by (dev, ino, size, mtime_ns)"""
+        if not digests:
+            return
+        conn = self._connect()
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO hashes (dev, ino, kind, size, mtime_ns, digest) VALUES (?, ?, ?, ?, ?, ?)',
+                [(key[0], key[1], kind, key[2], key[3], digest) for key, digest in digests.items()])
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class DuplicateFinder:
+    def __init__(self, file_ops=None, cache=None, max_workers=None):
+        """Initialize the finder; without a cache every scan hashes from scratch"""
+        self.file_ops = file_ops or FileOperations()
+        self.cache = cache
+        # Hashing releases the GIL while reading and digesting, so threads run it in parallel
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 2)
+    
+    def find(self, roots, min_size=1, progress=None, on_totals=None, cancel_event=None):
+        """Find groups of identical files below roots
+        
+        Returns a list of {'size', 'digest', 'paths', 'wasted'} dicts, the
+        groups wasting the most space first. Hard links to one file are
+        reported once. progress(bytes_done, files_done) and
+        on_totals(files_total, bytes_total) report each hashing stage; the
+        scan stops early, returning None, once cancel_event is set.
+        """
+        # Stage 1: group by size; only files sharing a size can be identical
+        by_size = defaultdict(list)
+        for root in roots:
+            for seen, (directory, (name, is_dir, size, mtime)) in enumerate(self.file_ops.walk_directory(root)):
+                if seen % 1000 == 0 and cancel_event is not None and cancel_event.is_set():
+                    return None
+                if not is_dir and size is not None and size >= min_size:
+                    by_size[size].append(os.path.join(directory, name))
+        
+        candidates = []
+        for size, paths in by_size.items():
+            if len(paths) > 1:
+                candidates.append(self._identify(paths))
+        candidates = [files for files in candidates if len(files) > 1]
+        
+        # Stage 2: group by a hash of both ends of each file
+        groups = self._regroup(candidates, PARTIAL, partial_hash, progress, on_totals, cancel_event)
+        if groups is None:
+            return None
+        
+        # Stage 3: hash the rest of files too large for the partial hash to cover
+        small = [files for files in groups if files[0][1][2] <= 2 * PARTIAL_SIZE]
+        large = [[(path, key) for path, key, digest in files] for files in groups
+                 if files[0][1][2] > 2 * PARTIAL_SIZE]
+        confirmed = self._regroup(large, FULL, full_hash, progress, on_totals, cancel_event)
+        if confirmed is None:
+            return None
+        
+        results = []
+        for files in small + confirmed:
+            size = files[0][1][2]
+            results.append({
+                'size': size,
+                'digest': files[0][2].hex(),
+                'paths': sorted(path for path, key, digest in files),
+                'wasted': size * (len(files) - 1)
+            })
+        results.sort(key=lambda group: (-group['wasted'], group['paths'][0]))
+        return results
+    
+    def _identify(self, paths):
+        """Stat paths of one size into (path, key) pairs, keeping one path per inode"""
+        files = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.setdefault((stat.st_dev, stat.st_ino),
+                             (path, (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)))
+        return list(files.values())
+    
+    def _regroup(self, groups, kind, hash_func, progress, on_totals, cancel_event):
+        """Hash every file in groups and split them by digest; returns groups of (path, key, digest)"""
+        files = [file for group in groups for file in group]
+        if on_totals is not None:
+            # Full hashes read whole files, so their progress is measured in bytes
+            on_totals(len(files), sum(key[2] for path, key in files) if kind == FULL else None)
+        digests = self.cache.get_many(kind, [key for path, key in files]) if self.cache else {}
+        
+        done_files = len(digests)
+        done_bytes = sum(key[2] for key in digests)
+        computed = {}
+        pending = [(path, key) for path, key in files if key not in digests]
+        if pending:
+            pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='hash')
+            try:
+                futures = {pool.submit(hash_func, path, key[2]): key for path, key in pending}
+                for future in as_completed(futures):
+                    if cancel_event is not None and cancel_event.is_set():
+                        return None
+                    key = futures[future]
+                    digest = future.result()
+                    if digest is not None:
+                        computed[key] = digest
+                    done_files += 1
+                    done_bytes += key[2]
+                    if progress is not None:
+                        progress(done_bytes if kind == FULL else None, done_files)
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+                if self.cache is not None:
+                    try:
+                        self.cache.put_many(kind, computed)
+                    except sqlite3.Error:
+                        pass
+        digests.update(computed)
+        
+        split = []
+        for group in groups:
+            by_digest = defaultdict(list)
+            for path, key in group:
+                if key in digests:
+                    by_digest[digests[key]].append((path, key, digests[key]))
+            split.extend(files for files in by_digest.values() if len(files) > 1)
+        return split
@@ -0,0 +1,438 @@
+"""
+File Index Module
+Persistent SQLite filename index used by search instead of walking the disk
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from stat import S_ISDIR
+from file_operations import FileOperations
+from search_filter import SearchFilter
+from utils import Utils
+
+# How long a completed index is trusted before a background refresh is started
+REFRESH_INTERVAL = 300
+
+# Number of directories written between commits while indexing
+COMMIT_EVERY = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_dir ON entries(dir);
+CREATE TABLE IF NOT EXISTS roots (
+    path TEXT PRIMARY KEY,
+    completed REAL NOT NULL
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS entry_names USING fts5(
+    name, content='entries', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entry_names(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entry_names(entry_names, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+"""
+
+
+def subtree_bounds(root):
+    """Get (prefix, upper) string bounds matching every path below root"""
+    prefix = root if root.endswith(os.sep) else root + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def like_pattern(text):
+    """Escape text for use inside a LIKE pattern with ESCAPE '\\'"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def filter_conditions(search_filter):
+    """Translate the criteria of a SearchFilter that SQL can check into conditions on entries e
+
+    The substring is left to the caller (it may go through FTS); every
+    result is still checked with SearchFilter.match.
+    """
+    conditions = []
+    params = []
+    # Globs without [...] classes map onto LIKE; LIKE ignores case for ASCII only
+    if search_filter.glob and '[' not in search_filter.glob and search_filter.glob.isascii():
+        conditions.append("e.name LIKE ? ESCAPE '\\'")
+        params.append(like_pattern(search_filter.glob).replace('*', '%').replace('?', '_'))
+    if search_filter.extensions is not None:
+        conditions.append('(' + ' OR '.join(["e.name LIKE ? ESCAPE '\\'"] * len(search_filter.extensions)) + ')')
+        params.extend('%' + like_pattern(extension) for extension in sorted(search_filter.extensions))
+    if search_filter.files_only:
+        conditions.append('e.is_dir = 0')
+    if search_filter.min_size is not None:
+        conditions.append('e.size >= ?')
+        params.append(search_filter.min_size)
+    if search_filter.max_size is not None:
+        conditions.append('e.size <= ?')
+        params.append(search_filter.max_size)
+    if search_filter.modified_after is not None:
+        conditions.append('e.mtime >= ?')
+        params.append(search_filter.modified_after)
+    if search_filter.modified_before is not None:
+        conditions.append('e.mtime < ?')
+        params.append(search_filter.modified_before)
+    return conditions, params
+
+
+class FileIndex:
+    def __init__(self, db_path=None):
+        """Initialize the index, creating the database under the cache dir if needed"""
+        self.file_ops = FileOperations()
+        self.utils = Utils()
+        self.db_path = str(db_path or self.utils.get_cache_dir() / 'file_index.sqlite3')
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._stop = threading.Event()
+        self._changed = set()  # directories reported by a watcher
+        self._added = []  # (new subfolder, device) pairs waiting for the subtree indexer
+        self._subtree_thread = None
+        
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            try:
+                conn.executescript(FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5 or the trigram tokenizer
+                self.fts = False
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        """Open a connection; WAL lets searches read while the indexer writes"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def covering_root(self, root):
+        """Get the completed index root covering root, with its completion time"""
+        root = os.path.abspath(root)
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT path, completed FROM roots').fetchall()
+        finally:
+            conn.close()
+        
+        for path, completed in rows:
+            prefix, _ = subtree_bounds(path)
+            if root == path or root.startswith(prefix):
+                return path, completed
+        return None
+    
+    def is_indexed(self, root):
+        """Check whether root lies inside a completely indexed tree"""
+        return self.covering_root(root) is not None
+    
+    def is_indexing(self, root=None):
+        """Check whether a background indexer is running (for root, if given)"""
+        with self._lock:
+            return any(thread.is_alive() and (root is None or path == os.path.abspath(root))
+                       for path, thread in self._threads.items())
+    
+    def start_indexing(self, root):
+        """Index or refresh the tree at root on a background thread"""
+        root = os.path.abspath(root)
+        with self._lock:
+            for path, thread in self._threads.items():
+                prefix, _ = subtree_bounds(path)
+                if thread.is_alive() and (root == path or root.startswith(prefix)):
+                    return False
+            
+            thread = threading.Thread(target=self._index_worker, args=(root,),
+                                      name=f'file-index {root}', daemon=True)
+            self._threads[root] = thread
+            thread.start()
+            return True
+    
+    def stop(self):
+        """Ask running indexers to stop at the next directory"""
+        self._stop.set()
+    
+    def _index_worker(self, root):
+        """Background thread body; indexing failures leave the live walk fallback in place"""
+        try:
+            self.index_tree(root)
+        except (OSError, sqlite3.Error):
+            pass
+    
+    def index_tree(self, root):
+        """Index the tree at root, re-listing only directories whose mtime changed"""
+        root = os.path.abspath(root)
+        prefix, upper = subtree_bounds(root)
+        conn = self._connect()
+        try:
+            known = dict(conn.execute(
+                'SELECT path, mtime FROM dirs WHERE path = ? OR (path >= ? AND path < ?)',
+                (root, prefix, upper)))
+            
+            if not self._walk(conn, [root], known, os.lstat(root).st_dev):
+                return False
+            
+            conn.execute('INSERT OR REPLACE INTO roots (path, completed) VALUES (?, ?)', (root, time.time()))
+            # A completed root makes any nested roots redundant
+            conn.execute('DELETE FROM roots WHERE path >= ? AND path < ?', (prefix, upper))
+            conn.commit()
+            return True
+        finally:
+            conn.close()
+    
+    def _walk(self, conn, stack, known, device):
+        """Index the directories on stack and everything below them; False if stopped
+        
+        Folders on another device than device (mount points such as /proc
+        below /) are left out, like symlinks.
+        """
+        pending = 0
+        while stack:
+            if self._stop.is_set():
+                conn.commit()
+                return False
+            
+            directory = stack.pop()
+            try:
+                stat = os.lstat(directory)
+            except OSError:
+                self._forget_tree(conn, directory)
+                continue
+            
+            if not S_ISDIR(stat.st_mode) or stat.st_dev != device:
+                # Gone, replaced by a file, a symlink we don't follow, or another filesystem
+                self._forget_tree(conn, directory)
+                continue
+            
+            if known.get(directory) == stat.st_mtime:
+                subdirs = [name for (name,) in conn.execute(
+                    'SELECT name FROM entries WHERE dir = ? AND is_dir = 1', (directory,))]
+            else:
+                subdirs = self._index_directory(conn, directory, stat.st_mtime)
+                if subdirs is None:
+                    continue
+                pending += 1
+            
+            stack.extend(os.path.join(directory, name) for name in subdirs)
+            
+            if pending >= COMMIT_EVERY:
+                conn.commit()
+                pending = 0
+        
+        return True
+    
+    def directory_changed(self, directory, name, kind):
+        """Watcher listener: remember directories whose stored listing is out of date"""
+        with self._lock:
+            self._changed.add(directory)
+    
+    def flush_changes(self):
+        """Re-list indexed directories reported by the watcher
+        
+        New subfolders are handed to a background indexer, so a search
+        right after a large tree appears doesn't wait for it to be walked.
+        """
+        with self._lock:
+            changed = self._changed
+            self._changed = set()
+        
+        if None in changed:
+            # The watcher lost events; fall back to an mtime refresh of every root
+            conn = self._connect()
+            try:
+                roots = [path for (path,) in conn.execute('SELECT path FROM roots')]
+            finally:
+                conn.close()
+            for path in roots:
+                self.start_indexing(path)
+            changed.discard(None)
+        
+        if not changed:
+            return
+        
+        added = []
+        conn = self._connect()
+        try:
+            for directory in changed:
+                if conn.execute('SELECT 1 FROM dirs WHERE path = ?', (directory,)).fetchone() is None:
+                    continue
+                
+                try:
+                    stat = os.lstat(directory)
+                except OSError:
+                    self._forget_tree(conn, directory)
+                    continue
+                
+                if not S_ISDIR(stat.st_mode):
+                    self._forget_tree(conn, directory)
+                    continue
+                
+                old_subdirs = {name for (name,) in conn.execute(
+                    'SELECT name FROM entries WHERE dir = ? AND is_dir = 1', (directory,))}
+                subdirs = self._index_directory(conn, directory, stat.st_mtime)
+                if subdirs:
+                    added.extend((os.path.join(directory, name), stat.st_dev)
+                                 for name in subdirs if name not in old_subdirs)
+            conn.commit()
+        finally:
+            conn.close()
+        
+        if added:
+            self._index_subtrees(added)
+    
+    def _index_subtrees(self, added):
+        """Queue (folder, device) pairs for the subtree indexer, starting it if needed"""
+        with self._lock:
+            self._added.extend(added)
+            if self._subtree_thread is not None and self._subtree_thread.is_alive():
+                return
+            self._subtree_thread = threading.Thread(target=self._subtree_worker,
+                                                    name='file-index subtrees', daemon=True)
+            self._subtree_thread.start()
+    
+    def _subtree_worker(self):
+        """Background thread body: index queued new subfolders until the queue is empty"""
+        while True:
+            with self._lock:
+                if not self._added:
+                    self._subtree_thread = None
+                    return
+                directory, device = self._added.pop()
+            try:
+                conn = self._connect()
+                try:
+                    self._walk(conn, [directory], {}, device)
+                    conn.commit()
+                finally:
+                    conn.close()
+            except (OSError, sqlite3.Error):
+                pass
+    
+    def _index_directory(self, conn, directory, mtime):
+        """Replace the stored listing of one directory and return its subfolder names"""
+        try:
+            records = list(self.file_ops.iter_directory(directory))
+        except (OSError, PermissionError):
+            self._forget_tree(conn, directory)
+            return None
+        
+        old_subdirs = {name for (name,) in conn.execute(
+            'SELECT name FROM entries WHERE dir = ? AND is_dir = 1', (directory,))}
+        subdirs = [name for name, is_dir, size, entry_mtime in records if is_dir]
+        
+        # Drop subtrees whose folders disappeared since the last pass
+        for name in old_subdirs.difference(subdirs):
+            self._forget_tree(conn, os.path.join(directory, name))
+        
+        conn.execute('DELETE FROM entries WHERE dir = ?', (directory,))
+        conn.executemany(
+            'INSERT INTO entries (dir, name, is_dir, size, mtime) VALUES (?, ?, ?, ?, ?)',
+            [(directory, name, int(is_dir), size, entry_mtime)
+             for name, is_dir, size, entry_mtime in records])
+        conn.execute('INSERT OR REPLACE INTO dirs (path, mtime) VALUES (?, ?)', (directory, mtime))
+        return subdirs
+    
+    def _forget_tree(self, conn, directory):
+        """Remove a directory and everything below it from the index"""
+        prefix, upper = subtree_bounds(directory)
+        conn.execute('DELETE FROM entries WHERE dir = ? OR (dir >= ? AND dir < ?)', (directory, prefix, upper))
+        conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (directory, prefix, upper))
+    
+    def query(self, root, query, max_depth=None, deadline=None):
+        """Yield (directory, record) pairs from the index that match query
+        
+        query is a substring or a SearchFilter. max_depth and deadline
+        bound the results as for walk_directory.
+        """
+        search_filter = SearchFilter(query) if isinstance(query, str) else query
+        root = os.path.abspath(root)
+        prefix, upper = subtree_bounds(root)
+        conditions, params = filter_conditions(search_filter)
+        conditions.append('(e.dir = ? OR (e.dir >= ? AND e.dir < ?))')
+        params.extend((root, prefix, upper))
+        
+        text = search_filter.text
+        conn = self._connect()
+        try:
+            if self.fts and len(text) >= 3:
+                cursor = conn.execute(
+                    'SELECT e.dir, e.name, e.is_dir, e.size, e.mtime FROM entry_names '
+                    'JOIN entries e ON e.id = entry_names.rowid '
+                    'WHERE entry_names MATCH ? AND ' + ' AND '.join(conditions),
+                    ['"' + text.replace('"', '""') + '"'] + params)
+            else:
+                if text:
+                    conditions.insert(0, "e.name LIKE ? ESCAPE '\\'")
+                    params.insert(0, '%' + like_pattern(text) + '%')
+                cursor = conn.execute(
+                    'SELECT e.dir, e.name, e.is_dir, e.size, e.mtime FROM entries e '
+                    'WHERE ' + ' AND '.join(conditions),
+                    params)
+            
+            for directory, name, is_dir, size, mtime in cursor:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+                # Entries directly in root are at depth 0
+                if max_depth is not None and directory != root and \
+                        directory.count(os.sep, len(prefix)) >= max_depth:
+                    continue
+                # Re-check in Python so matching is the same as the live walk
+                record = (name, bool(is_dir), size, mtime)
+                if search_filter.match(record):
+                    yield directory, record
+        finally:
+            conn.close()
+    
+    def search(self, root, query, max_depth=None, deadline=None):
+        """Yield (directory, record) pairs below root that match query
+        
+        query is a substring or a SearchFilter. Indexed trees are answered
+        from the database after applying any watcher-reported changes, and
+        refreshed in the background once the index is older than
+        REFRESH_INTERVAL. Unindexed trees fall back to a live walk while an
+        indexer is started for them. max_depth and deadline bound the
+        results as for walk_directory.
+        """
+        root = os.path.abspath(root)
+        try:
+            covering = self.covering_root(root)
+        except sqlite3.Error:
+            covering = None
+        
+        if covering is None:
+            self.start_indexing(root)
+            return self.live_search(root, query, max_depth, deadline)
+        
+        try:
+            self.flush_changes()
+        except (OSError, sqlite3.Error):
+            pass
+        
+        path, completed = covering
+        if time.time() - completed > REFRESH_INTERVAL:
+            self.start_indexing(path)
+        return self.query(root, query, max_depth, deadline)
+    
+    def live_search(self, root, query, max_depth=None, deadline=None):
+        """Yield matches by walking the disk, for trees that aren't indexed yet"""
+        search_filter = SearchFilter(query) if isinstance(query, str) else query
+        return self.file_ops.walk_matches(root, search_filter, max_depth, deadline)
@@ -7,18 +7,51 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
 import os
 import sys
+import queue
 from pathlib import Path
 import threading
 from datetime import datetime
 import glob
+import base64
+import sqlite3
+from content_search import ContentSearch
 from file_operations import FileOperations
+from jobs import JobManager
+from listing import Listing
+from previews import Previewer, PreviewCache
 from utils import Utils
+from watcher import ListingCache
+
+# Rows inserted beyond the visible part of the file list
+ROW_BUFFER = 200
+
+# Scroll position (as a fraction of the inserted rows) at which more rows are inserted
+FILL_THRESHOLD = 0.9
+
+# How often (ms) the Tk loop takes entries from a loading thread
+LOAD_POLL_INTERVAL = 50
+
+class LoadCancelled(Exception):
+    """Raised inside a loading thread when a newer load has replaced it"""
 
 class FileManagerApp:
     def __init__(self):
         """Initialize the File Manager application"""
         self.file_ops = FileOperations()
         self.utils = Utils()
+        # Repeat views of unchanged directories are served from memory
+        self.listing_cache = ListingCache(self.file_ops)
+        self.file_ops.listing_cache = self.listing_cache
+        # Copy/move/delete/size operations run off the Tk main thread
+        self.jobs = JobManager(self.file_ops)
+        # Searches inside files in worker processes
+        self.content_search = ContentSearch(file_ops=self.file_ops)
+        try:
+            preview_cache = PreviewCache()
+        except (OSError, sqlite3.Error):
+            # No writable cache directory; previews are made every time
+            preview_cache = None
+        self.previewer = Previewer(preview_cache)
         self.current_path = Path.home()
         self.view_mode = 'list'  # 'list' or 'grid'
         self.selected_items = []
@@ -26,6 +59,19 @@ class FileManagerApp:
         self.sort_column = 'name'  # Default sort column
         self.sort_reverse = False  # Sort order
         self.search_term = ''  # Current search term
+        self.showing_contents = False  # Whether the list holds content search results
+        self.listing = Listing(self.current_path)  # Last loaded directory, sorted and filtered in memory
+        self.rows = []  # Listing indices to show; only the first rows_shown are in the Treeview
+        self.rows_shown = 0
+        self.fill_pending = False
+        # Directories are read on background threads and handed over through load_queue
+        self.load_queue = queue.Queue()
+        self.load_generation = 0
+        self.load_cancel = threading.Event()
+        self.loading = False
+        self.load_draining = False
+        self.load_status = ''
+        self.delete_job = None  # Last deletion, which can be undone until it is reclaimed
         
         # Initialize the main window
         self.root = tk.Tk()
@@ -60,6 +106,7 @@ class FileManagerApp:
         self.root.bind('<Control-x>', lambda e: self.cut_items())
         self.root.bind('<Control-v>', lambda e: self.paste_items())
         self.root.bind('<Delete>', lambda e: self.delete_items())
+        self.root.bind('<Control-z>', lambda e: self.undo_delete())
         self.root.bind('<Control-f>', lambda e: self.focus_search())
         
         # Load initial directory
@@ -85,6 +132,7 @@ class FileManagerApp:
         edit_menu.add_command(label="Cut", command=self.cut_items)
         edit_menu.add_command(label="Paste", command=self.paste_items)
         edit_menu.add_command(label="Delete", command=self.delete_items)
+        edit_menu.add_command(label="Undo Delete", command=self.undo_delete)
         edit_menu.add_separator()
         edit_menu.add_command(label="Select All", command=self.select_all)
         
@@ -101,6 +149,12 @@ class FileManagerApp:
         sort_menu.add_command(label="Type", command=lambda: self.sort_files('type'))
         sort_menu.add_command(label="Date Modified", command=lambda: self.sort_files('modified'))
         
+        # Tools menu
+        tools_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Tools", menu=tools_menu)
+        tools_menu.add_command(label="Find Duplicates...", command=self.find_duplicates)
+        tools_menu.add_command(label="Disk Usage...", command=self.show_disk_usage)
+        
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Help", menu=help_menu)
@@ -129,6 +183,7 @@ class FileManagerApp:
         
         # View buttons
         ttk.Button(toolbar_frame, text="Refresh", command=self.refresh_file_list).pack(side='left', padx=2)
+        ttk.Button(toolbar_frame, text="Cancel", command=self.cancel_jobs).pack(side='left', padx=2)
     
     def create_search_bar(self):
         """Create the search bar"""
@@ -141,6 +196,12 @@ class FileManagerApp:
         self.search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=30)
         self.search_entry.pack(side='left', padx=2)
         self.search_var.trace('w', self.on_search_change)
+        self.search_entry.bind('<Return>', lambda e: self.perform_search())
+        
+        # Contents searches inside the files below the current folder instead of filtering names
+        self.content_var = tk.BooleanVar()
+        ttk.Checkbutton(search_frame, text="Contents", variable=self.content_var,
+                        command=self.perform_search).pack(side='left', padx=2)
         
         ttk.Button(search_frame, text="Search", command=self.perform_search).pack(side='left', padx=2)
         ttk.Button(search_frame, text="Clear", command=self.clear_search).pack(side='left', padx=2)
@@ -181,14 +242,20 @@ class FileManagerApp:
         self.tree.column('type', width=150)
         self.tree.column('modified', width=200)
         
-        # Create scrollbars
-        v_scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=self.tree.yview)
+        # Height of one row, used to work out how many rows are visible
+        try:
+            self.row_height = int(ttk.Style().lookup('Treeview', 'rowheight'))
+        except (TypeError, ValueError):
+            self.row_height = 20
+        
+        # Create scrollbars; vertical scrolling also inserts more rows on demand
+        self.v_scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=self.tree.yview)
         h_scrollbar = ttk.Scrollbar(tree_frame, orient='horizontal', command=self.tree.xview)
-        self.tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll, xscrollcommand=h_scrollbar.set)
         
         # Pack treeview and scrollbars
         self.tree.pack(side='left', fill='both', expand=True)
-        v_scrollbar.pack(side='right', fill='y')
+        self.v_scrollbar.pack(side='right', fill='y')
         h_scrollbar.pack(side='bottom', fill='x')
         
         # Bind events
@@ -198,6 +265,7 @@ class FileManagerApp:
         # Context menu
         self.context_menu = tk.Menu(self.root, tearoff=0)
         self.context_menu.add_command(label="Open", command=self.open_selected)
+        self.context_menu.add_command(label="Preview", command=self.show_preview)
         self.context_menu.add_command(label="Copy", command=self.copy_items)
         self.context_menu.add_command(label="Cut", command=self.cut_items)
         self.context_menu.add_command(label="Delete", command=self.delete_items)
@@ -218,46 +286,177 @@ class FileManagerApp:
         ttk.Label(status_frame, textvariable=self.file_count_var).pack(side='right')
     
     def refresh_file_list(self):
-        """Refresh the file list display"""
+        """Reload the file list on a background thread
+        
+        Entries are shown in batches as they are read and replaced by the
+        sorted listing once the whole directory is in. Starting another
+        load cancels this one, so the window never waits on slow I/O.
+        """
+        self.showing_contents = False
+        self.start_load(self.load_directory, f'Loading {self.current_path}...')
+    
+    def start_load(self, target, status, *args):
+        """Clear the file list and fill it from target(path, generation, cancel_event, *args) on a thread"""
+        # Cancel the previous load; anything it already queued is ignored
+        self.load_cancel.set()
+        self.load_cancel = threading.Event()
+        self.load_generation += 1
+        self.loading = True
+        
+        # Clear existing items in a single call
+        self.tree.delete(*self.tree.get_children())
+        self.listing = Listing(self.current_path)
+        self.rows = []
+        self.rows_shown = 0
+        
+        self.address_var.set(str(self.current_path))
+        self.load_status = status
+        self.status_var.set(self.load_status)
+        
+        threading.Thread(target=target,
+                         args=(self.current_path, self.load_generation, self.load_cancel) + args,
+                         daemon=True).start()
+        
+        if not self.load_draining:
+            self.load_draining = True
+            self.root.after(LOAD_POLL_INTERVAL, self.drain_load_queue)
+    
+    def load_directory(self, path, generation, cancel_event):
+        """Read a directory and queue its entries for the Tk loop (loading thread)"""
+        def on_batch(records):
+            if cancel_event.is_set():
+                raise LoadCancelled()
+            self.load_queue.put(('batch', generation, records))
+        
+        try:
+            # The columns and sort keys are built here, off the Tk loop
+            listing = self.file_ops.get_listing(path, on_batch)
+            if not cancel_event.is_set():
+                self.load_queue.put(('done', generation, listing))
+        except LoadCancelled:
+            pass
+        except Exception as e:
+            self.load_queue.put(('error', generation, e))
+    
+    def search_contents(self, path, generation, cancel_event, term):
+        """Queue the files below path whose contents match term (loading thread)
+        
+        Files are listed by their path relative to path as the workers
+        find them.
+        """
+        records = []
         try:
-            # Clear existing items
-            for item in self.tree.get_children():
-                self.tree.delete(item)
+            for file_path, line_number, line in self.content_search.search(path, term, max_matches=1,
+                                                                           cancel_event=cancel_event):
+                record = self.file_ops.stat_record(file_path)
+                if record is None:
+                    continue
+                record = (os.path.relpath(file_path, path),) + record[1:]
+                records.append(record)
+                self.load_queue.put(('batch', generation, [record]))
+            if not cancel_event.is_set():
+                self.load_queue.put(('done', generation, Listing(path, records)))
+        except Exception as e:
+            self.load_queue.put(('error', generation, e))
+    
+    def drain_load_queue(self):
+        """Move entries queued by loading threads into the file list (Tk loop)"""
+        while True:
+            try:
+                kind, generation, payload = self.load_queue.get_nowait()
+            except queue.Empty:
+                break
             
-            # Get directory contents
-            items = self.file_ops.get_directory_contents(self.current_path)
+            # Ignore whatever a cancelled load managed to queue
+            if generation != self.load_generation:
+                continue
             
-            # Filter items based on search term
-            if self.search_term:
-                items = self.filter_items(items, self.search_term)
+            if kind == 'batch':
+                # Show entries unsorted as they arrive, up to the visible window
+                listing = self.listing
+                start = len(listing)
+                listing.extend(payload)
+                term = self.search_term
+                self.rows.extend(i for i in range(start, len(listing))
+                                 if not term or term in listing.lower_names[i] or term in listing.lower_types[i])
+                window = self.visible_row_count() + ROW_BUFFER
+                if self.rows_shown < window:
+                    self.fill_rows(window - self.rows_shown)
+                self.file_count_var.set(f"{len(self.rows)} items loaded")
+            elif kind == 'done':
+                self.loading = False
+                self.listing = payload
+                self.show_rows()
+            else:
+                self.loading = False
+                action = 'searching' if self.showing_contents else 'loading directory'
+                self.show_error(f"Error {action}: {payload}")
+                self.status_var.set(f'Error: {payload}')
+        
+        if self.loading:
+            self.root.after(LOAD_POLL_INTERVAL, self.drain_load_queue)
+        else:
+            self.load_draining = False
+    
+    def show_rows(self):
+        """Show the loaded listing with the current sort and filter, without reading the disk"""
+        try:
+            self.tree.delete(*self.tree.get_children())
             
-            # Sort items
-            items = self.sort_items(items)
+            # Sort orders are cached per column, so toggling a sort is a lookup
+            self.rows = self.listing.view(self.sort_column, self.sort_reverse, self.search_term)
+            self.rows_shown = 0
             
-            # Add items to treeview
-            for item in items:
-                name = item['name']
-                size = self.utils.format_size(item['size']) if item['size'] is not None else ''
-                file_type = item['type']
-                modified = self.utils.format_datetime(item['modified'])
-                
-                # Insert item into treeview
-                self.tree.insert('', 'end', values=(name, size, file_type, modified))
-            
-            # Update address bar
-            self.address_var.set(str(self.current_path))
+            # Add the visible rows to the treeview; the rest follow on scroll
+            self.fill_rows()
+            self.tree.yview_moveto(0)
             
             # Update status bar
-            file_count = len([item for item in items if item['type'] != 'Folder'])
-            folder_count = len([item for item in items if item['type'] == 'Folder'])
+            is_dir = self.listing.is_dir
+            folder_count = sum(1 for i in self.rows if is_dir[i])
+            file_count = len(self.rows) - folder_count
             status_text = f"{folder_count} folders, {file_count} files"
             self.file_count_var.set(status_text)
-            self.status_var.set('Ready')
+            if self.status_var.get() == self.load_status:
+                self.status_var.set('Ready')
             
         except Exception as e:
             self.show_error(f"Error loading directory: {e}")
             self.status_var.set(f'Error: {e}')
     
+    def visible_row_count(self):
+        """Get how many rows fit in the file list"""
+        return max(self.tree.winfo_height() // self.row_height, 1)
+    
+    def fill_rows(self, count=None):
+        """Insert the next rows of the listing into the Treeview
+        
+        Only the visible rows plus ROW_BUFFER are inserted at first, so a
+        huge folder opens as fast as a small one; on_tree_scroll inserts
+        more as the view nears the last inserted row.
+        """
+        self.fill_pending = False
+        if count is None:
+            count = self.visible_row_count() + ROW_BUFFER
+        
+        end = min(self.rows_shown + count, len(self.rows))
+        indices = self.rows[self.rows_shown:end]
+        
+        # Format the new rows column by column
+        listing = self.listing
+        sizes = self.utils.format_sizes([listing.sizes[i] for i in indices])
+        modified = self.utils.format_timestamps([listing.mtimes[i] for i in indices])
+        for index, size, mtime in zip(indices, sizes, modified):
+            self.tree.insert('', 'end', values=(listing.names[index], size, listing.types[index], mtime))
+        self.rows_shown = end
+    
+    def on_tree_scroll(self, first, last):
+        """Update the scrollbar and insert more rows when scrolled near the end"""
+        self.v_scrollbar.set(first, last)
+        if not self.fill_pending and self.rows_shown < len(self.rows) and float(last) >= FILL_THRESHOLD:
+            self.fill_pending = True
+            self.root.after_idle(self.fill_rows)
+    
     def navigate_to_path(self, path):
         """Navigate to a specific path"""
         try:
@@ -353,27 +552,29 @@ class FileManagerApp:
             messagebox.showinfo('Info', 'Nothing to paste')
             return
         
-        try:
-            action = self.clipboard['action']
-            items = self.clipboard['items']
-            
-            for item_path in items:
-                dest_path = self.current_path / item_path.name
-                
-                if action == 'copy':
-                    self.file_ops.copy_item(item_path, dest_path)
-                elif action == 'cut':
-                    self.file_ops.move_item(item_path, dest_path)
-            
+        action = self.clipboard['action']
+        items = self.clipboard['items']
+        
+        if action == 'copy':
+            # Copy every clipboard item through one parallel copy engine
+            job = self.jobs.submit_copy(items, self.current_path)
+        else:
+            job = self.jobs.submit_move(items, self.current_path)
             # Clear clipboard if cut operation
-            if action == 'cut':
-                self.clipboard = {'action': None, 'items': []}
-            
+            self.clipboard = {'action': None, 'items': []}
+        
+        def on_done(job):
             self.refresh_file_list()
-            self.status_var.set(f'Pasted {len(items)} item(s)')
-            
-        except Exception as e:
-            self.show_error(f"Error pasting items: {e}")
+            if job.status != 'completed':
+                return
+            stats = job.result if action == 'copy' else None
+            if stats and stats['seconds'] > 0:
+                rate = self.utils.format_size(int(stats['bytes_per_second']))
+                self.status_var.set(f"Pasted {len(items)} item(s) ({stats['files']} files, {rate}/s)")
+            else:
+                self.status_var.set(f'Pasted {len(items)} item(s)')
+        
+        self.watch_job(job, on_done)
     
     def delete_items(self):
         """Delete selected items"""
@@ -389,15 +590,29 @@ class FileManagerApp:
             message += f"\n... and {len(item_names) - 5} more"
         
         if messagebox.askyesno('Confirm Delete', message):
-            try:
-                for item_path in selected_items:
-                    self.file_ops.delete_item(item_path)
-                
-                self.refresh_file_list()
-                self.status_var.set(f'Deleted {len(selected_items)} item(s)')
-                
-            except Exception as e:
-                self.show_error(f"Error deleting items: {e}")
+            # The items are staged out of sight at once; their space is reclaimed in the background
+            job = self.jobs.submit_delete(selected_items)
+            self.delete_job = job
+            self.refresh_file_list()
+            
+            def on_done(job):
+                if job.status == 'completed':
+                    self.status_var.set(f'Deleted {len(selected_items)} item(s)')
+            
+            self.watch_job(job, on_done)
+    
+    def undo_delete(self):
+        """Put back the items of the last deletion, if it has not been reclaimed yet"""
+        job = self.delete_job
+        if job is None or job.done:
+            self.status_var.set('Nothing to undo')
+            return
+        
+        self.jobs.cancel(job.id)
+        self.delete_job = None
+        self.refresh_file_list()
+        restored = (job.result or {}).get('restored', 0)
+        self.status_var.set(f'Restored {restored} item(s)')
     
     def rename_item(self):
         """Rename selected item"""
@@ -428,7 +643,7 @@ class FileManagerApp:
         
         try:
             item_path = selected_items[0]
-            properties = self.file_ops.get_item_properties(item_path)
+            properties = self.file_ops.get_item_properties(item_path, calculate_size=False)
             
             # Create properties dialog
             prop_window = tk.Toplevel(self.root)
@@ -447,7 +662,8 @@ class FileManagerApp:
             
             ttk.Label(info_frame, text=f"Name: {properties['name']}").pack(anchor='w', pady=2)
             ttk.Label(info_frame, text=f"Type: {properties['type']}").pack(anchor='w', pady=2)
-            ttk.Label(info_frame, text=f"Size: {properties['size']}").pack(anchor='w', pady=2)
+            size_var = tk.StringVar(value=f"Size: {properties['size']}")
+            ttk.Label(info_frame, textvariable=size_var).pack(anchor='w', pady=2)
             ttk.Label(info_frame, text=f"Location: {properties['location']}").pack(anchor='w', pady=2)
             ttk.Label(info_frame, text=f"Created: {properties['created']}").pack(anchor='w', pady=2)
             ttk.Label(info_frame, text=f"Modified: {properties['modified']}").pack(anchor='w', pady=2)
@@ -455,9 +671,232 @@ class FileManagerApp:
             
             ttk.Button(prop_window, text='OK', command=prop_window.destroy).pack(pady=20)
             
+            # Folder sizes are calculated in the background
+            if properties['type'] == 'Folder':
+                size_var.set('Size: Calculating...')
+                job = self.jobs.submit_size(item_path)
+                prop_window.bind('<Destroy>', lambda e: job.cancel_event.set() if e.widget is prop_window else None)
+                
+                def on_done(job):
+                    if job.status == 'completed' and prop_window.winfo_exists():
+                        size_var.set(f"Size: {self.utils.format_size(job.result['size'])}")
+                
+                self.watch_job(job, on_done)
+            
         except Exception as e:
             self.show_error(f"Error getting properties: {e}")
     
+    def show_preview(self):
+        """Show a thumbnail or the first lines of the selected file"""
+        selected_items = self.get_selected_items()
+        if len(selected_items) != 1 or selected_items[0].is_dir():
+            messagebox.showinfo('Info', 'Please select exactly one file to preview')
+            return
+        
+        item_path = selected_items[0]
+        window = tk.Toplevel(self.root)
+        window.title(f'Preview - {item_path.name}')
+        window.transient(self.root)
+        message = ttk.Label(window, text='Loading preview...')
+        message.pack(padx=20, pady=20)
+        
+        # Previews read only the start of a file, but a slow disk still stays off the Tk thread
+        job = self.jobs.submit('preview', f"Preview {item_path.name}",
+                               lambda job: self.previewer.preview(item_path, 256))
+        
+        def on_done(job):
+            if not window.winfo_exists():
+                return
+            result = job.result if job.status == 'completed' else None
+            if result is None:
+                message.config(text='No preview available')
+                return
+            
+            mimetype, data, etag = result
+            if mimetype.startswith('text/'):
+                message.destroy()
+                text = tk.Text(window, width=80, height=20, wrap='none')
+                text.insert('1.0', data.decode('utf-8'))
+                text.config(state='disabled')
+                text.pack(fill='both', expand=True, padx=5, pady=5)
+            elif mimetype in ('image/png', 'image/gif'):
+                # Tk decodes PNG and GIF itself; keep a reference so the image isn't collected
+                window.image = tk.PhotoImage(data=base64.b64encode(data))
+                message.config(image=window.image, text='')
+            else:
+                message.config(text=f'{mimetype} image; Tk can only show PNG and GIF previews')
+        
+        self.watch_job(job, on_done)
+    
+    def find_duplicates(self):
+        """Find identical files below the current folder in the background"""
+        path = self.current_path
+        job = self.jobs.submit_duplicates([path])
+        
+        def on_done(job):
+            if job.status == 'completed':
+                self.show_duplicates(path, job.result)
+        
+        self.watch_job(job, on_done)
+    
+    def show_duplicates(self, path, result):
+        """Show the groups found by a duplicates job"""
+        window = tk.Toplevel(self.root)
+        window.title(f'Duplicates in {path}')
+        window.geometry('700x450')
+        window.transient(self.root)
+        
+        if result['groups']:
+            summary = (f"{len(result['groups'])} group(s) of identical files, "
+                       f"{self.utils.format_size(result['wasted'])} reclaimable")
+        else:
+            summary = 'No duplicate files found'
+        ttk.Label(window, text=summary).pack(anchor='w', padx=10, pady=5)
+        
+        tree_frame = ttk.Frame(window)
+        tree_frame.pack(fill='both', expand=True, padx=10)
+        tree = ttk.Treeview(tree_frame, columns=('size', 'wasted'), show='tree headings')
+        tree.heading('#0', text='File')
+        tree.heading('size', text='Size')
+        tree.heading('wasted', text='Wasted')
+        tree.column('#0', width=460)
+        tree.column('size', width=100)
+        tree.column('wasted', width=100)
+        scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+        
+        for group in result['groups']:
+            parent = tree.insert('', 'end', text=f"{len(group['paths'])} copies",
+                                 values=(self.utils.format_size(group['size']),
+                                         self.utils.format_size(group['wasted'])),
+                                 open=True)
+            for file_path in group['paths']:
+                tree.insert(parent, 'end', text=file_path)
+        
+        def open_folder(event):
+            # Double-clicking a copy shows its folder in the main window
+            item_id = tree.identify_row(event.y)
+            if item_id and tree.parent(item_id):
+                self.navigate_to_path(Path(tree.item(item_id, 'text')).parent)
+        
+        tree.bind('<Double-1>', open_folder)
+        ttk.Button(window, text='Close', command=window.destroy).pack(pady=10)
+    
+    def show_disk_usage(self):
+        """Scan the disk usage below the current folder and browse it while the scan runs"""
+        root = self.current_path
+        job = self.jobs.submit_usage(root)
+        usage = self.jobs.usage_tree(root)
+        
+        window = tk.Toplevel(self.root)
+        window.title(f'Disk Usage of {root}')
+        window.geometry('700x450')
+        window.transient(self.root)
+        window.bind('<Destroy>', lambda e: job.cancel_event.set() if e.widget is window else None)
+        
+        status_var = tk.StringVar(value='Scanning...')
+        ttk.Label(window, textvariable=status_var).pack(anchor='w', padx=10, pady=5)
+        
+        tree_frame = ttk.Frame(window)
+        tree_frame.pack(fill='both', expand=True, padx=10)
+        view = ttk.Treeview(tree_frame, columns=('size', 'share', 'files'), show='tree headings')
+        view.heading('#0', text='Folder')
+        view.heading('size', text='Size')
+        view.heading('share', text='Share')
+        view.heading('files', text='Files')
+        view.column('#0', width=380)
+        view.column('size', width=100)
+        view.column('share', width=80)
+        view.column('files', width=100)
+        scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=view.yview)
+        view.configure(yscrollcommand=scrollbar.set)
+        view.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+        ttk.Button(window, text='Close', command=window.destroy).pack(pady=10)
+        
+        items = {}  # Treeview item -> folder path
+        opened = set()  # Folder paths the user expanded
+        
+        def fill(item, path):
+            # Children are read from the in-memory tree, so expanding a folder never rescans
+            node = usage.snapshot(path)
+            if node is None:
+                return None
+            view.delete(*view.get_children(item))
+            for child in node['children']:
+                is_open = child['path'] in opened
+                child_item = view.insert(item, 'end', text=child['name'], open=is_open,
+                                         values=(self.utils.format_size(child['size']),
+                                                 f"{child['share']}%", child['files']))
+                items[child_item] = child['path']
+                if is_open:
+                    fill(child_item, child['path'])
+                elif child['dirs']:
+                    # Placeholder so the folder can be expanded
+                    view.insert(child_item, 'end', text='')
+            return node
+        
+        def on_open(event):
+            item = view.focus()
+            if item in items:
+                opened.add(items[item])
+                fill(item, items[item])
+        
+        def on_close(event):
+            opened.discard(items.get(view.focus()))
+        
+        def refresh():
+            if not window.winfo_exists():
+                return
+            items.clear()
+            node = fill('', None)
+            status = f"{self.utils.format_size(node['size'])} in {node['files']} files, {node['dirs']} folders"
+            if not job.done:
+                status_var.set(status + ' (scanning...)')
+                window.after(1000, refresh)
+            else:
+                status_var.set(status if job.status == 'completed' else f"{status} ({job.status})")
+        
+        view.bind('<<TreeviewOpen>>', on_open)
+        view.bind('<<TreeviewClose>>', on_close)
+        refresh()
+        self.watch_job(job)
+    
+    def watch_job(self, job, on_done=None):
+        """Poll a background job with root.after, showing its progress in the status bar"""
+        if job.done:
+            if job.status == 'failed':
+                self.show_error(f"{job.description} failed: {job.error}")
+            elif job.status == 'cancelled':
+                self.status_var.set(f'{job.description}: cancelled')
+            else:
+                self.status_var.set('Ready')
+            if on_done is not None:
+                on_done(job)
+            return
+        
+        info = job.to_dict()
+        text = f"{job.description}: "
+        if info['progress'] is not None:
+            text += f"{info['progress']}%"
+            if info['eta_seconds'] is not None:
+                text += f" ({int(info['eta_seconds']) + 1}s left)"
+        else:
+            text += 'working...'
+        self.status_var.set(text)
+        
+        self.root.after(200, lambda: self.watch_job(job, on_done))
+    
+    def cancel_jobs(self):
+        """Cancel every running background job"""
+        active = self.jobs.active()
+        for job in active:
+            self.jobs.cancel(job.id)
+        if active:
+            self.status_var.set(f'Cancelling {len(active)} job(s)...')
+    
     def show_error(self, message):
         """Show error dialog"""
         messagebox.showerror('Error', message)
@@ -519,6 +958,8 @@ Built with Python and tkinter."""
     
     def select_all(self):
         """Select all items in the file list"""
+        # Rows not yet inserted can't be selected, so insert the rest first
+        self.fill_rows(len(self.rows))
         children = self.tree.get_children()
         self.tree.selection_set(children)
     
@@ -529,6 +970,9 @@ Built with Python and tkinter."""
     
     def on_search_change(self, *args):
         """Handle search term change"""
+        # Content searches read every file, so they only run on Enter or the Search button
+        if self.content_var.get():
+            return
         # Debounce search - only search after user stops typing
         if hasattr(self, 'search_timer'):
             self.root.after_cancel(self.search_timer)
@@ -536,8 +980,21 @@ Built with Python and tkinter."""
     
     def perform_search(self):
         """Perform search with current search term"""
-        self.search_term = self.search_var.get().strip().lower()
-        self.refresh_file_list()
+        term = self.search_var.get().strip()
+        if self.content_var.get() and term:
+            # Matching files below the current folder replace the listing as they are found
+            self.search_term = ''
+            self.showing_contents = True
+            self.start_load(self.search_contents, f'Searching contents for: {term}', term)
+            return
+        
+        self.search_term = term.lower()
+        if self.showing_contents:
+            # Back to filtering names: show the folder itself again
+            self.refresh_file_list()
+        # Filtering works on the loaded listing; a running load applies it when done
+        elif not self.loading:
+            self.show_rows()
         
         if self.search_term:
             self.status_var.set(f'Searching for: {self.search_term}')
@@ -548,23 +1005,10 @@ Built with Python and tkinter."""
         """Clear search term and refresh"""
         self.search_var.set('')
         self.search_term = ''
-        self.refresh_file_list()
-    
-    def filter_items(self, items, search_term):
-        """Filter items based on search term"""
-        if not search_term:
-            return items
-        
-        filtered_items = []
-        for item in items:
-            # Search in filename
-            if search_term in item['name'].lower():
-                filtered_items.append(item)
-            # Also search in file type for more comprehensive search
-            elif search_term in item['type'].lower():
-                filtered_items.append(item)
-        
-        return filtered_items
+        if self.showing_contents:
+            self.refresh_file_list()
+        elif not self.loading:
+            self.show_rows()
     
     # Sorting functionality
     def sort_files(self, column):
@@ -576,36 +1020,9 @@ Built with Python and tkinter."""
             self.sort_column = column
             self.sort_reverse = False
         
-        self.refresh_file_list()
+        if not self.loading:
+            self.show_rows()
         
         # Update status to show current sort
         order = "descending" if self.sort_reverse else "ascending"
         self.status_var.set(f'Sorted by {column} ({order})')
-    
-    def sort_items(self, items):
-        """Sort items based on current sort settings"""
-        if not items:
-            return items
-        
-        # Define sort key functions
-        def get_sort_key(item):
-            if self.sort_column == 'name':
-                # Sort folders first, then files, both alphabetically
-                return (item['type'] != 'Folder', item['name'].lower())
-            elif self.sort_column == 'size':
-                # Handle None sizes (folders) by treating them as 0
-                size = item['size'] if item['size'] is not None else 0
-                return (item['type'] != 'Folder', size)
-            elif self.sort_column == 'type':
-                return (item['type'] != 'Folder', item['type'].lower())
-            elif self.sort_column == 'modified':
-                # Handle None dates
-                date = item['modified'] if item['modified'] is not None else datetime.min
-                return (item['type'] != 'Folder', date)
-            else:
-                return item['name'].lower()
-        
-        # Sort the items
-        sorted_items = sorted(items, key=get_sort_key, reverse=self.sort_reverse)
-        
-        return sorted_items
@@ -6,92 +6,209 @@ Handles all file system operations including copy, move, delete, create, etc.
 import os
 import shutil
 import sys
+import time
 from pathlib import Path
 from datetime import datetime
 import subprocess
 import platform
+from stat import S_ISDIR, S_ISREG
+from copy_engine import CopyEngine
+from delete_engine import get_delete_engine
+from listing import Entry, Listing, type_for_name
+from move_planner import MovePlanner, plan_destinations, rename_noreplace
+from size_engine import get_size_engine
 from utils import Utils
 
+# Number of records passed to a scan's on_batch callback at a time
+SCAN_BATCH = 500
+
 class FileOperations:
     def __init__(self):
         """Initialize file operations handler"""
         self.system = platform.system()
         self.utils = Utils()
+        # Optional watcher.ListingCache used by list_directory
+        self.listing_cache = None
     
-    def get_directory_contents(self, path):
-        """Get contents of a directory with file information"""
+    def _iter_scandir(self, path):
+        """Yield (record, is_link) pairs for a directory using os.scandir"""
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    stat = entry.stat()
+                except (OSError, PermissionError):
+                    # Skip items we can't access (including broken symlinks)
+                    continue
+                
+                size = stat.st_size if not is_dir and S_ISREG(stat.st_mode) else None
+                yield (entry.name, is_dir, size, stat.st_mtime), entry.is_symlink()
+    
+    def iter_directory(self, path):
+        """Yield compact (name, is_dir, size, mtime) tuples in directory order
+
+        The DirEntry type cache is used for is_dir and at most one stat call
+        is made per entry, so a directory can be streamed without holding
+        the whole listing in memory.
+        """
+        for record, is_link in self._iter_scandir(path):
+            yield record
+    
+    def walk_directory(self, root, max_depth=None, deadline=None):
+        """Recursively yield (directory, record) pairs below root
+
+        Symlinked folders are reported but not descended into, and
+        directories that can't be read are skipped. max_depth limits how
+        many folder levels below root are entered (0 lists root only), and
+        the walk stops early once time.monotonic() passes deadline.
+        """
+        stack = [(str(root), 0)]
+        while stack:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            directory, depth = stack.pop()
+            descend = max_depth is None or depth < max_depth
+            try:
+                for record, is_link in self._iter_scandir(directory):
+                    yield directory, record
+                    if descend and record[1] and not is_link:
+                        stack.append((os.path.join(directory, record[0]), depth + 1))
+            except (OSError, PermissionError):
+                continue
+    
+    def walk_matches(self, root, search_filter, max_depth=None, deadline=None):
+        """Recursively yield (directory, record) pairs below root that match a SearchFilter
+
+        Walks like walk_directory, but name criteria are checked on the
+        directory entry first and only the entries that pass are stat'ed,
+        so a narrow query costs little more than reading the directories.
+        """
+        stack = [(str(root), 0)]
+        while stack:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            directory, depth = stack.pop()
+            descend = max_depth is None or depth < max_depth
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        try:
+                            # The entry type comes from the directory read; no stat is needed yet
+                            is_dir = entry.is_dir()
+                            if descend and is_dir and not entry.is_symlink():
+                                stack.append((entry.path, depth + 1))
+                            if not search_filter.match_name(entry.name, is_dir):
+                                continue
+                            stat = entry.stat()
+                        except (OSError, PermissionError):
+                            continue
+                        
+                        size = stat.st_size if not is_dir and S_ISREG(stat.st_mode) else None
+                        if search_filter.match_stat(size, stat.st_mtime):
+                            yield directory, (entry.name, is_dir, size, stat.st_mtime)
+            except (OSError, PermissionError):
+                continue
+    
+    def scan_directory(self, path, on_batch=None):
+        """Scan a directory and return compact entry tuples, folders first then by name
+
+        on_batch, if given, is called with lists of up to SCAN_BATCH records
+        in directory order as they are read, before the sorted list is
+        returned. An exception raised by on_batch aborts the scan.
+        """
+        if on_batch is None:
+            entries = list(self.iter_directory(path))
+        else:
+            entries = []
+            batch = []
+            for record in self.iter_directory(path):
+                batch.append(record)
+                if len(batch) >= SCAN_BATCH:
+                    on_batch(batch)
+                    entries.extend(batch)
+                    batch = []
+            if batch:
+                on_batch(batch)
+                entries.extend(batch)
+        
+        entries.sort(key=lambda e: (not e[1], e[0].lower()))
+        return entries
+    
+    def list_directory(self, path, on_batch=None):
+        """Get sorted compact entry tuples, from the listing cache when one is attached
+
+        on_batch is passed to scan_directory if the directory has to be read.
+        """
+        if self.listing_cache is not None:
+            return self.listing_cache.get(path, on_batch)
+        return self.scan_directory(path, on_batch)
+    
+    def stat_record(self, path):
+        """Build the compact entry tuple for a single path with one stat call, or None"""
+        try:
+            stat = os.stat(path)
+        except (OSError, PermissionError):
+            return None
+        
+        is_dir = S_ISDIR(stat.st_mode)
+        size = stat.st_size if S_ISREG(stat.st_mode) else None
+        return (os.path.basename(path), is_dir, size, stat.st_mtime)
+    
+    def sort_entries(self, entries, sort_key='name', reverse=False):
+        """Sort compact entry tuples by column, keeping folders before files"""
+        if sort_key == 'size':
+            key = lambda e: (e[2] or 0, e[0].lower())
+        elif sort_key == 'modified':
+            key = lambda e: (e[3], e[0].lower())
+        elif sort_key == 'type':
+            key = lambda e: ('' if e[1] else self.get_type_for_name(e[0]).lower(), e[0].lower())
+        else:
+            key = lambda e: e[0].lower()
+        
+        ordered = sorted(entries, key=key, reverse=reverse)
+        return [e for e in ordered if e[1]] + [e for e in ordered if not e[1]]
+    
+    def get_directory_contents(self, path, on_batch=None):
+        """Get contents of a directory as Entry objects
+
+        on_batch, if given, receives the raw records while the directory is
+        read (see scan_directory).
+        """
         try:
             path = Path(path)
             items = []
             
             # Add parent directory entry if not at root
             if path.parent != path:
-                items.append({
-                    'name': '..',
-                    'type': 'Folder',
-                    'size': None,
-                    'modified': None,
-                    'path': path.parent
-                })
+                items.append(Entry(path, '..', True, None, None))
             
-            # Get all items in directory
-            for item in sorted(path.iterdir(), key=lambda x: (x.is_file(), x.name.lower())):
-                try:
-                    stat = item.stat()
-                    
-                    item_info = {
-                        'name': item.name,
-                        'type': 'Folder' if item.is_dir() else self.get_file_type(item),
-                        'size': stat.st_size if item.is_file() else None,
-                        'modified': datetime.fromtimestamp(stat.st_mtime),
-                        'path': item
-                    }
-                    
-                    items.append(item_info)
-                    
-                except (OSError, PermissionError):
-                    # Skip items we can't access
-                    continue
+            for record in self.list_directory(path, on_batch):
+                items.append(Entry.from_record(path, record))
             
             return items
             
         except (OSError, PermissionError) as e:
             raise Exception(f"Cannot access directory: {e}")
     
+    def get_listing(self, path, on_batch=None):
+        """Get a directory as a columnar Listing, with a '..' entry below the root"""
+        try:
+            path = Path(path)
+            records = self.list_directory(path, on_batch)
+            return Listing(path, records, parent=path.parent != path)
+        except (OSError, PermissionError) as e:
+            raise Exception(f"Cannot access directory: {e}")
+    
     def get_file_type(self, file_path):
         """Determine file type based on extension"""
         if file_path.is_dir():
             return 'Folder'
         
-        suffix = file_path.suffix.lower()
-        
-        # Define file type mappings
-        type_map = {
-            '.txt': 'Text File',
-            '.doc': 'Word Document',
-            '.docx': 'Word Document',
-            '.pdf': 'PDF Document',
-            '.jpg': 'JPEG Image',
-            '.jpeg': 'JPEG Image',
-            '.png': 'PNG Image',
-            '.gif': 'GIF Image',
-            '.bmp': 'Bitmap Image',
-            '.mp3': 'MP3 Audio',
-            '.wav': 'WAV Audio',
-            '.mp4': 'MP4 Video',
-            '.avi': 'AVI Video',
-            '.zip': 'ZIP Archive',
-            '.rar': 'RAR Archive',
-            '.exe': 'Executable',
-            '.py': 'Python File',
-            '.js': 'JavaScript File',
-            '.html': 'HTML Document',
-            '.css': 'CSS File',
-            '.xml': 'XML File',
-            '.json': 'JSON File'
-        }
-        
-        return type_map.get(suffix, 'File')
+        return self.get_type_for_name(file_path.name)
+    
+    def get_type_for_name(self, name):
+        """Determine file type from a file name without touching the filesystem"""
+        return type_for_name(name)
     
     def create_folder(self, folder_path):
         """Create a new folder"""
@@ -117,69 +234,91 @@ class FileOperations:
         except OSError as e:
             raise Exception(f"Cannot create file: {e}")
     
-    def copy_item(self, source_path, dest_path):
+    def get_free_destination(self, dest_path, reserved=()):
+        """Get dest_path, or the first free "name (n)" variant of it
+
+        Paths in reserved are treated as taken, so several items can be
+        planned into one folder before any of them is written.
+        """
+        dest_path = Path(dest_path)
+        if not dest_path.exists() and dest_path not in reserved:
+            return dest_path
+        
+        base_name = dest_path.stem
+        suffix = dest_path.suffix
+        counter = 1
+        
+        while dest_path.exists() or dest_path in reserved:
+            if dest_path.is_dir():
+                dest_path = dest_path.parent / f"{base_name} ({counter})"
+            else:
+                dest_path = dest_path.parent / f"{base_name} ({counter}){suffix}"
+            counter += 1
+        
+        return dest_path
+    
+    def copy_item(self, source_path, dest_path, progress=None, cancel_event=None):
         """Copy a file or directory"""
+        self.copy_items([source_path], None, progress, cancel_event, destinations=[dest_path])
+    
+    def copy_items(self, source_paths, dest_dir, progress=None, cancel_event=None, destinations=None):
+        """Copy several files or directories into dest_dir on the parallel copy engine
+        
+        Returns the engine's throughput statistics.
+        """
         try:
-            source_path = Path(source_path)
-            dest_path = Path(dest_path)
+            if destinations is None:
+                destinations = [Path(dest_dir) / Path(source).name for source in source_paths]
             
-            # Handle name conflicts
-            if dest_path.exists():
-                base_name = dest_path.stem
-                suffix = dest_path.suffix
-                counter = 1
-                
-                while dest_path.exists():
-                    if dest_path.is_dir():
-                        dest_path = dest_path.parent / f"{base_name} ({counter})"
-                    else:
-                        dest_path = dest_path.parent / f"{base_name} ({counter}){suffix}"
-                    counter += 1
+            # Handle name conflicts, listing each destination folder once
+            pairs = plan_destinations(zip(source_paths, destinations))
             
-            if source_path.is_dir():
-                shutil.copytree(source_path, dest_path)
-            else:
-                shutil.copy2(source_path, dest_path)
+            engine = CopyEngine(progress=progress, cancel_event=cancel_event)
+            return engine.copy(pairs)
                 
         except (OSError, shutil.Error) as e:
             raise Exception(f"Cannot copy item: {e}")
     
     def move_item(self, source_path, dest_path):
         """Move a file or directory"""
+        self.move_items([source_path], None, destinations=[dest_path])
+    
+    def move_items(self, source_paths, dest_dir, progress=None, on_totals=None, cancel_event=None,
+                   destinations=None):
+        """Move several files or directories into dest_dir
+        
+        Items on dest_dir's filesystem are renamed in place; only the rest
+        are copied on the parallel copy engine and then removed. Returns
+        {'moved', 'renamed', 'copied'} counts.
+        """
         try:
-            source_path = Path(source_path)
-            dest_path = Path(dest_path)
+            if destinations is None:
+                destinations = [Path(dest_dir) / Path(source).name for source in source_paths]
             
-            # Handle name conflicts
-            if dest_path.exists():
-                base_name = dest_path.stem
-                suffix = dest_path.suffix
-                counter = 1
+            planner = MovePlanner()
+            return planner.move(zip(source_paths, destinations), progress, on_totals, cancel_event)
                 
-                while dest_path.exists():
-                    if dest_path.is_dir():
-                        dest_path = dest_path.parent / f"{base_name} ({counter})"
-                    else:
-                        dest_path = dest_path.parent / f"{base_name} ({counter}){suffix}"
-                    counter += 1
-            
-            shutil.move(str(source_path), str(dest_path))
-            
         except (OSError, shutil.Error) as e:
             raise Exception(f"Cannot move item: {e}")
     
-    def delete_item(self, item_path):
-        """Delete a file or directory"""
+    def delete_item(self, item_path, progress=None, cancel_event=None):
+        """Delete a file or directory now, emptying folders in parallel
+        
+        If progress is given it is called as progress(files, size) as files
+        are removed; setting cancel_event stops a folder deletion part way.
+        JobManager.submit_delete stages items first so they can be restored.
+        """
         try:
             item_path = Path(item_path)
-            
-            if item_path.is_dir():
-                shutil.rmtree(item_path)
-            else:
-                item_path.unlink()
-                
-        except (OSError, shutil.Error) as e:
+            item_path.lstat()
+        except OSError as e:
             raise Exception(f"Cannot delete item: {e}")
+        
+        errors = get_delete_engine().remove_tree(item_path, progress, cancel_event)
+        if cancel_event is not None and cancel_event.is_set() and os.path.lexists(item_path):
+            raise Exception("Deletion cancelled")
+        if errors:
+            raise Exception(f"Cannot delete item: {errors[0]}")
     
     def rename_item(self, old_path, new_path):
         """Rename a file or directory"""
@@ -187,23 +326,27 @@ class FileOperations:
             old_path = Path(old_path)
             new_path = Path(new_path)
             
-            if new_path.exists():
-                raise Exception(f"An item with that name already exists")
-            
-            old_path.rename(new_path)
+            # The check and the rename are one step, so a racing create is never replaced
+            rename_noreplace(old_path, new_path)
             
+        except FileExistsError:
+            raise Exception(f"Item already exists: {new_path.name}")
         except OSError as e:
             raise Exception(f"Cannot rename item: {e}")
     
-    def get_item_properties(self, item_path):
-        """Get detailed properties of a file or directory"""
+    def get_item_properties(self, item_path, calculate_size=True):
+        """Get detailed properties of a file or directory
+        
+        With calculate_size=False a folder's size is left empty so it can
+        be calculated separately (e.g. by a background job).
+        """
         try:
             item_path = Path(item_path)
             stat = item_path.stat()
             
             # Calculate size for directories
             if item_path.is_dir():
-                size = self.get_directory_size(item_path)
+                size = self.get_directory_size(item_path) if calculate_size else None
                 size_str = self.utils.format_size(size)
             else:
                 size_str = self.utils.format_size(stat.st_size)
@@ -225,18 +368,7 @@ class FileOperations:
     
     def get_directory_size(self, directory_path):
         """Calculate total size of a directory"""
-        total_size = 0
-        try:
-            for path in directory_path.rglob('*'):
-                if path.is_file():
-                    try:
-                        total_size += path.stat().st_size
-                    except (OSError, PermissionError):
-                        continue
-        except (OSError, PermissionError):
-            pass
-        
-        return total_size
+        return get_size_engine().directory_size(directory_path)
     
     
     def open_file(self, file_path):
@@ -0,0 +1,652 @@
+"""
+Background Jobs Module
+Runs long file operations (copy, move, delete, size, duplicates, disk usage) on a worker pool with
+progress reporting, cancellation and status for the web server and the GUI. With a JobStore, job
+status is shared through SQLite so any server process can report or cancel any job.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from delete_engine import get_delete_engine, RECLAIM_DELAY
+from disk_usage import UsageStore, UsageTree
+from duplicates import DuplicateFinder, HashCache
+from file_operations import FileOperations
+from size_engine import get_size_engine
+from utils import Utils
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# Finished jobs are kept this long so clients can read their final status
+FINISHED_JOB_TTL = 3600
+
+# Disk usage trees kept in memory for browsing, least recently scanned dropped first
+MAX_USAGE_TREES = 4
+
+# Quick jobs someone is waiting on run on their own pool, so long copies can't hold them up
+INTERACTIVE_KINDS = ('size', 'preview')
+INTERACTIVE_WORKERS = 4
+
+# Seconds between writes of job status to the store and checks for cancel requests from other processes
+PUBLISH_INTERVAL = 0.5
+
+# A stored job not written for this long belonged to a process that stopped
+STALE_JOB_AGE = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    snapshot TEXT NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it notices it was cancelled"""
+
+
+class Job:
+    def __init__(self, kind, description):
+        """Initialize a queued job"""
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.status = QUEUED
+        self.error = None
+        self.result = None
+        self.bytes_done = 0
+        self.bytes_total = None
+        self.files_done = 0
+        self.files_total = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        # Called by JobManager.cancel to undo what the job already did
+        self.on_cancel = None
+        self._lock = threading.Lock()
+    
+    def update(self, bytes_done=None, files_done=None):
+        """Record progress (called from worker threads)"""
+        with self._lock:
+            if bytes_done is not None:
+                self.bytes_done = bytes_done
+            if files_done is not None:
+                self.files_done = files_done
+    
+    def set_totals(self, files_total, bytes_total):
+        """Record the amount of work the job expects to do"""
+        with self._lock:
+            self.files_total = files_total
+            self.bytes_total = bytes_total
+    
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+    
+    @property
+    def done(self):
+        """Whether the job has finished, failed or been cancelled"""
+        return self.status in FINISHED_STATES
+    
+    def fraction(self):
+        """Get completion between 0 and 1, or None if the totals are unknown"""
+        with self._lock:
+            if self.bytes_total:
+                return min(self.bytes_done / self.bytes_total, 1.0)
+            if self.files_total:
+                return min(self.files_done / self.files_total, 1.0)
+            return 1.0 if self.status == COMPLETED else None
+    
+    def eta(self):
+        """Estimate the seconds left from the progress rate so far"""
+        fraction = self.fraction()
+        if self.status != RUNNING or not fraction or self.started is None:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed * (1 - fraction) / fraction
+    
+    def to_dict(self):
+        """Get a JSON-friendly snapshot of the job"""
+        fraction = self.fraction()
+        eta = self.eta()
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'description': self.description,
+                'status': self.status,
+                'error': self.error,
+                'result': self.result,
+                'bytes_done': self.bytes_done,
+                'bytes_total': self.bytes_total,
+                'files_done': self.files_done,
+                'files_total': self.files_total,
+                'progress': round(fraction * 100, 1) if fraction is not None else None,
+                'eta_seconds': round(eta, 1) if eta is not None else None,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished
+            }
+
+
+class StoredJob:
+    def __init__(self, snapshot, updated):
+        """Initialize a job run by another process from its last stored snapshot"""
+        if snapshot['status'] not in FINISHED_STATES and time.time() - updated > STALE_JOB_AGE:
+            snapshot = dict(snapshot, status=FAILED, eta_seconds=None,
+                            error='The server process running this job stopped before it finished')
+        self.snapshot = snapshot
+        self.id = snapshot['id']
+        self.kind = snapshot['kind']
+        self.status = snapshot['status']
+        self.created = snapshot['created']
+    
+    @property
+    def done(self):
+        """Whether the job has finished, failed or been cancelled"""
+        return self.status in FINISHED_STATES
+    
+    def to_dict(self):
+        """Get a JSON-friendly snapshot of the job"""
+        return dict(self.snapshot)
+
+
+class JobStore:
+    def __init__(self, db_path=None):
+        """Initialize the store, creating the database under the cache dir if needed"""
+        self.db_path = str(db_path or Utils().get_cache_dir() / 'jobs.sqlite3')
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        """Open a connection to the store database"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def put(self, snapshots):
+        """Save job snapshots (dicts from Job.to_dict), keeping any cancel request"""
+        now = time.time()
+        rows = []
+        for snapshot in snapshots:
+            try:
+                data = json.dumps(snapshot)
+            except (TypeError, ValueError):
+                # A result only its own process can use
+                data = json.dumps(dict(snapshot, result=None))
+            rows.append((snapshot['id'], snapshot['created'], now, data))
+        conn = self._connect()
+        try:
+            conn.executemany('INSERT INTO jobs (id, created, updated, snapshot) VALUES (?, ?, ?, ?) '
+                             'ON CONFLICT(id) DO UPDATE SET updated = excluded.updated, snapshot = excluded.snapshot',
+                             rows)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def get(self, job_id):
+        """Get a stored job as a StoredJob, or None"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT snapshot, updated FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return StoredJob(json.loads(row[0]), row[1]) if row is not None else None
+    
+    def list(self):
+        """Get every stored job as a StoredJob"""
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT snapshot, updated FROM jobs').fetchall()
+        finally:
+            conn.close()
+        return [StoredJob(json.loads(snapshot), updated) for snapshot, updated in rows]
+    
+    def request_cancel(self, job_id):
+        """Ask the process running a job to cancel it; returns False if the job is unknown"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+    
+    def cancel_requests(self, job_ids):
+        """Get the ids among job_ids that another process asked to cancel"""
+        if not job_ids:
+            return []
+        conn = self._connect()
+        try:
+            return [row[0] for row in conn.execute(
+                f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({', '.join('?' * len(job_ids))})",
+                list(job_ids))]
+        finally:
+            conn.close()
+    
+    def prune(self, cutoff):
+        """Forget jobs not written since cutoff"""
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM jobs WHERE updated < ?', (cutoff,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class JobManager:
+    def __init__(self, file_ops=None, max_workers=2, store=None):
+        """Initialize the manager and its worker pool
+
+        With a JobStore, job status is published to it and jobs run by
+        other processes sharing the store can be read and cancelled too.
+        """
+        self.file_ops = file_ops or FileOperations()
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._interactive_pool = ThreadPoolExecutor(max_workers=INTERACTIVE_WORKERS,
+                                                    thread_name_prefix='interactive')
+        # Deletions mostly wait out their undo window, so they don't hold up other jobs
+        self._reclaim_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='reclaim')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._duplicate_finder = None
+        self._usage_store = None
+        self._usage_trees = OrderedDict()
+        # Trees rebuilt from scans run by other processes, by root: (tree, scan state)
+        self._stored_usage_trees = OrderedDict()
+        # Jobs whose final status has been published
+        self._published = set()
+        self._publisher = None
+        self._stopped = threading.Event()
+    
+    def submit(self, kind, description, func):
+        """Queue func(job) to run on the pool and return the Job"""
+        pool = self._interactive_pool if kind in INTERACTIVE_KINDS else None
+        return self._start(Job(kind, description), func, pool)
+    
+    def _start(self, job, func, pool=None):
+        """Queue func(job) for a job that is already set up"""
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        if self.store is not None:
+            # Written now, so the next request can find the job whichever process it reaches
+            self._publish([job])
+            self._start_publisher()
+        (pool or self._pool).submit(self._run, job, func)
+        return job
+    
+    def _start_publisher(self):
+        """Start the thread that keeps the store up to date, once"""
+        with self._lock:
+            if self._publisher is not None:
+                return
+            self._publisher = threading.Thread(target=self._publish_loop, name='job-publisher', daemon=True)
+        self._publisher.start()
+    
+    def _publish_loop(self):
+        """Publish job status and apply cancel requests until shutdown (own thread)"""
+        while not self._stopped.wait(PUBLISH_INTERVAL):
+            with self._lock:
+                jobs = [job for job in self._jobs.values() if job.id not in self._published]
+            requested = self._publish(jobs)
+            for job_id in requested:
+                self.cancel(job_id)
+    
+    def _publish(self, jobs):
+        """Write jobs to the store; returns the ids of those another process asked to cancel"""
+        if not jobs:
+            return []
+        snapshots = [job.to_dict() for job in jobs]
+        try:
+            self.store.put(snapshots)
+            requested = self.store.cancel_requests([snapshot['id'] for snapshot in snapshots
+                                                    if snapshot['status'] not in FINISHED_STATES])
+        except sqlite3.Error:
+            return []
+        with self._lock:
+            self._published.update(snapshot['id'] for snapshot in snapshots
+                                   if snapshot['status'] in FINISHED_STATES)
+        return requested
+    
+    def _run(self, job, func):
+        """Run one job, recording its outcome"""
+        if job.cancel_event.is_set():
+            job.status = CANCELLED
+            job.finished = time.time()
+            return
+        
+        job.started = time.time()
+        job.status = RUNNING
+        try:
+            job.result = func(job)
+            job.status = CANCELLED if job.cancel_event.is_set() else COMPLETED
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.status = CANCELLED if job.cancel_event.is_set() else FAILED
+        finally:
+            job.finished = time.time()
+    
+    def _prune(self):
+        """Forget jobs that finished more than FINISHED_JOB_TTL ago"""
+        cutoff = time.time() - FINISHED_JOB_TTL
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.done and job.finished and job.finished < cutoff]:
+            del self._jobs[job_id]
+            self._published.discard(job_id)
+        if self.store is not None:
+            try:
+                self.store.prune(cutoff)
+            except sqlite3.Error:
+                pass
+    
+    def get(self, job_id):
+        """Get a job by id, or None; jobs of other processes come back as StoredJobs"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            try:
+                job = self.store.get(job_id)
+            except sqlite3.Error:
+                job = None
+        return job
+    
+    def list(self):
+        """Get every known job, newest first"""
+        with self._lock:
+            jobs = dict(self._jobs)
+        if self.store is not None:
+            try:
+                for job in self.store.list():
+                    jobs.setdefault(job.id, job)
+            except sqlite3.Error:
+                pass
+        return sorted(jobs.values(), key=lambda job: job.created, reverse=True)
+    
+    def active(self):
+        """Get this process's jobs that are queued or running"""
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.done]
+    
+    def cancel(self, job_id):
+        """Request cancellation of a job; returns False if it is unknown
+
+        Jobs with an undo step (deletions) run it before this returns.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return self._cancel_elsewhere(job_id)
+        job.cancel_event.set()
+        if job.on_cancel is not None and not job.done:
+            job.on_cancel()
+            # Undone before it started; don't wait for a worker to notice
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished = time.time()
+        return True
+    
+    def _cancel_elsewhere(self, job_id):
+        """Cancel a job this process doesn't run; returns False if it is unknown
+        
+        A deletion is undone here from the delete registry, so it works
+        even if the process that started it has stopped. Otherwise that
+        process cancels the job when it next publishes.
+        """
+        stored = self.get(job_id)
+        restored = None
+        if stored is None or stored.kind == 'delete':
+            restored = get_delete_engine().restore_recorded(job_id)
+        if stored is None:
+            return restored is not None
+        try:
+            if restored is not None and not stored.done:
+                self.store.put([dict(stored.to_dict(), status=CANCELLED, result={'restored': restored},
+                                     eta_seconds=None, finished=time.time())])
+            return self.store.request_cancel(job_id) or restored is not None
+        except sqlite3.Error:
+            return restored is not None
+    
+    def shutdown(self):
+        """Cancel everything and stop the pool"""
+        for job in self.active():
+            job.cancel_event.set()
+        self._stopped.set()
+        self._pool.shutdown(wait=False)
+        self._interactive_pool.shutdown(wait=False)
+        self._reclaim_pool.shutdown(wait=False)
+    
+    # Job kinds
+    def measure(self, paths, job=None):
+        """Count the files and bytes below paths"""
+        totals = get_size_engine().measure_many(
+            paths, one_filesystem=False,
+            cancel_event=job.cancel_event if job is not None else None)
+        if job is not None:
+            job.check_cancelled()
+        return totals['files'], totals['size']
+    
+    @staticmethod
+    def _measure_totals(paths, job, stop_event):
+        """Set a job's totals from the size engine, unless stop_event is set first (own thread)"""
+        totals = get_size_engine().measure_many(paths, one_filesystem=False, cancel_event=stop_event)
+        if not stop_event.is_set():
+            job.set_totals(totals['files'], totals['size'])
+    
+    def submit_copy(self, source_paths, dest_dir):
+        """Copy items into dest_dir in the background"""
+        source_paths = [Path(p) for p in source_paths]
+        
+        def run(job):
+            # Copying starts at once; the totals for progress and ETA are measured alongside,
+            # from the size engine's memo where the tree was measured before
+            copied = threading.Event()
+            threading.Thread(target=self._measure_totals, args=(source_paths, job, copied),
+                             name='copy-totals', daemon=True).start()
+            try:
+                stats = self.file_ops.copy_items(
+                    source_paths, dest_dir,
+                    progress=lambda bytes_done, files_done: job.update(bytes_done, files_done),
+                    cancel_event=job.cancel_event)
+            finally:
+                copied.set()
+            job.check_cancelled()
+            job.set_totals(stats['files'], stats['bytes'])
+            return stats
+        
+        return self.submit('copy', f"Copy {len(source_paths)} item(s) to {dest_dir}", run)
+    
+    def submit_move(self, source_paths, dest_dir):
+        """Move items into dest_dir in the background"""
+        source_paths = [Path(p) for p in source_paths]
+        
+        def run(job):
+            job.set_totals(len(source_paths), None)
+            result = self.file_ops.move_items(
+                source_paths, dest_dir,
+                progress=lambda bytes_done, files_done: job.update(bytes_done, files_done),
+                on_totals=job.set_totals,
+                cancel_event=job.cancel_event)
+            job.check_cancelled()
+            return result
+        
+        return self.submit('move', f"Move {len(source_paths)} item(s) to {dest_dir}", run)
+    
+    def submit_delete(self, paths):
+        """Delete items: they are staged out of sight now and reclaimed in the background
+
+        Cancelling the job before reclaiming finishes puts the items back.
+        """
+        return self.submit_reclaim(get_delete_engine().stage(paths))
+    
+    def submit_reclaim(self, batch):
+        """Reclaim a staged deletion in the background once the undo window passes"""
+        engine = get_delete_engine()
+        
+        def run(job):
+            # Measure while the undo window runs, so the totals cost no extra time
+            started = time.time()
+            job.set_totals(*self.measure([item.staged or item.original for item in batch.items], job))
+            engine.reclaim(batch,
+                           progress=lambda bytes_done, files_done: job.update(bytes_done, files_done),
+                           delay=max(RECLAIM_DELAY - (time.time() - started), 0))
+            job.check_cancelled()
+            
+            errors = batch.errors + [(item.original, item.error) for item in batch.items if item.error]
+            if errors:
+                raise Exception("Cannot delete item: " + "; ".join(f"{path}: {error}" for path, error in errors))
+            return {'deleted': batch.counts().get('reclaimed', 0)}
+        
+        def undo():
+            job.result = {'restored': engine.restore(batch)}
+        
+        job = Job('delete', f"Delete {len(batch.items) + len(batch.errors)} item(s)")
+        # The job is undone by its batch id, from the delete registry, in any process
+        job.id = batch.id
+        engine.record(batch)
+        # Cancelling the job, or shutting down, stops reclaiming too
+        job.cancel_event = batch.stop_event
+        job.on_cancel = undo
+        return self._start(job, run, self._reclaim_pool)
+    
+    def duplicate_finder(self):
+        """Get the duplicate finder, opening its hash cache on first use"""
+        with self._lock:
+            if self._duplicate_finder is None:
+                try:
+                    cache = HashCache()
+                except (OSError, sqlite3.Error):
+                    # No writable cache directory; every scan hashes from scratch
+                    cache = None
+                self._duplicate_finder = DuplicateFinder(self.file_ops, cache)
+            return self._duplicate_finder
+    
+    def submit_duplicates(self, paths, min_size=1):
+        """Find identical files below paths in the background"""
+        paths = [Path(p) for p in paths]
+        
+        def run(job):
+            groups = self.duplicate_finder().find(
+                paths, min_size,
+                progress=lambda bytes_done, files_done: job.update(bytes_done, files_done),
+                on_totals=job.set_totals,
+                cancel_event=job.cancel_event)
+            job.check_cancelled()
+            return {
+                'groups': groups,
+                'files': sum(len(group['paths']) for group in groups),
+                'wasted': sum(group['wasted'] for group in groups)
+            }
+        
+        return self.submit('duplicates', f"Find duplicates in {paths[0].name or paths[0]}", run)
+    
+    def usage_store(self):
+        """Get the disk usage store, opening it on first use; None without a cache directory"""
+        with self._lock:
+            if self._usage_store is None:
+                try:
+                    self._usage_store = UsageStore()
+                except (OSError, sqlite3.Error):
+                    # No writable cache directory; rescans read every folder again
+                    self._usage_store = False
+            return self._usage_store or None
+    
+    def usage_tree(self, root):
+        """Get the disk usage tree last scanned for root, or None
+        
+        With a JobStore, a scan run by another process is rebuilt from
+        the disk usage store, and rebuilt again whenever it has saved more.
+        """
+        root = str(Path(root).resolve())
+        with self._lock:
+            tree = self._usage_trees.get(root)
+        if tree is not None or self.store is None or self.usage_store() is None:
+            return tree
+        
+        try:
+            state = self.usage_store().scan_state(root)
+            if state is None:
+                return None
+            with self._lock:
+                cached = self._stored_usage_trees.get(root)
+            if cached is not None and cached[1] == state:
+                return cached[0]
+            tree = UsageTree.from_store(root, self.usage_store(), state)
+        except sqlite3.Error:
+            return None
+        with self._lock:
+            self._stored_usage_trees[root] = (tree, state)
+            self._stored_usage_trees.move_to_end(root)
+            while len(self._stored_usage_trees) > MAX_USAGE_TREES:
+                self._stored_usage_trees.popitem(last=False)
+        return tree
+    
+    def submit_usage(self, root):
+        """Scan the disk usage below root in the background
+        
+        The tree is available from usage_tree(root) as soon as the job
+        starts, and fills in while it runs.
+        """
+        root = Path(root).resolve()
+        store = self.usage_store()
+        if store is not None and self.store is not None:
+            # Mark the scan as running now, so other processes wait for it instead of starting their own
+            try:
+                store.save(str(root), {}, False, scanning=True)
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            tree = UsageTree(root, store)
+            self._usage_trees[str(root)] = tree
+            self._usage_trees.move_to_end(str(root))
+            while len(self._usage_trees) > MAX_USAGE_TREES:
+                self._usage_trees.popitem(last=False)
+        
+        def run(job):
+            tree.scan(cancel_event=job.cancel_event,
+                      progress=lambda files, size: job.update(size, files))
+            job.check_cancelled()
+            return {'path': str(root), 'size': tree.root.size, 'files': tree.root.files,
+                    'dirs': tree.root.dirs, 'reused': tree.reused, 'read': tree.read}
+        
+        return self.submit('usage', f"Disk usage of {root.name or root}", run)
+    
+    def submit_size(self, path):
+        """Calculate the total size of a file or folder in the background"""
+        path = Path(path)
+        
+        def run(job):
+            totals = get_size_engine().measure(
+                path, cancel_event=job.cancel_event,
+                progress=lambda files, size: job.update(size, files))
+            job.check_cancelled()
+            job.set_totals(totals['files'], totals['size'])
+            job.update(totals['size'], totals['files'])
+            return {'path': str(path), 'size': totals['size'], 'files': totals['files']}
+        
+        return self.submit('size', f"Calculate size of {path.name or path}", run)
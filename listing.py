@@ -0,0 +1,196 @@
+"""
+Directory Listing Module
+Compact directory entries shared by the GUI, web views and search, and a
+columnar listing with precomputed sort keys that views can sort and filter
+repeatedly without touching the disk
+"""
+
+import os
+from datetime import datetime
+from pathlib import Path
+from utils import Utils
+
+# File type names keyed by lowercase extension
+FILE_TYPE_MAP = {
+    '.txt': 'Text File',
+    '.doc': 'Word Document',
+    '.docx': 'Word Document',
+    '.pdf': 'PDF Document',
+    '.jpg': 'JPEG Image',
+    '.jpeg': 'JPEG Image',
+    '.png': 'PNG Image',
+    '.gif': 'GIF Image',
+    '.bmp': 'Bitmap Image',
+    '.mp3': 'MP3 Audio',
+    '.wav': 'WAV Audio',
+    '.mp4': 'MP4 Video',
+    '.avi': 'AVI Video',
+    '.zip': 'ZIP Archive',
+    '.rar': 'RAR Archive',
+    '.exe': 'Executable',
+    '.py': 'Python File',
+    '.js': 'JavaScript File',
+    '.html': 'HTML Document',
+    '.css': 'CSS File',
+    '.xml': 'XML File',
+    '.json': 'JSON File'
+}
+
+utils = Utils()
+
+
+def type_for_name(name):
+    """Get the type name of a file from its extension"""
+    return FILE_TYPE_MAP.get(os.path.splitext(name)[1].lower(), 'File')
+
+
+class Entry:
+    __slots__ = ('directory', 'name', 'is_dir', 'size', 'mtime')
+    
+    def __init__(self, directory, name, is_dir, size, mtime):
+        """Initialize an entry from raw stat fields
+        
+        Only the fields are stored; the path, type and display strings are
+        derived when read, so entries cost the same however they are shown.
+        Entries of one directory share its directory object.
+        """
+        self.directory = directory
+        self.name = name
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+    
+    @classmethod
+    def from_record(cls, directory, record):
+        """Create an entry from a compact (name, is_dir, size, mtime) record"""
+        return cls(directory, *record)
+    
+    def __getitem__(self, key):
+        """Allow item['name'] style access, as for the old item dicts"""
+        return getattr(self, key)
+    
+    @property
+    def path(self):
+        """Full path of the entry ('..' resolves to the parent directory)"""
+        if self.name == '..':
+            return Path(self.directory).parent
+        return Path(self.directory) / self.name
+    
+    @property
+    def type(self):
+        """Type name shown for the entry"""
+        return 'Folder' if self.is_dir else type_for_name(self.name)
+    
+    @property
+    def modified(self):
+        """Modification time as a datetime, or None"""
+        return datetime.fromtimestamp(self.mtime) if self.mtime is not None else None
+    
+    @property
+    def size_text(self):
+        """Formatted size, empty for folders"""
+        return utils.format_size(self.size)
+    
+    @property
+    def modified_text(self):
+        """Formatted modification time"""
+        return utils.format_timestamp(self.mtime)
+
+
+class Listing:
+    def __init__(self, path, records=(), parent=False):
+        """Initialize the listing of path from compact (name, is_dir, size, mtime) records
+        
+        With parent set, a '..' folder entry comes first.
+        """
+        self.path = Path(path)
+        self.names = []
+        self.lower_names = []
+        self.is_dir = []
+        self.sizes = []
+        self.mtimes = []
+        self.types = []
+        self.lower_types = []
+        self._orders = {}
+        self._filter = None
+        self._lower_types = {}
+        
+        if parent:
+            self._append('..', True, None, None, 'Folder')
+        self.extend(records)
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def _append(self, name, is_dir, size, mtime, file_type):
+        """Add one entry to every column"""
+        self.names.append(name)
+        self.lower_names.append(name.lower())
+        self.is_dir.append(is_dir)
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.types.append(file_type)
+        # Few distinct types exist, so their lowercase strings are shared
+        lower_type = self._lower_types.get(file_type)
+        if lower_type is None:
+            lower_type = self._lower_types[file_type] = file_type.lower()
+        self.lower_types.append(lower_type)
+    
+    def extend(self, records):
+        """Add compact records, dropping any cached orders"""
+        for name, is_dir, size, mtime in records:
+            self._append(name, is_dir, size, mtime, 'Folder' if is_dir else type_for_name(name))
+        self._orders.clear()
+        self._filter = None
+    
+    def entry(self, index):
+        """Get one row of the listing as an Entry"""
+        return Entry(self.path, self.names[index], self.is_dir[index], self.sizes[index], self.mtimes[index])
+    
+    def order(self, column='name', reverse=False):
+        """Get entry indices sorted by column, folders first; cached per column and direction"""
+        key = (column, reverse)
+        order = self._orders.get(key)
+        if order is not None:
+            return order
+        
+        if reverse:
+            order = self.order(column)[::-1]
+        else:
+            if column == 'size':
+                values = [size if size is not None else 0 for size in self.sizes]
+            elif column == 'type':
+                values = self.lower_types
+            elif column == 'modified':
+                values = [mtime if mtime is not None else float('-inf') for mtime in self.mtimes]
+            else:
+                values = self.lower_names
+            is_dir = self.is_dir
+            order = sorted(range(len(self.names)), key=lambda i: (not is_dir[i], values[i]))
+        
+        self._orders[key] = order
+        return order
+    
+    def matches(self, term):
+        """Get the set of indices whose name or type contains the lowercase term
+        
+        A term containing the previous one only searches the previous
+        matches, so typing into a filter box gets cheaper per keystroke.
+        """
+        if self._filter is not None and self._filter[0] in term:
+            candidates = self._filter[1]
+        else:
+            candidates = range(len(self.names))
+        
+        lower_names, lower_types = self.lower_names, self.lower_types
+        matched = {i for i in candidates if term in lower_names[i] or term in lower_types[i]}
+        self._filter = (term, matched)
+        return matched
+    
+    def view(self, column='name', reverse=False, term=''):
+        """Get the indices to show, sorted by column and filtered by term"""
+        order = self.order(column, reverse)
+        if not term:
+            return order
+        matched = self.matches(term)
+        return [i for i in order if i in matched]
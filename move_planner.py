@@ -0,0 +1,216 @@
+"""
+Move Planner Module
+Plans bulk moves into a folder: each destination folder is listed once and name
+conflicts are resolved in memory instead of stat'ing "name (n)" candidates one
+by one. Items on the destination's filesystem are renamed without ever
+replacing an existing entry; only items on other filesystems are copied in
+parallel and then removed.
+"""
+
+import errno
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from copy_engine import CopyEngine, DEFAULT_WORKERS
+from size_engine import get_size_engine
+
+# Filesystems where names differing only in case collide
+CASE_INSENSITIVE = sys.platform in ('win32', 'darwin')
+
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+
+# renameat2 lets the kernel refuse to replace an existing entry atomically (Linux 3.15+, glibc 2.28+)
+_renameat2 = None
+if sys.platform.startswith('linux'):
+    try:
+        import ctypes
+        _renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+        _renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+        _renameat2.restype = ctypes.c_int
+    except (ImportError, OSError, AttributeError):
+        _renameat2 = None
+
+
+def rename_noreplace(source, destination):
+    """Rename source to destination, raising FileExistsError rather than replacing anything"""
+    if _renameat2 is not None:
+        if _renameat2(AT_FDCWD, os.fsencode(source), AT_FDCWD, os.fsencode(destination), RENAME_NOREPLACE) == 0:
+            return
+        error = ctypes.get_errno()
+        # Filesystems without RENAME_NOREPLACE support fall through to the checked rename
+        if error not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+            raise OSError(error, os.strerror(error), os.fspath(source), None, os.fspath(destination))
+    
+    if os.path.lexists(destination):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), os.fspath(destination))
+    os.rename(source, destination)
+
+
+def name_key(name):
+    """Get the key two names collide under on this platform"""
+    return name.casefold() if CASE_INSENSITIVE else name
+
+
+def free_name(name, is_dir, taken):
+    """Get name, or its first "name (n)" variant whose key is not in taken"""
+    if name_key(name) not in taken:
+        return name
+    base_name, suffix = (name, '') if is_dir else os.path.splitext(name)
+    counter = 1
+    while True:
+        candidate = f"{base_name} ({counter}){suffix}"
+        if name_key(candidate) not in taken:
+            return candidate
+        counter += 1
+
+
+def plan_destinations(pairs):
+    """Resolve (source, destination) pairs to destinations that are free and distinct
+    
+    Each destination folder is listed once; the names it holds and the
+    names already planned into it are tracked in memory. Returns
+    (source, destination) pairs of paths.
+    """
+    listings = {}
+    planned = []
+    for source, destination in pairs:
+        source, destination = os.fspath(source), os.fspath(destination)
+        parent, name = os.path.split(destination)
+        taken = listings.get(parent)
+        if taken is None:
+            try:
+                taken = {name_key(existing) for existing in os.listdir(parent)}
+            except OSError:
+                # A missing folder fails later, when the item is written
+                taken = set()
+            listings[parent] = taken
+        name = free_name(name, os.path.isdir(source), taken)
+        taken.add(name_key(name))
+        planned.append((source, os.path.join(parent, name)))
+    return planned
+
+
+def inside(path, folder):
+    """Whether path is folder or somewhere below it"""
+    folder = os.path.realpath(folder)
+    return os.path.commonpath([folder, os.path.realpath(path)]) == folder
+
+
+class MovePlanner:
+    def __init__(self, max_workers=DEFAULT_WORKERS):
+        """Initialize the planner; max_workers bounds cross-device copies and removals"""
+        self.max_workers = max_workers
+    
+    def move(self, pairs, progress=None, on_totals=None, cancel_event=None):
+        """Move (source, destination) pairs, renaming a destination that is taken
+        
+        Items on the destination's filesystem are renamed, which is
+        atomic and never replaces an existing entry. The rest are copied
+        in parallel, and each source is removed only once its copy is
+        complete; a failed or cancelled copy is removed instead, leaving
+        the source as it was. progress(bytes_done, files_done) and
+        on_totals(files_total, bytes_total) report the rename stage, then
+        the copy stage. Returns {'moved', 'renamed', 'copied'}; raises
+        shutil.Error listing every item that failed once all have run.
+        """
+        errors = []
+        renames = []
+        copies = []
+        for source, destination in plan_destinations(pairs):
+            try:
+                if os.path.isdir(source) and not os.path.islink(source) and inside(destination, source):
+                    errors.append((source, destination, "Cannot move a folder into itself"))
+                elif os.lstat(source).st_dev == os.stat(os.path.dirname(destination)).st_dev:
+                    renames.append((source, destination))
+                else:
+                    copies.append((source, destination))
+            except OSError as e:
+                errors.append((source, destination, str(e)))
+        
+        # Stage 1: same-filesystem items only need a rename each
+        renamed = 0
+        if on_totals is not None and renames:
+            on_totals(len(renames), None)
+        for source, destination in renames:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            try:
+                rename_noreplace(source, destination)
+            except FileExistsError:
+                # Created since the folder was listed; plan again against a fresh listing
+                destination = plan_destinations([(source, destination)])[0][1]
+                try:
+                    rename_noreplace(source, destination)
+                except OSError as e:
+                    errors.append((source, destination, str(e)))
+                    continue
+            except OSError as e:
+                if e.errno == errno.EXDEV:
+                    # Same device number but a different mount (bind mounts, overlay folders)
+                    copies.append((source, destination))
+                else:
+                    errors.append((source, destination, str(e)))
+                continue
+            renamed += 1
+            if progress is not None:
+                progress(None, renamed)
+        
+        # Stage 2: copy items from other filesystems, then remove their sources
+        copied = 0
+        if copies and not (cancel_event is not None and cancel_event.is_set()):
+            copied = self._copy_then_remove(copies, errors, progress, on_totals, cancel_event)
+        
+        if errors:
+            raise shutil.Error(errors)
+        return {'moved': renamed + copied, 'renamed': renamed, 'copied': copied}
+    
+    def _copy_then_remove(self, copies, errors, progress, on_totals, cancel_event):
+        """Copy pairs across filesystems and remove each fully copied source; returns the count"""
+        if on_totals is not None:
+            totals = get_size_engine().measure_many([source for source, destination in copies],
+                                                    one_filesystem=False, cancel_event=cancel_event)
+            on_totals(totals['files'], totals['size'])
+        
+        engine = CopyEngine(self.max_workers, progress=progress, cancel_event=cancel_event, symlinks=True)
+        failed = {}
+        try:
+            engine.copy(copies)
+        except shutil.Error as e:
+            # Errors name the file that failed; charge each to the item it belongs to
+            for src, dst, message in e.args[0]:
+                for source, destination in copies:
+                    if os.path.commonpath([source, src]) == source:
+                        failed.setdefault(source, []).append(message)
+                        break
+            for source, destination in copies:
+                if source in failed:
+                    errors.append((source, destination, "; ".join(failed[source])))
+        
+        cancelled = cancel_event is not None and cancel_event.is_set()
+        complete = [(source, destination) for source, destination in copies
+                    if not cancelled and source not in failed]
+        # Only copies this move created are removed; a path someone else created since it was planned is kept
+        partial = [destination for source, destination in copies
+                   if (cancelled or source in failed) and destination in engine.created]
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='move') as pool:
+            # Sources go only once their copy is whole; incomplete copies go instead
+            results = list(pool.map(self._remove, [source for source, destination in complete] + partial))
+        for (source, destination), error in zip(complete, results):
+            if error is not None:
+                errors.append((source, destination, f"Copied but not removed: {error}"))
+        return sum(1 for error in results[:len(complete)] if error is None)
+    
+    @staticmethod
+    def _remove(path):
+        """Remove a file, link or folder tree; returns the error message or None (worker thread)"""
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            elif os.path.lexists(path):
+                os.unlink(path)
+        except OSError as e:
+            return str(e)
+        return None
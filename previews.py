@@ -0,0 +1,281 @@
+"""
+Previews Module
+Makes small previews without reading whole files: thumbnails for images (the
+JPEG's embedded EXIF thumbnail, a Pillow-scaled copy when Pillow is installed,
+or a small image as it is) and the first lines of text files. Results are kept
+in a size-bounded SQLite LRU cache keyed by (path, mtime, size).
+"""
+
+import io
+import mimetypes
+import os
+import sqlite3
+import time
+from hashlib import blake2b
+from utils import Utils, COMMON_FILE_EXTENSIONS
+
+try:
+    from PIL import Image
+except ImportError:
+    # Without Pillow, images get their EXIF thumbnail or are passed through when small
+    Image = None
+
+# Longest side of a thumbnail in pixels, and the range callers may ask for
+THUMBNAIL_SIZE = 128
+MIN_THUMBNAIL_SIZE = 32
+MAX_THUMBNAIL_SIZE = 512
+
+# Bytes read from the start of a JPEG to find its EXIF thumbnail
+EXIF_BYTES = 64 * 1024
+
+# Images up to this size are their own thumbnail when nothing can scale them
+PASSTHROUGH_BYTES = 256 * 1024
+
+# Images larger than this are not decoded
+MAX_IMAGE_BYTES = 64 * 1024 * 1024
+
+# Text snippets: bytes read, lines kept and characters kept per line
+SNIPPET_BYTES = 4096
+SNIPPET_LINES = 20
+SNIPPET_LINE_CHARS = 200
+
+# Default on-disk cache budget
+CACHE_BYTES = 64 * 1024 * 1024
+
+# A cache hit refreshes its LRU position at most this often
+TOUCH_INTERVAL = 60
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+JPEG_EXTENSIONS = {'.jpg', '.jpeg'}
+TEXT_EXTENSIONS = set(COMMON_FILE_EXTENSIONS['Code']) | {
+    '.txt', '.log', '.md', '.rst', '.csv', '.tsv', '.json', '.xml', '.yml', '.yaml', '.toml',
+    '.ini', '.cfg', '.conf', '.sh', '.bat', '.sql', '.ts', '.c', '.h', '.rs', '.go', '.rb'
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS previews (
+    key TEXT PRIMARY KEY,
+    mimetype TEXT NOT NULL,
+    data BLOB NOT NULL,
+    bytes INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS previews_accessed ON previews (accessed);
+"""
+
+
+def preview_kind(name):
+    """Get 'image' or 'text' for names that usually have a preview, else None"""
+    extension = os.path.splitext(name)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return 'image'
+    if extension in TEXT_EXTENSIONS:
+        return 'text'
+    return None
+
+
+def exif_thumbnail(head):
+    """Get the JPEG thumbnail embedded in the EXIF block of a JPEG's first bytes, or None"""
+    if not head.startswith(b'\xff\xd8'):
+        return None
+    pos = 2
+    while pos + 4 <= len(head) and head[pos] == 0xFF:
+        marker = head[pos + 1]
+        length = int.from_bytes(head[pos + 2:pos + 4], 'big')
+        if marker == 0xE1 and head[pos + 4:pos + 10] == b'Exif\0\0':
+            return tiff_thumbnail(head[pos + 10:pos + 2 + length])
+        if marker == 0xDA:
+            # Image data starts; there is no EXIF block
+            return None
+        pos += 2 + length
+    return None
+
+
+def tiff_thumbnail(tiff):
+    """Get the JPEG named by IFD1 of an EXIF TIFF structure, or None"""
+    order = {b'II': 'little', b'MM': 'big'}.get(tiff[:2])
+    if order is None:
+        return None
+    
+    def number(offset, width):
+        if offset + width > len(tiff):
+            raise ValueError('EXIF data is truncated')
+        return int.from_bytes(tiff[offset:offset + width], order)
+    
+    try:
+        ifd0 = number(4, 4)
+        ifd1 = number(ifd0 + 2 + 12 * number(ifd0, 2), 4)
+        if not ifd1:
+            return None
+        offset = length = None
+        for index in range(number(ifd1, 2)):
+            entry = ifd1 + 2 + 12 * index
+            tag = number(entry, 2)
+            if tag == 0x0201:
+                offset = number(entry + 8, 4)
+            elif tag == 0x0202:
+                length = number(entry + 8, 4)
+    except ValueError:
+        return None
+    if not offset or not length or offset + length > len(tiff):
+        return None
+    thumbnail = tiff[offset:offset + length]
+    return thumbnail if thumbnail.startswith(b'\xff\xd8') else None
+
+
+def image_thumbnail(path, size, file_size):
+    """Get (mimetype, data) for a thumbnail of an image no more than size pixels across, or None"""
+    extension = os.path.splitext(path)[1].lower()
+    
+    # Camera JPEGs carry a ~160px thumbnail near the start of the file
+    if extension in JPEG_EXTENSIONS and size <= 160:
+        try:
+            with open(path, 'rb') as f:
+                thumbnail = exif_thumbnail(f.read(EXIF_BYTES))
+        except OSError:
+            return None
+        if thumbnail is not None:
+            return 'image/jpeg', thumbnail
+    
+    if Image is not None and file_size <= MAX_IMAGE_BYTES:
+        try:
+            with Image.open(path) as image:
+                # JPEGs are decoded straight at a reduced scale
+                image.draft('RGB', (size, size))
+                image.thumbnail((size, size))
+                out = io.BytesIO()
+                if image.mode in ('RGBA', 'LA', 'P'):
+                    image.convert('RGBA').save(out, 'PNG')
+                    return 'image/png', out.getvalue()
+                image.convert('RGB').save(out, 'JPEG', quality=80)
+                return 'image/jpeg', out.getvalue()
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return None
+    
+    if file_size <= PASSTHROUGH_BYTES:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read(PASSTHROUGH_BYTES)
+        except OSError:
+            return None
+        return mimetypes.guess_type(path)[0] or 'application/octet-stream', data
+    return None
+
+
+def text_snippet(path):
+    """Get (mimetype, data) with the first lines of a text file, or None if it looks binary"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(SNIPPET_BYTES)
+    except OSError:
+        return None
+    if b'\0' in head:
+        return None
+    
+    text = head.decode('utf-8', errors='replace')
+    if len(head) == SNIPPET_BYTES and '\n' in text:
+        # Drop the line cut off by the read
+        text = text.rsplit('\n', 1)[0]
+    if text.count('\ufffd') > len(text) // 10:
+        return None
+    lines = [line[:SNIPPET_LINE_CHARS] for line in text.splitlines()[:SNIPPET_LINES]]
+    return 'text/plain; charset=utf-8', '\n'.join(lines).encode('utf-8')
+
+
+class PreviewCache:
+    def __init__(self, db_path=None, max_bytes=CACHE_BYTES):
+        """Initialize the cache, creating the database under the cache dir if needed"""
+        self.db_path = str(db_path or Utils().get_cache_dir() / 'previews.sqlite3')
+        self.max_bytes = max_bytes
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        """Open a connection to the cache database"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def get(self, key):
+        """Get the cached (mimetype, data) for key, or None"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT mimetype, data FROM previews WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE previews SET accessed = ? WHERE key = ? AND accessed < ?',
+                             (now, key, now - TOUCH_INTERVAL))
+                conn.commit()
+        finally:
+            conn.close()
+        return row
+    
+    def put(self, key, mimetype, data):
+        """Store a preview, evicting the least recently used once over max_bytes"""
+        conn = self._connect()
+        try:
+            conn.execute('INSERT OR REPLACE INTO previews (key, mimetype, data, bytes, accessed) '
+                         'VALUES (?, ?, ?, ?, ?)', (key, mimetype, data, len(data) + len(key), time.time()))
+            total = conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM previews').fetchone()[0]
+            if total > self.max_bytes:
+                # Evict down to 90% so the next few puts don't evict again
+                excess = total - self.max_bytes * 9 // 10
+                evicted = []
+                for old_key, size in conn.execute('SELECT key, bytes FROM previews ORDER BY accessed').fetchall():
+                    if excess <= 0:
+                        break
+                    evicted.append((old_key,))
+                    excess -= size
+                conn.executemany('DELETE FROM previews WHERE key = ?', evicted)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class Previewer:
+    def __init__(self, cache=None):
+        """Initialize the previewer; without a cache every preview is made again"""
+        self.cache = cache
+    
+    def preview(self, path, size=THUMBNAIL_SIZE):
+        """Get (mimetype, data, etag) previewing a file, or None if it has no preview
+        
+        Images get a thumbnail no more than size pixels across, anything
+        else the first lines of text if it is not binary. Files that have
+        no preview are remembered too, so they are not read again.
+        """
+        path = os.fspath(path)
+        size = min(max(int(size), MIN_THUMBNAIL_SIZE), MAX_THUMBNAIL_SIZE)
+        stat = os.stat(path)
+        kind = preview_kind(path) or 'text'
+        variant = f"{kind}:{size}" if kind == 'image' else kind
+        key = blake2b(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}\0{variant}".encode('utf-8', 'surrogateescape'),
+                      digest_size=16).hexdigest()
+        
+        cached = None
+        if self.cache is not None:
+            try:
+                cached = self.cache.get(key)
+            except sqlite3.Error:
+                cached = None
+        if cached is None:
+            if kind == 'image':
+                made = image_thumbnail(path, size, stat.st_size)
+            else:
+                made = text_snippet(path)
+            cached = made or ('', b'')
+            if self.cache is not None:
+                try:
+                    self.cache.put(key, *cached)
+                except sqlite3.Error:
+                    pass
+        
+        mimetype, data = cached
+        if not mimetype:
+            return None
+        return mimetype, data, key
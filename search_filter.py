@@ -0,0 +1,85 @@
+"""
+Search Filter Module
+Criteria for file search: substring, glob and regex name patterns, extension
+categories, size and modification date ranges. Name criteria are checked
+from the directory entry alone, so a walk only stats the candidates.
+"""
+
+import fnmatch
+import os
+import re
+from utils import COMMON_FILE_EXTENSIONS
+
+
+class SearchFilter:
+    def __init__(self, text='', glob=None, regex=None, category=None,
+                 min_size=None, max_size=None, modified_after=None, modified_before=None):
+        """Initialize the filter; an entry must meet every criterion given
+        
+        text is a substring, glob a shell pattern for the whole name and
+        regex a regular expression searched in the name, all without regard
+        to case. category is a key of COMMON_FILE_EXTENSIONS. Sizes are in
+        bytes and dates are timestamps (modified_before is exclusive).
+        Category and size criteria only match files.
+        
+        Raises ValueError for an invalid regex or an unknown category.
+        """
+        self.text = text.lower() if text else ''
+        self.glob = glob or None
+        self.regex = regex or None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after
+        self.modified_before = modified_before
+        
+        self._name_tests = []
+        if self.glob:
+            self._name_tests.append(re.compile(fnmatch.translate(self.glob), re.IGNORECASE).match)
+        if self.regex:
+            try:
+                self._name_tests.append(re.compile(self.regex, re.IGNORECASE).search)
+            except re.error as e:
+                raise ValueError(f"Invalid regular expression: {e}")
+        
+        self.category = None
+        self.extensions = None
+        if category:
+            for name, extensions in COMMON_FILE_EXTENSIONS.items():
+                if name.lower() == category.lower():
+                    self.category = name
+                    self.extensions = frozenset(extensions)
+                    break
+            else:
+                raise ValueError(f"Unknown category: {category}")
+        
+        self.files_only = self.extensions is not None or min_size is not None or max_size is not None
+    
+    def match_name(self, name, is_dir):
+        """Check the criteria that need only the name and entry type (no stat call)"""
+        if is_dir and self.files_only:
+            return False
+        if self.text and self.text not in name.lower():
+            return False
+        if self.extensions is not None and os.path.splitext(name)[1].lower() not in self.extensions:
+            return False
+        for test in self._name_tests:
+            if test(name) is None:
+                return False
+        return True
+    
+    def match_stat(self, size, mtime):
+        """Check the size and date criteria; size is None for folders and special files"""
+        if self.min_size is not None and (size is None or size < self.min_size):
+            return False
+        if self.max_size is not None and (size is None or size > self.max_size):
+            return False
+        if self.modified_after is not None and mtime < self.modified_after:
+            return False
+        if self.modified_before is not None and mtime >= self.modified_before:
+            return False
+        return True
+    
+    def match(self, record):
+        """Check a compact (name, is_dir, size, mtime) record against every criterion"""
+        name, is_dir, size, mtime = record
+        return self.match_name(name, is_dir) and self.match_stat(size, mtime)
@@ -0,0 +1,196 @@
+"""
+Size Engine Module
+Calculates recursive directory sizes with os.scandir across a thread pool,
+memoizing per-directory totals keyed by (dev, inode, mtime)
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from stat import S_ISDIR, S_ISREG
+
+# Default number of directories scanned concurrently
+DEFAULT_WORKERS = 8
+
+# Number of directory records kept in the memo before the least recently used are evicted
+DEFAULT_CACHE_ENTRIES = 200000
+
+
+class DirectoryTotals:
+    __slots__ = ('files', 'size', 'links', 'subdirs')
+    
+    def __init__(self, files, size, links, subdirs):
+        """Initialize the totals of the entries directly inside one directory
+        
+        links holds (dev, inode, size) of files with more than one hard link
+        so they can be counted once; subdirs holds the names of subfolders.
+        """
+        self.files = files
+        self.size = size
+        self.links = links
+        self.subdirs = subdirs
+
+
+class SizeEngine:
+    def __init__(self, max_workers=DEFAULT_WORKERS, max_entries=DEFAULT_CACHE_ENTRIES):
+        """Initialize the engine with a worker pool and an empty memo"""
+        self.max_workers = max_workers
+        self.max_entries = max_entries
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='size')
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def _lookup(self, key):
+        """Get memoized totals for a (dev, inode, mtime) key"""
+        with self._lock:
+            totals = self._memo.get(key)
+            if totals is None:
+                self.misses += 1
+                return None
+            self._memo.move_to_end(key)
+            self.hits += 1
+            return totals
+    
+    def _store(self, key, totals):
+        """Memoize totals, evicting the least recently used records"""
+        with self._lock:
+            self._memo[key] = totals
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+    
+    def invalidate(self):
+        """Forget every memoized directory"""
+        with self._lock:
+            self._memo.clear()
+    
+    def cache_info(self):
+        """Get memo statistics"""
+        with self._lock:
+            return {'entries': len(self._memo), 'hits': self.hits, 'misses': self.misses}
+    
+    def _scan(self, path, stat, root_dev):
+        """Get the totals of one directory and the (path, stat) of its subfolders (worker thread)"""
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+        totals = self._lookup(key)
+        
+        if totals is None:
+            files = size = 0
+            links = []
+            subdirs = []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            entry_stat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        mode = entry_stat.st_mode
+                        if S_ISDIR(mode):
+                            subdirs.append(entry.name)
+                        elif S_ISREG(mode):
+                            files += 1
+                            if entry_stat.st_nlink > 1:
+                                links.append((entry_stat.st_dev, entry_stat.st_ino, entry_stat.st_size))
+                            else:
+                                size += entry_stat.st_size
+            except OSError:
+                # Unreadable folders count as empty
+                return DirectoryTotals(0, 0, (), ()), []
+            
+            totals = DirectoryTotals(files, size, tuple(links), tuple(subdirs))
+            self._store(key, totals)
+        
+        children = []
+        for name in totals.subdirs:
+            child = os.path.join(path, name)
+            try:
+                child_stat = os.lstat(child)
+            except OSError:
+                continue
+            # Stay on one filesystem, and skip anything that stopped being a folder
+            if S_ISDIR(child_stat.st_mode) and (root_dev is None or child_stat.st_dev == root_dev):
+                children.append((child, child_stat))
+        return totals, children
+    
+    def measure_many(self, paths, one_filesystem=True, cancel_event=None, progress=None):
+        """Get combined totals for several files or folders
+        
+        Returns {'size', 'files', 'dirs'}. Files with several hard links are
+        counted once across all paths. progress, if given, is called as
+        progress(files, size) after each directory; setting cancel_event
+        stops the walk early with partial totals.
+        
+        A memoized folder is reused while its (dev, inode, mtime) is
+        unchanged, so a repeat query only stats subfolders. In-place growth
+        of an existing file is not noticed until its folder changes or the
+        memo is invalidated.
+        """
+        files = size = dirs = 0
+        seen_links = {}
+        pending = set()
+        
+        for path in paths:
+            path = os.fspath(path)
+            try:
+                stat = os.lstat(path)
+            except OSError:
+                continue
+            
+            if S_ISDIR(stat.st_mode):
+                root_dev = stat.st_dev if one_filesystem else None
+                pending.add(self._pool.submit(self._scan, path, stat, root_dev))
+                dirs += 1
+            elif S_ISREG(stat.st_mode):
+                files += 1
+                if stat.st_nlink > 1:
+                    seen_links[(stat.st_dev, stat.st_ino)] = stat.st_size
+                else:
+                    size += stat.st_size
+        
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                for future in pending:
+                    future.cancel()
+                break
+            
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                totals, children = future.result()
+                files += totals.files
+                size += totals.size
+                for dev, ino, link_size in totals.links:
+                    seen_links[(dev, ino)] = link_size
+                dirs += len(children)
+                for child, child_stat in children:
+                    root_dev = child_stat.st_dev if one_filesystem else None
+                    pending.add(self._pool.submit(self._scan, child, child_stat, root_dev))
+            
+            if progress is not None and done:
+                progress(files, size + sum(seen_links.values()))
+        
+        return {'size': size + sum(seen_links.values()), 'files': files, 'dirs': dirs}
+    
+    def measure(self, path, one_filesystem=True, cancel_event=None, progress=None):
+        """Get {'size', 'files', 'dirs'} totals for one file or folder"""
+        return self.measure_many([path], one_filesystem, cancel_event, progress)
+    
+    def directory_size(self, path):
+        """Get the total size in bytes of everything below path"""
+        return self.measure(path)['size']
+
+
+_shared_engine = None
+_shared_lock = threading.Lock()
+
+
+def get_size_engine():
+    """Get the process-wide size engine, so every caller shares one memo"""
+    global _shared_engine
+    with _shared_lock:
+        if _shared_engine is None:
+            _shared_engine = SizeEngine()
+        return _shared_engine
@@ -0,0 +1,453 @@
+"""
+Text Viewer Module
+Pages through large text files by byte offset or line number without reading
+them whole. Files are read with pread through a small window rather than
+memory-mapped, so a log truncated mid-read can't crash the process; line
+numbers come from a sparse index of one (offset, line) checkpoint per
+megabyte, built only as far as a request needs and cached in memory and
+SQLite; the end of a file is found by scanning back from its last byte; and
+appended lines can be followed like tail -f.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from utils import Utils
+
+# Bytes between line index checkpoints, and scanned per step while building
+INDEX_BLOCK = 1024 * 1024
+
+# Lines returned per page by default and at most
+PAGE_LINES = 200
+MAX_PAGE_LINES = 5000
+
+# Longer lines are cut to this many bytes
+MAX_LINE_BYTES = 16 * 1024
+
+# Line indexes kept in memory, least recently used dropped first
+MAX_INDEXES = 32
+
+# Bytes per pread when searching a file for line breaks
+READ_BLOCK = 64 * 1024
+
+# A page read is restarted this many times if the file shrinks under it
+PAGE_ATTEMPTS = 3
+
+# Following: seconds between size checks, bytes read per event and seconds between heartbeats
+FOLLOW_INTERVAL = 0.5
+FOLLOW_CHUNK = 256 * 1024
+FOLLOW_HEARTBEAT = 15.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS line_index (
+    path TEXT PRIMARY KEY,
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    scanned INTEGER NOT NULL,
+    lines INTEGER NOT NULL,
+    offsets BLOB NOT NULL,
+    numbers BLOB NOT NULL
+);
+"""
+
+
+def decode_line(data):
+    """Decode one line for display, cutting it at MAX_LINE_BYTES"""
+    return data[:MAX_LINE_BYTES].decode('utf-8', errors='replace').rstrip('\r')
+
+
+class FileShrank(OSError):
+    """Raised when a file gets shorter while it is being read"""
+
+
+class FileBuffer:
+    def __init__(self, fd, size):
+        """Initialize a read-only view of the first size bytes of an open file
+        
+        Supports the parts of the mmap interface the viewer uses (indexing,
+        slicing, find and rfind of one byte) with os.pread, keeping the
+        last block read. Where an mmap would raise SIGBUS past the end of
+        a file truncated under it, this raises FileShrank.
+        """
+        self.fd = fd
+        self.size = size
+        self._start = 0
+        self._data = b''
+    
+    def _pread(self, start, end):
+        """Read bytes [start, end), which must all still be in the file"""
+        data = os.pread(self.fd, end - start, start)
+        if len(data) < end - start:
+            raise FileShrank(f"File shrank below {end} bytes while being read")
+        return data
+    
+    def _block(self, pos):
+        """Get (start, data) of the READ_BLOCK-aligned block holding pos"""
+        if not self._start <= pos < self._start + len(self._data):
+            start = pos - pos % READ_BLOCK
+            self._data = self._pread(start, min(start + READ_BLOCK, self.size))
+            self._start = start
+        return self._start, self._data
+    
+    def __len__(self):
+        return self.size
+    
+    def __getitem__(self, key):
+        """Get one byte as an int, or a slice as bytes, like an mmap"""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            if start >= stop:
+                return b''
+            if self._start <= start and stop <= self._start + len(self._data):
+                return self._data[start - self._start:stop - self._start:step]
+            return self._pread(start, stop)[::step]
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError('FileBuffer index out of range')
+        start, data = self._block(key)
+        return data[key - start]
+    
+    def find(self, byte, start, end):
+        """Get the lowest position of byte in [start, end), or -1"""
+        pos = max(start, 0)
+        end = min(end, self.size)
+        while pos < end:
+            block_start, data = self._block(pos)
+            found = data.find(byte, pos - block_start, end - block_start)
+            if found != -1:
+                return block_start + found
+            pos = block_start + len(data)
+        return -1
+    
+    def rfind(self, byte, start, end):
+        """Get the highest position of byte in [start, end), or -1"""
+        start = max(start, 0)
+        pos = min(end, self.size)
+        while pos > start:
+            block_start, data = self._block(pos - 1)
+            found = data.rfind(byte, max(start - block_start, 0), pos - block_start)
+            if found != -1:
+                return block_start + found
+            pos = block_start
+        return -1
+
+
+class LineIndex:
+    def __init__(self, key, scanned=0, lines=0, offsets=None, numbers=None):
+        """Initialize an index of the file identified by key (dev, inode)
+        
+        Checkpoint i says line numbers[i] (counted from 0) starts at byte
+        offsets[i]; lines is the number of newlines in the first scanned
+        bytes. saved is how far the stored copy reaches; an index is
+        created either empty or from the store.
+        """
+        self.key = key
+        self.scanned = scanned
+        self.saved = scanned
+        self.lines = lines
+        self.offsets = offsets if offsets is not None else array('Q', [0])
+        self.numbers = numbers if numbers is not None else array('Q', [0])
+        self.lock = threading.Lock()
+    
+    def valid(self, buffer, size):
+        """Whether the index still fits the file: not truncated, last checkpoint still a line start"""
+        if size < self.scanned:
+            return False
+        last = self.offsets[-1]
+        return last == 0 or (last <= size and buffer[last - 1] == 0x0A)
+    
+    def extend(self, buffer, size, until_line=None):
+        """Scan on until line until_line has started or the end is reached; returns True if it grew"""
+        pos = self.scanned
+        start = pos
+        while pos < size and (until_line is None or self.lines <= until_line):
+            end = min(pos + INDEX_BLOCK, size)
+            last = buffer.rfind(b'\n', pos, end)
+            if last != -1:
+                self.lines += buffer[pos:last + 1].count(b'\n')
+                line_start = last + 1
+                if line_start - self.offsets[-1] >= INDEX_BLOCK:
+                    self.offsets.append(line_start)
+                    self.numbers.append(self.lines)
+                # Continue from the line start, so newlines are never counted twice
+                end = line_start
+            pos = end
+            # Kept current, so a read that fails part way leaves a consistent index
+            self.scanned = pos
+        return pos != start
+    
+    def line_offset(self, buffer, size, line):
+        """Get the byte offset where line (from 0) starts, or None if the file has fewer lines"""
+        self.extend(buffer, size, until_line=line)
+        index = bisect_right(self.numbers, line) - 1
+        pos = self.offsets[index]
+        for _ in range(line - self.numbers[index]):
+            newline = buffer.find(b'\n', pos, size)
+            if newline == -1:
+                return None
+            pos = newline + 1
+        return pos if pos < size or line == 0 else None
+    
+    def line_number(self, buffer, offset):
+        """Get the number (from 0) of the line starting at offset, or None if not scanned that far"""
+        if offset > self.scanned:
+            return None
+        index = bisect_right(self.offsets, offset) - 1
+        return self.numbers[index] + buffer[self.offsets[index]:offset].count(b'\n')
+
+
+class LineIndexStore:
+    def __init__(self, db_path=None):
+        """Initialize the store, creating the database under the cache dir if needed"""
+        self.db_path = str(db_path or Utils().get_cache_dir() / 'line_index.sqlite3')
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        """Open a connection to the store database"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def load(self, path):
+        """Get the saved index of path, or None"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT dev, ino, scanned, lines, offsets, numbers FROM line_index WHERE path = ?',
+                               (path,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        dev, ino, scanned, lines, offsets, numbers = row
+        return LineIndex((dev, ino), scanned, lines, array('Q', offsets), array('Q', numbers))
+    
+    def save(self, path, index):
+        """Save the index of path"""
+        conn = self._connect()
+        try:
+            conn.execute('INSERT OR REPLACE INTO line_index (path, dev, ino, scanned, lines, offsets, numbers) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (path, index.key[0], index.key[1], index.scanned, index.lines,
+                          index.offsets.tobytes(), index.numbers.tobytes()))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class TextViewer:
+    def __init__(self, store=None, max_indexes=MAX_INDEXES):
+        """Initialize the viewer; store, if given, keeps line indexes between runs"""
+        self.store = store
+        self.max_indexes = max_indexes
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def page(self, path, line=None, offset=None, before=None, tail=False, count=PAGE_LINES):
+        """Read one page of lines from a text file
+        
+        The page starts at line (from 1), at the first line starting at
+        or after byte offset, ends just before byte offset before, or is
+        the last count lines with tail. Returns {'path', 'size', 'offset',
+        'next_offset', 'lines', 'first_line', 'total_lines', 'eof'};
+        first_line is None when it would take indexing the file that far
+        (tail and paging backwards never index), and total_lines is None
+        until the whole file has been indexed.
+        """
+        path = os.path.abspath(path)
+        count = min(max(int(count), 1), MAX_PAGE_LINES)
+        with open(path, 'rb') as f:
+            for attempt in range(PAGE_ATTEMPTS):
+                try:
+                    return self._page(path, f, line, offset, before, tail, count)
+                except FileShrank:
+                    # Truncated under us (e.g. logrotate copytruncate): start over at the new size
+                    with self._lock:
+                        self._indexes.pop(path, None)
+            raise FileShrank("File keeps shrinking while being read")
+    
+    def _page(self, path, f, line, offset, before, tail, count):
+        """Read one page from the open file f at its current size; see page()"""
+        stat = os.fstat(f.fileno())
+        size = stop = stat.st_size
+        if size == 0:
+            return {'path': path, 'size': 0, 'offset': 0, 'next_offset': 0, 'lines': [],
+                    'first_line': 1, 'total_lines': 0, 'eof': True}
+        buffer = FileBuffer(f.fileno(), size)
+        index = self._index(path, stat, buffer, size)
+        with index.lock:
+            if line is not None:
+                start = index.line_offset(buffer, size, max(int(line), 1) - 1)
+                start = size if start is None else start
+            elif tail:
+                start = self._back(buffer, size, count)
+            elif before is not None:
+                # Paging back stops where the previous page began
+                stop = min(max(int(before), 0), size)
+                start = self._back(buffer, stop, count)
+            else:
+                start = self._align(buffer, size, min(max(int(offset or 0), 0), size))
+            
+            lines, next_offset = self._read(buffer, stop, start, count)
+            first_line = index.line_number(buffer, start)
+            total_lines = None
+            if index.scanned >= size:
+                total_lines = index.lines + (0 if buffer[size - 1] == 0x0A else 1)
+        self._save(path, index)
+        
+        return {
+            'path': path,
+            'size': size,
+            'offset': start,
+            'next_offset': next_offset,
+            'lines': lines,
+            'first_line': first_line + 1 if first_line is not None else None,
+            'total_lines': total_lines,
+            'eof': next_offset >= size
+        }
+    
+    def _index(self, path, stat, buffer, size):
+        """Get the line index of a file, from memory, the store or new"""
+        key = (stat.st_dev, stat.st_ino)
+        with self._lock:
+            index = self._indexes.get(path)
+            if index is not None:
+                self._indexes.move_to_end(path)
+        if index is None and self.store is not None:
+            try:
+                index = self.store.load(path)
+            except sqlite3.Error:
+                index = None
+        # A rotated, truncated or rewritten file is indexed again
+        if index is None or index.key != key or not index.valid(buffer, size):
+            index = LineIndex(key)
+        with self._lock:
+            self._indexes[path] = index
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return index
+    
+    def _save(self, path, index):
+        """Save an index that grew by a block or more since it was last saved"""
+        if self.store is None or index.scanned - index.saved < INDEX_BLOCK:
+            return
+        try:
+            self.store.save(path, index)
+            index.saved = index.scanned
+        except sqlite3.Error:
+            pass
+    
+    @staticmethod
+    def _align(buffer, size, offset):
+        """Get offset if a line starts there, else the start of the next line"""
+        if offset == 0 or buffer[offset - 1] == 0x0A:
+            return offset
+        newline = buffer.find(b'\n', offset, size)
+        return size if newline == -1 else newline + 1
+    
+    @staticmethod
+    def _back(buffer, end, count):
+        """Get the start of the count-th line before byte end, scanning backwards"""
+        if end == 0:
+            return 0
+        # A newline just before end closes the line before it, not one more line
+        pos = end - 1 if buffer[end - 1] == 0x0A else end
+        for _ in range(count):
+            newline = buffer.rfind(b'\n', 0, pos)
+            if newline == -1:
+                return 0
+            pos = newline
+        return pos + 1
+    
+    @staticmethod
+    def _read(buffer, size, start, count):
+        """Read up to count lines from start to byte size; returns (lines, offset after the last)"""
+        lines = []
+        pos = start
+        while pos < size and len(lines) < count:
+            newline = buffer.find(b'\n', pos, size)
+            end = size if newline == -1 else newline
+            lines.append(decode_line(buffer[pos:min(end, pos + MAX_LINE_BYTES)]))
+            pos = end + 1
+        return lines, min(pos, size)
+    
+    def follow(self, path, offset=None, stop_event=None):
+        """Yield lines appended to a file, like tail -f
+        
+        Starts at offset, or at the start of the last, unfinished line
+        (the end of the file if it ends with a newline). Yields
+        {'offset', 'lines', 'next_offset'} as complete lines appear,
+        {'reset': True, ...} starting again from 0 when the file is
+        truncated or replaced, and None every FOLLOW_HEARTBEAT seconds
+        so the caller can check its client is still there. The file is
+        opened before this returns, so a file that cannot be read raises
+        OSError here rather than from the first next().
+        """
+        path = os.path.abspath(path)
+        return self._follow(path, open(path, 'rb'), offset, stop_event)
+    
+    def _follow(self, path, f, offset, stop_event):
+        """Generator behind follow(); closes f when done"""
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if offset is None:
+                # Begin with the line being written, if it isn't finished yet
+                f.seek(max(size - FOLLOW_CHUNK, 0))
+                data = f.read(size - f.tell())
+                last = data.rfind(b'\n')
+                if last != -1:
+                    offset = size - len(data) + last + 1
+                else:
+                    offset = 0 if size <= FOLLOW_CHUNK else size
+            offset = min(max(int(offset), 0), size)
+            heartbeat = time.monotonic()
+            
+            while stop_event is None or not stop_event.is_set():
+                stat = os.fstat(f.fileno())
+                try:
+                    current = os.stat(path)
+                except OSError:
+                    current = stat
+                if (current.st_dev, current.st_ino) != (stat.st_dev, stat.st_ino):
+                    # Rotated: follow the new file from its start
+                    f.close()
+                    f = open(path, 'rb')
+                    offset = 0
+                    yield {'reset': True, 'offset': 0, 'lines': [], 'next_offset': 0}
+                    continue
+                if stat.st_size < offset:
+                    offset = 0
+                    yield {'reset': True, 'offset': 0, 'lines': [], 'next_offset': 0}
+                
+                if stat.st_size > offset:
+                    f.seek(offset)
+                    data = f.read(min(FOLLOW_CHUNK, stat.st_size - offset))
+                    last = data.rfind(b'\n')
+                    if last == -1 and len(data) == FOLLOW_CHUNK:
+                        # One very long line: pass it on in pieces
+                        last = len(data) - 1
+                    if last != -1:
+                        lines = [decode_line(line) for line in data[:last + 1].split(b'\n')[:-1]] or \
+                            [decode_line(data[:last + 1])]
+                        yield {'offset': offset, 'lines': lines, 'next_offset': offset + last + 1}
+                        offset += last + 1
+                        heartbeat = time.monotonic()
+                        continue
+                
+                if time.monotonic() - heartbeat >= FOLLOW_HEARTBEAT:
+                    heartbeat = time.monotonic()
+                    yield None
+                time.sleep(FOLLOW_INTERVAL)
+        finally:
+            f.close()
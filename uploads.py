@@ -0,0 +1,247 @@
+"""
+Chunked Uploads Module
+Resumable uploads written in chunks straight into a preallocated file next
+to the target, then renamed into place atomically
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from move_planner import rename_noreplace
+from utils import Utils
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: upload state updates are only serialised between threads
+    fcntl = None
+
+# Largest chunk accepted in one request
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Size of reads from the request stream
+COPY_BUFFER = 1024 * 1024
+
+# Unfinished uploads are discarded after this many seconds without activity
+UPLOAD_TTL = 24 * 3600
+
+# Free names tried when committing, if each is taken before the rename lands
+COMMIT_ATTEMPTS = 10
+
+
+class UploadError(Exception):
+    """Raised for invalid upload requests"""
+
+
+class UploadNotFound(UploadError):
+    """Raised when an upload id is unknown or has expired"""
+
+
+def merge_ranges(ranges, start, end):
+    """Add the byte range [start, end) to a sorted list of [start, end) ranges"""
+    merged = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+class UploadManager:
+    def __init__(self, state_dir=None):
+        """Initialize the manager; upload state is kept as JSON under the cache dir"""
+        self.utils = Utils()
+        self.state_dir = Path(state_dir) if state_dir else self.utils.get_cache_dir('uploads')
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+    
+    def _state_path(self, upload_id):
+        """Get the state file of an upload, rejecting malformed ids"""
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadNotFound("Upload not found")
+        return self.state_dir / f"{upload_id}.json"
+    
+    @contextmanager
+    def _upload_lock(self, upload_id):
+        """Hold an upload's state against other threads and, where supported, other processes"""
+        path = self._state_path(upload_id)
+        if not path.exists():
+            # Don't leave lock files behind for unknown ids
+            raise UploadNotFound("Upload not found")
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(path.with_suffix('.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+    
+    def _remove_state(self, upload_id):
+        """Delete an upload's state and lock files (holding its lock)"""
+        path = self._state_path(upload_id)
+        path.unlink()
+        try:
+            path.with_suffix('.lock').unlink()
+        except FileNotFoundError:
+            pass
+    
+    def _load(self, upload_id):
+        """Read an upload's state"""
+        try:
+            with open(self._state_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadNotFound("Upload not found")
+    
+    def _save(self, state):
+        """Write an upload's state atomically"""
+        path = self._state_path(state['id'])
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    
+    def prune(self):
+        """Remove uploads that have been idle for longer than UPLOAD_TTL"""
+        cutoff = time.time() - UPLOAD_TTL
+        for path in self.state_dir.glob('*.json'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    self.abort(path.stem)
+            except (OSError, UploadError):
+                continue
+    
+    def create(self, directory, filename, size):
+        """Start an upload of size bytes into directory and preallocate its file"""
+        directory = Path(directory)
+        filename = self.utils.sanitize_filename(os.path.basename(filename or ''))
+        if not self.utils.is_valid_filename(filename):
+            raise UploadError("Invalid file name")
+        if not directory.is_dir():
+            raise UploadError("Target directory not found")
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            raise UploadError("Upload size is required")
+        if size < 0:
+            raise UploadError("Upload size must not be negative")
+        
+        self.prune()
+        
+        upload_id = uuid.uuid4().hex
+        # The partial file lives in the target directory so the final rename is atomic
+        part_path = directory / f".{filename}.{upload_id}.part"
+        fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            if size and hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:
+                    os.ftruncate(fd, size)
+            else:
+                os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+        
+        state = {
+            'id': upload_id,
+            'directory': str(directory),
+            'filename': filename,
+            'part_path': str(part_path),
+            'size': size,
+            'received': [],
+            'created': time.time()
+        }
+        self._save(state)
+        return self.status(upload_id, state)
+    
+    def status(self, upload_id, state=None):
+        """Get an upload's progress, including the next offset to send"""
+        state = state or self._load(upload_id)
+        received = state['received']
+        next_offset = received[0][1] if received and received[0][0] == 0 else 0
+        return {
+            'id': state['id'],
+            'filename': state['filename'],
+            'directory': state['directory'],
+            'size': state['size'],
+            'received': received,
+            'received_bytes': sum(end - start for start, end in received),
+            'next_offset': next_offset,
+            'complete': next_offset >= state['size']
+        }
+    
+    def write_chunk(self, upload_id, offset, stream, length):
+        """Write length bytes from stream at offset straight into the partial file"""
+        state = self._load(upload_id)
+        try:
+            offset = int(offset)
+            length = int(length)
+        except (TypeError, ValueError):
+            raise UploadError("Chunk offset and length are required")
+        if offset < 0 or length < 0 or offset + length > state['size']:
+            raise UploadError("Chunk is outside the upload")
+        if length > MAX_CHUNK_SIZE:
+            raise UploadError("Chunk is too large")
+        
+        written = 0
+        with open(state['part_path'], 'r+b') as f:
+            f.seek(offset)
+            while written < length:
+                data = stream.read(min(COPY_BUFFER, length - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+        
+        # Record whatever arrived, so a dropped connection resumes where it stopped; chunks of
+        # one upload may be written by several server processes at once
+        with self._upload_lock(upload_id):
+            state = self._load(upload_id)
+            if written:
+                state['received'] = merge_ranges(state['received'], offset, offset + written)
+            self._save(state)
+        
+        if written < length:
+            raise UploadError(f"Chunk ended early after {written} of {length} bytes")
+        return self.status(upload_id, state)
+    
+    def commit(self, upload_id, file_ops):
+        """Finish an upload by renaming the partial file into place"""
+        with self._upload_lock(upload_id):
+            state = self._load(upload_id)
+            status = self.status(upload_id, state)
+            if not status['complete']:
+                raise UploadError(f"Upload incomplete: {status['received_bytes']} of {state['size']} bytes received")
+            
+            with open(state['part_path'], 'r+b') as f:
+                os.fsync(f.fileno())
+            
+            wanted = Path(state['directory']) / state['filename']
+            for attempt in range(COMMIT_ATTEMPTS):
+                target = file_ops.get_free_destination(wanted)
+                try:
+                    rename_noreplace(state['part_path'], target)
+                    break
+                except FileExistsError:
+                    # Created since it was checked, perhaps by another process; never replace it
+                    continue
+            else:
+                raise UploadError(f"Cannot find a free name for {state['filename']}")
+            self._remove_state(upload_id)
+            return {'path': str(target), 'name': target.name, 'size': state['size']}
+    
+    def abort(self, upload_id):
+        """Cancel an upload and remove its partial file"""
+        with self._upload_lock(upload_id):
+            state = self._load(upload_id)
+            try:
+                os.unlink(state['part_path'])
+            except FileNotFoundError:
+                pass
+            self._remove_state(upload_id)
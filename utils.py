@@ -8,6 +8,63 @@ import sys
 from datetime import datetime
 from pathlib import Path
 import re
+import time
+from functools import lru_cache
+from size_engine import get_size_engine
+
+# Units used by format_size, one per power of 1024
+SIZE_UNITS = ("B", "KB", "MB", "GB", "TB", "PB")
+
+# Sizes below 1 KB are formatted by lookup
+SMALL_SIZES = tuple(f"{n} B" for n in range(1024))
+
+# Icons keyed by lowercase extension
+EXTENSION_ICONS = {
+    '.txt': '📄',
+    '.doc': '📝',
+    '.docx': '📝',
+    '.pdf': '📕',
+    '.jpg': '🖼️',
+    '.jpeg': '🖼️',
+    '.png': '🖼️',
+    '.gif': '🖼️',
+    '.mp3': '🎵',
+    '.wav': '🎵',
+    '.mp4': '🎬',
+    '.avi': '🎬',
+    '.zip': '📦',
+    '.rar': '📦',
+    '.exe': '⚙️',
+    '.py': '🐍',
+    '.js': '📜',
+    '.html': '🌐',
+    '.css': '🎨'
+}
+
+# Extension groups offered as filters
+COMMON_FILE_EXTENSIONS = {
+    'Images': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.webp'],
+    'Documents': ['.txt', '.doc', '.docx', '.pdf', '.rtf', '.odt'],
+    'Audio': ['.mp3', '.wav', '.ogg', '.m4a', '.flac', '.aac'],
+    'Video': ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv'],
+    'Archives': ['.zip', '.rar', '.7z', '.tar', '.gz', '.bz2'],
+    'Code': ['.py', '.js', '.html', '.css', '.cpp', '.java', '.php']
+}
+
+@lru_cache(maxsize=16384)
+def size_bucket_text(unit, tenths):
+    """Format a size given in tenths of a unit, e.g. (1, 15) -> '1.5 KB'"""
+    return f"{tenths / 10:.1f} {SIZE_UNITS[unit]}"
+
+@lru_cache(maxsize=16384)
+def minute_text(minute):
+    """Format the local time of a minute counted from the epoch"""
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(minute * 60))
+
+@lru_cache(maxsize=16384)
+def datetime_text(year, month, day, hour, minute):
+    """Format a datetime down to the minute"""
+    return f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{minute:02d}"
 
 class Utils:
     def __init__(self):
@@ -19,21 +76,22 @@ class Utils:
         if size_bytes is None:
             return ""
         
-        if size_bytes == 0:
-            return "0 B"
+        if 0 <= size_bytes < 1024:
+            return SMALL_SIZES[int(size_bytes)]
+        if size_bytes < 0:
+            return f"{int(size_bytes)} B"
         
-        size_names = ["B", "KB", "MB", "GB", "TB", "PB"]
-        i = 0
-        size = float(size_bytes)
-        
-        while size >= 1024.0 and i < len(size_names) - 1:
-            size /= 1024.0
-            i += 1
-        
-        if i == 0:
-            return f"{int(size)} {size_names[i]}"
-        else:
-            return f"{size:.1f} {size_names[i]}"
+        # The unit follows from the bit length; the text is cached per tenth of a unit
+        unit = min((int(size_bytes).bit_length() - 1) // 10, len(SIZE_UNITS) - 1)
+        return size_bucket_text(unit, round(size_bytes * 10 / (1 << (10 * unit))))
+    
+    def parse_size(self, text):
+        """Parse a size like '1500', '10 KB' or '2.5G' into bytes; raises ValueError"""
+        match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgtp]?)b?\s*', str(text), re.IGNORECASE)
+        if match is None:
+            raise ValueError(f"Invalid size: {text}")
+        unit = 'bkmgtp'.index(match.group(2).lower() or 'b')
+        return int(float(match.group(1)) * (1 << (10 * unit)))
     
     def format_datetime(self, dt):
         """Format datetime in a user-friendly format"""
@@ -41,10 +99,57 @@ class Utils:
             return ""
         
         if isinstance(dt, datetime):
-            return dt.strftime('%Y-%m-%d %H:%M')
+            return datetime_text(dt.year, dt.month, dt.day, dt.hour, dt.minute)
         
         return str(dt)
     
+    def format_timestamp(self, timestamp):
+        """Format a raw st_mtime like format_datetime, cached per minute"""
+        if timestamp is None:
+            return ""
+        return minute_text(int(timestamp // 60))
+    
+    def format_sizes(self, sizes):
+        """Format a whole column of sizes at once"""
+        format_size = self.format_size
+        return [format_size(size) for size in sizes]
+    
+    def format_timestamps(self, timestamps):
+        """Format a whole column of raw st_mtime values at once
+        
+        Rows from the same minute share one lookup, which makes columns of
+        files written together nearly free.
+        """
+        texts = {}
+        result = []
+        for timestamp in timestamps:
+            if timestamp is None:
+                result.append("")
+                continue
+            minute = int(timestamp // 60)
+            text = texts.get(minute)
+            if text is None:
+                text = texts[minute] = minute_text(minute)
+            result.append(text)
+        return result
+    
+    def get_cache_dir(self, *parts):
+        """Get (and create) a FilePilot cache directory
+        
+        FILEPILOT_CACHE_DIR overrides the location, otherwise the platform
+        cache directory is used (XDG_CACHE_HOME or ~/.cache on Unix).
+        """
+        base = os.environ.get('FILEPILOT_CACHE_DIR')
+        if not base:
+            if os.name == 'nt':  # Windows
+                base = os.path.join(os.environ.get('LOCALAPPDATA') or Path.home(), 'FilePilot', 'Cache')
+            else:
+                base = os.path.join(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache', 'filepilot')
+        
+        cache_dir = Path(base, *parts)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        return cache_dir
+    
     def is_valid_filename(self, filename):
         """Check if a filename is valid for the current OS"""
         if not filename or filename in ['.', '..']:
@@ -152,61 +257,25 @@ class Utils:
         if file_path.is_dir():
             return "📁"  # Folder icon
         
-        # File type icons based on extension
-        extension_icons = {
-            '.txt': '📄',
-            '.doc': '📝',
-            '.docx': '📝',
-            '.pdf': '📕',
-            '.jpg': '🖼️',
-            '.jpeg': '🖼️',
-            '.png': '🖼️',
-            '.gif': '🖼️',
-            '.mp3': '🎵',
-            '.wav': '🎵',
-            '.mp4': '🎬',
-            '.avi': '🎬',
-            '.zip': '📦',
-            '.rar': '📦',
-            '.exe': '⚙️',
-            '.py': '🐍',
-            '.js': '📜',
-            '.html': '🌐',
-            '.css': '🎨'
-        }
         
-        return extension_icons.get(file_path.suffix.lower(), '📄')
+        return EXTENSION_ICONS.get(file_path.suffix.lower(), '📄')
     
     def calculate_selection_stats(self, selected_paths):
         """Calculate statistics for selected items"""
         if not selected_paths:
             return {'count': 0, 'size': 0, 'folders': 0, 'files': 0}
         
-        total_size = 0
         folder_count = 0
         file_count = 0
         
         for path in selected_paths:
-            path = Path(path)
-            
-            if path.is_dir():
+            if Path(path).is_dir():
                 folder_count += 1
-                # Calculate directory size
-                try:
-                    for sub_path in path.rglob('*'):
-                        if sub_path.is_file():
-                            try:
-                                total_size += sub_path.stat().st_size
-                            except (OSError, PermissionError):
-                                continue
-                except (OSError, PermissionError):
-                    continue
             else:
                 file_count += 1
-                try:
-                    total_size += path.stat().st_size
-                except (OSError, PermissionError):
-                    continue
+        
+        # One walk over the whole selection through the shared, memoized size engine
+        total_size = get_size_engine().measure_many(selected_paths)['size']
         
         return {
             'count': len(selected_paths),
@@ -217,14 +286,7 @@ class Utils:
     
     def get_common_file_extensions(self):
         """Get list of common file extensions for filtering"""
-        return {
-            'Images': ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.webp'],
-            'Documents': ['.txt', '.doc', '.docx', '.pdf', '.rtf', '.odt'],
-            'Audio': ['.mp3', '.wav', '.ogg', '.m4a', '.flac', '.aac'],
-            'Video': ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv'],
-            'Archives': ['.zip', '.rar', '.7z', '.tar', '.gz', '.bz2'],
-            'Code': ['.py', '.js', '.html', '.css', '.cpp', '.java', '.php']
-        }
+        return dict(COMMON_FILE_EXTENSIONS)
     
     def escape_filename_for_display(self, filename):
         """Escape filename for safe display in GUI"""
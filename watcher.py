@@ -0,0 +1,335 @@
+"""
+Directory Watcher Module
+Watches directories for changes (inotify on Linux, mtime polling elsewhere)
+and keeps per-directory listing caches current
+"""
+
+import os
+import struct
+import threading
+from collections import OrderedDict
+from file_operations import FileOperations
+
+# inotify event flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+# Watcher callbacks receive (directory, name, kind) where kind is one of:
+#   'change' - the entry called name in directory was created, deleted, renamed or modified
+#   'rescan' - directory changed in an unknown way (directory None means every directory)
+#   'gone'   - directory itself was deleted or moved away
+CHANGE = 'change'
+RESCAN = 'rescan'
+GONE = 'gone'
+
+
+class InotifyWatcher:
+    def __init__(self, callback):
+        """Initialize an inotify instance; raises OSError where inotify isn't available"""
+        import ctypes
+        import ctypes.util
+        
+        self.callback = callback
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        
+        self._lock = threading.Lock()
+        self._paths = {}  # watch descriptor -> directory
+        self._watches = {}  # directory -> watch descriptor
+    
+    def watch(self, path):
+        """Start watching a directory; returns False if the watch can't be added"""
+        path = os.path.abspath(path)
+        with self._lock:
+            if path in self._watches:
+                return True
+            
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                return False
+            
+            self._watches[path] = wd
+            self._paths[wd] = path
+            return True
+    
+    def unwatch(self, path):
+        """Stop watching a directory"""
+        path = os.path.abspath(path)
+        with self._lock:
+            wd = self._watches.pop(path, None)
+            if wd is not None:
+                self._paths.pop(wd, None)
+                self._libc.inotify_rm_watch(self._fd, wd)
+    
+    def poll(self, paths=None):
+        """Read every queued event without blocking and dispatch it to the callback
+        
+        Events are queued by the kernel as changes happen, so polling right
+        before serving a listing never misses a change. paths is ignored.
+        """
+        events = []
+        with self._lock:
+            while True:
+                try:
+                    data = os.read(self._fd, 65536)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    break
+                if not data:
+                    break
+                
+                offset = 0
+                while offset < len(data):
+                    wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                    offset += EVENT_HEADER.size
+                    name = data[offset:offset + length].rstrip(b'\0')
+                    offset += length
+                    events.append(self._translate(wd, mask, os.fsdecode(name) if name else None))
+        
+        for event in events:
+            if event is not None:
+                self.callback(*event)
+    
+    def _translate(self, wd, mask, name):
+        """Turn a raw inotify event into a (directory, name, kind) callback event"""
+        if mask & IN_Q_OVERFLOW:
+            return (None, None, RESCAN)
+        
+        directory = self._paths.get(wd)
+        if directory is None:
+            return None
+        
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+            if mask & IN_IGNORED:
+                self._paths.pop(wd, None)
+                self._watches.pop(directory, None)
+            return (directory, None, GONE)
+        
+        if name is None:
+            return (directory, None, RESCAN)
+        return (directory, name, CHANGE)
+    
+    def close(self):
+        """Close the inotify instance"""
+        with self._lock:
+            if self._fd >= 0:
+                os.close(self._fd)
+                self._fd = -1
+            self._paths.clear()
+            self._watches.clear()
+
+
+class PollingWatcher:
+    def __init__(self, callback):
+        """Initialize a watcher that compares directory mtimes when polled"""
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._mtimes = {}  # directory -> last seen mtime
+    
+    def watch(self, path):
+        """Start watching a directory"""
+        path = os.path.abspath(path)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return False
+        
+        with self._lock:
+            self._mtimes.setdefault(path, mtime)
+        return True
+    
+    def unwatch(self, path):
+        """Stop watching a directory"""
+        with self._lock:
+            self._mtimes.pop(os.path.abspath(path), None)
+    
+    def poll(self, paths=None):
+        """Stat watched directories (or just paths) and report the ones that changed
+        
+        A directory's mtime only moves when entries are added, removed or
+        renamed, so in-place file modifications are not seen in this mode.
+        """
+        with self._lock:
+            if paths is None:
+                paths = list(self._mtimes)
+            else:
+                paths = [os.path.abspath(p) for p in paths if os.path.abspath(p) in self._mtimes]
+        
+        events = []
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                mtime = None
+            
+            with self._lock:
+                if path not in self._mtimes or self._mtimes[path] == mtime:
+                    continue
+                if mtime is None:
+                    del self._mtimes[path]
+                    events.append((path, None, GONE))
+                else:
+                    self._mtimes[path] = mtime
+                    events.append((path, None, RESCAN))
+        
+        for event in events:
+            self.callback(*event)
+    
+    def close(self):
+        """Forget every watched directory"""
+        with self._lock:
+            self._mtimes.clear()
+
+
+def create_watcher(callback):
+    """Create the best watcher for this platform, falling back to mtime polling"""
+    try:
+        return InotifyWatcher(callback)
+    except (OSError, AttributeError):
+        return PollingWatcher(callback)
+
+
+class CachedListing:
+    __slots__ = ('records', 'ordered', 'dirty', 'stale')
+    
+    def __init__(self, records):
+        """Initialize a cached listing from compact directory records"""
+        self.records = {record[0]: record for record in records}
+        self.ordered = records
+        self.dirty = set()
+        self.stale = False
+
+
+class ListingCache:
+    def __init__(self, file_ops=None, max_directories=256, watcher=None):
+        """Initialize the cache; each cached directory is watched until evicted"""
+        self.file_ops = file_ops or FileOperations()
+        self.max_directories = max_directories
+        self._lock = threading.RLock()
+        self._listings = OrderedDict()
+        self._listeners = []
+        self.watcher = watcher or create_watcher(self._on_event)
+    
+    def add_listener(self, callback):
+        """Forward watcher events to callback(directory, name, kind) as well"""
+        self._listeners.append(callback)
+    
+    def _on_event(self, directory, name, kind):
+        """Invalidate exactly what a watcher event touched"""
+        with self._lock:
+            if directory is None:
+                for listing in self._listings.values():
+                    listing.stale = True
+            elif kind == GONE:
+                self._listings.pop(directory, None)
+            else:
+                listing = self._listings.get(directory)
+                if listing is not None:
+                    if kind == CHANGE:
+                        listing.dirty.add(name)
+                    else:
+                        listing.stale = True
+        
+        for callback in self._listeners:
+            callback(directory, name, kind)
+    
+    def poll(self, paths=None):
+        """Apply pending watcher events"""
+        self.watcher.poll(paths)
+    
+    def invalidate(self, path=None):
+        """Drop one cached directory, or all of them"""
+        with self._lock:
+            if path is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(os.path.abspath(path), None)
+    
+    def get(self, path, on_batch=None):
+        """Get the sorted compact records for a directory
+        
+        Unchanged directories are served from memory; only entries named
+        by watcher events are re-stat'ed. The returned list is shared and
+        must not be modified. on_batch is passed to scan_directory when the
+        directory has to be read.
+        """
+        path = os.path.abspath(path)
+        self.poll([path])
+        
+        with self._lock:
+            listing = self._listings.get(path)
+            if listing is not None and not listing.stale:
+                self._listings.move_to_end(path)
+                self._apply_changes(path, listing)
+                return listing.ordered
+        
+        # Watch before scanning so changes made during the scan are queued
+        watched = self.watcher.watch(path)
+        try:
+            records = self.file_ops.scan_directory(path, on_batch)
+        except BaseException:
+            if watched:
+                self.watcher.unwatch(path)
+            raise
+        if not watched:
+            return records
+        
+        with self._lock:
+            listing = CachedListing(records)
+            self._listings[path] = listing
+            while len(self._listings) > self.max_directories:
+                evicted, _ = self._listings.popitem(last=False)
+                self.watcher.unwatch(evicted)
+        
+        self.poll([path])
+        with self._lock:
+            if listing.stale:
+                # Changed in an unknown way while scanning; scan once more
+                listing = CachedListing(self.file_ops.scan_directory(path))
+                self._listings[path] = listing
+            self._apply_changes(path, listing)
+            return listing.ordered
+    
+    def _apply_changes(self, path, listing):
+        """Re-stat the entries named by change events and re-sort if needed"""
+        if not listing.dirty:
+            return
+        
+        for name in listing.dirty:
+            record = self.file_ops.stat_record(os.path.join(path, name))
+            if record is None:
+                listing.records.pop(name, None)
+            else:
+                listing.records[name] = record
+        listing.dirty.clear()
+        
+        listing.ordered = sorted(listing.records.values(), key=lambda e: (not e[1], e[0].lower()))
+    
+    def close(self):
+        """Stop watching and drop every cached listing"""
+        with self._lock:
+            self._listings.clear()
+        self.watcher.close()
@@ -5,76 +5,398 @@ Provides HTTP endpoints for file management operations compatible with Autoscale
 
 import os
 import json
+import base64
+import sqlite3
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, send_file, session, stream_template
+from batch_operations import BatchRunner, MAX_BATCH_OPERATIONS
+from content_search import ContentSearch, check_pattern
+from delete_engine import StagedDelete
 from file_operations import FileOperations
-from utils import Utils
+from file_index import FileIndex
+from jobs import JobManager, JobStore
+from listing import Entry
+from previews import Previewer, PreviewCache, preview_kind, THUMBNAIL_SIZE
+from search_filter import SearchFilter
+from text_viewer import TextViewer, LineIndexStore, PAGE_LINES
+from uploads import UploadManager, UploadError, UploadNotFound
+from utils import Utils, COMMON_FILE_EXTENSIONS
+from watcher import ListingCache
 
 app = Flask(__name__)
+
+# Sessions are signed cookies; every worker must share the key to read them.
+# Without one set, a per-process key still works, but each worker forgets the
+# others' sessions (URLs carry the directory, so navigation keeps working).
+app.secret_key = os.environ.get('FILEPILOT_SECRET_KEY') or os.environ.get('SECRET_KEY') or os.urandom(32)
 file_ops = FileOperations()
 utils = Utils()
 
+try:
+    file_index = FileIndex()
+except (OSError, sqlite3.Error):
+    # No writable cache directory (e.g. serverless); search walks the disk instead
+    file_index = None
+
+try:
+    upload_manager = UploadManager()
+except OSError:
+    # No writable cache directory; only single-request uploads are available
+    upload_manager = None
+
+try:
+    preview_cache = PreviewCache()
+except (OSError, sqlite3.Error):
+    # No writable cache directory; previews are made on every request
+    preview_cache = None
+previewer = Previewer(preview_cache)
+
+try:
+    line_index_store = LineIndexStore()
+except (OSError, sqlite3.Error):
+    # No writable cache directory; line indexes last only as long as the process
+    line_index_store = None
+text_viewer = TextViewer(line_index_store)
+
+# A follow stream ends after this many seconds; the browser reconnects and resumes from its last event
+FOLLOW_STREAM_SECONDS = 300
+
+# Each follow stream holds a worker thread (see --threads in the Procfile); leave the rest for other requests
+FOLLOW_STREAM_LIMIT = 16
+follow_streams = threading.BoundedSemaphore(FOLLOW_STREAM_LIMIT)
+
+# Content search scans files in worker processes, started on the first search
+content_search = ContentSearch(file_ops=file_ops)
+
+# Long copy/move/delete/size operations run here instead of inside requests; their status
+# is shared through the cache directory, so any worker can report on or cancel any job
+try:
+    job_store = JobStore()
+except (OSError, sqlite3.Error):
+    # No writable cache directory; jobs are only visible to the worker running them
+    job_store = None
+job_manager = JobManager(file_ops, store=job_store)
+
+# Bulk delete/rename/create requests share one bounded worker pool
+batch_runner = BatchRunner(file_ops)
+
+# Cache listings of viewed directories; the watcher keeps them (and the index) current
+listing_cache = ListingCache(file_ops)
+file_ops.listing_cache = listing_cache
+if file_index is not None:
+    listing_cache.add_listener(file_index.directory_changed)
+
 # Add cache control headers to prevent caching issues
 @app.after_request
 def add_cache_control_headers(response):
-    """Add cache control headers to prevent browser caching"""
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
+    """Prevent browser caching of HTML views; downloads set their own validators"""
+    if response.mimetype == 'text/html':
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        response.headers['Pragma'] = 'no-cache'
+        response.headers['Expires'] = '0'
     return response
 
-# Global state to track current directory
-current_directory = Path.home()
+def request_directory(path=None):
+    """Get the directory a request works in
+
+    Navigation state travels with each request instead of living in the
+    process: an explicit path (from the URL or form) wins, then the
+    directory last viewed in this browser's signed session, then home.
+    An explicit path is returned even if it is not a directory, so
+    callers can report it.
+    """
+    if path:
+        return Path(path).resolve()
+    
+    last_path = session.get('current_directory')
+    if last_path and Path(last_path).is_dir():
+        return Path(last_path)
+    return Path.home()
+
+def remember_directory(directory):
+    """Store the directory being viewed in the session, for visits to / without a path"""
+    if session.get('current_directory') != str(directory):
+        session['current_directory'] = str(directory)
+
+# Directory listing API settings
+LISTING_SORT_KEYS = ('name', 'size', 'type', 'modified')
+LISTING_PAGE_SIZE = 500
+LISTING_MAX_PAGE_SIZE = 5000
+LISTING_STREAM_BATCH = 256
+
+# Name search bounds; results stream in discovery order until one is reached
+SEARCH_LIMIT = 1000
+SEARCH_MAX_LIMIT = 10000
+SEARCH_TIMEOUT = 10.0
+SEARCH_MAX_TIMEOUT = 60.0
+SEARCH_MATCH_MODES = ('substring', 'glob', 'regex')
+SEARCH_FILTER_ARGS = ('category', 'min_size', 'max_size', 'modified_after', 'modified_before')
+
+def listing_row(entry):
+    """Convert an Entry into a JSON-friendly row"""
+    return {
+        'name': entry.name,
+        'path': str(entry.path),
+        'is_dir': entry.is_dir,
+        'type': entry.type,
+        'size': entry.size_text,
+        'size_bytes': entry.size,
+        'modified': entry.modified_text,
+        'mtime': entry.mtime,
+        'preview': preview_kind(entry.name) if not entry.is_dir else None
+    }
+
+def encode_cursor(offset, last_name):
+    """Encode a listing position as an opaque cursor"""
+    raw = json.dumps([offset, last_name]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor, entries):
+    """Decode a listing cursor into an offset into the sorted entries
+
+    The cursor remembers the name of the last entry returned. If entries
+    were added or removed since, the offset is re-anchored on that name.
+    """
+    offset, last_name = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    offset = max(int(offset), 0)
+    if 0 < offset <= len(entries) and entries[offset - 1][0] == last_name:
+        return offset
+    
+    for index, entry in enumerate(entries):
+        if entry[0] == last_name:
+            return index + 1
+    
+    return min(offset, len(entries))
+
+def stream_listing(directory, sort_key, reverse):
+    """Yield a directory listing as NDJSON lines in batches"""
+    try:
+        if sort_key == 'none':
+            entries = file_ops.iter_directory(directory)
+        else:
+            entries = file_ops.sort_entries(file_ops.list_directory(directory), sort_key, reverse)
+        
+        batch = []
+        for entry in entries:
+            batch.append(json.dumps(listing_row(Entry.from_record(directory, entry))))
+            if len(batch) >= LISTING_STREAM_BATCH:
+                yield '\n'.join(batch) + '\n'
+                batch = []
+        
+        if batch:
+            yield '\n'.join(batch) + '\n'
+    except (OSError, PermissionError) as e:
+        yield json.dumps({'error': f"Cannot access directory: {e}"}) + '\n'
+
+def search_bounds(args):
+    """Read limit, max_depth and timeout from the query string, clamped to the allowed ranges"""
+    try:
+        limit = min(max(int(args.get('limit', SEARCH_LIMIT)), 1), SEARCH_MAX_LIMIT)
+        max_depth = args.get('max_depth')
+        max_depth = max(int(max_depth), 0) if max_depth not in (None, '') else None
+        timeout = min(max(float(args.get('timeout', SEARCH_TIMEOUT)), 0.1), SEARCH_MAX_TIMEOUT)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid limit, max_depth or timeout')
+    return limit, max_depth, timeout
+
+def parse_date(text):
+    """Parse a YYYY-MM-DD date into a local timestamp"""
+    try:
+        return datetime.strptime(text, '%Y-%m-%d').timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid date: {text} (expected YYYY-MM-DD)")
+
+def search_filter_from_args(args):
+    """Build a SearchFilter from the query string
+    
+    q is read as a substring, glob or regex according to match; category,
+    min_size/max_size (e.g. 10MB) and modified_after/modified_before
+    (YYYY-MM-DD) narrow the results further. Raises ValueError.
+    """
+    query = args.get('q', '')
+    match = args.get('match', 'substring')
+    if match not in SEARCH_MATCH_MODES:
+        raise ValueError(f"Unknown match mode: {match}")
+    
+    min_size = args.get('min_size')
+    max_size = args.get('max_size')
+    modified_after = args.get('modified_after')
+    modified_before = args.get('modified_before')
+    return SearchFilter(text=query if match == 'substring' else '',
+                        glob=query if match == 'glob' else None,
+                        regex=query if match == 'regex' else None,
+                        category=args.get('category') or None,
+                        min_size=utils.parse_size(min_size) if min_size else None,
+                        max_size=utils.parse_size(max_size) if max_size else None,
+                        modified_after=parse_date(modified_after) if modified_after else None,
+                        modified_before=parse_date(modified_before) if modified_before else None)
+
+def name_matches(directory, search_filter, limit, max_depth, timeout, summary):
+    """Yield Entries below directory that match search_filter, as they are found
+
+    Stops after limit matches or once timeout seconds have passed;
+    summary gets the match count and why the search stopped early, if it did.
+    """
+    deadline = time.monotonic() + timeout
+    if file_index is not None:
+        listing_cache.poll()
+        matches = file_index.search(directory, search_filter, max_depth, deadline)
+    else:
+        # Name criteria are checked before stat'ing, so narrow filters prune most of the walk
+        matches = file_ops.walk_matches(directory, search_filter, max_depth, deadline)
+    
+    summary['count'] = 0
+    summary['stopped'] = None
+    try:
+        for folder, record in matches:
+            summary['count'] += 1
+            yield Entry.from_record(folder, record)
+            # Stop at once rather than search the rest of the tree for one match too many
+            if summary['count'] >= limit:
+                summary['stopped'] = 'limit'
+                return
+    finally:
+        matches.close()
+    
+    if time.monotonic() >= deadline:
+        summary['stopped'] = 'timeout'
+
+def stream_name_matches(directory, search_filter, limit, max_depth, timeout):
+    """Yield name search matches as NDJSON lines, ending with a summary line"""
+    summary = {}
+    try:
+        for entry in name_matches(directory, search_filter, limit, max_depth, timeout, summary):
+            yield json.dumps(listing_row(entry)) + '\n'
+    except (OSError, PermissionError, sqlite3.Error) as e:
+        yield json.dumps({'error': f"Cannot search directory: {e}"}) + '\n'
+        return
+    yield json.dumps({'done': True, 'count': summary['count'], 'stopped': summary['stopped']}) + '\n'
+
+def content_matches(directory, query, regex, ignore_case, limit, max_depth, timeout, summary):
+    """Yield content search matches below directory as template/JSON rows
+
+    Bounded like name_matches: stops after limit matching lines or once
+    timeout seconds have passed, and fills in summary the same way.
+    """
+    deadline = time.monotonic() + timeout
+    summary['count'] = 0
+    summary['stopped'] = None
+    matches = content_search.search(directory, query, regex, ignore_case, max_depth=max_depth, deadline=deadline)
+    try:
+        for path, line_number, line in matches:
+            summary['count'] += 1
+            folder, name = os.path.split(path)
+            yield {
+                'name': name,
+                'directory': folder,
+                'path': path,
+                'relative': os.path.relpath(path, directory),
+                'line_number': line_number,
+                'line': line
+            }
+            if summary['count'] >= limit:
+                summary['stopped'] = 'limit'
+                return
+    finally:
+        matches.close()
+    
+    if time.monotonic() >= deadline:
+        summary['stopped'] = 'timeout'
+
+def stream_content_matches(directory, query, regex, ignore_case, limit, max_depth, timeout):
+    """Yield content search matches as NDJSON lines, ending with a summary line"""
+    summary = {}
+    try:
+        for match in content_matches(directory, query, regex, ignore_case, limit, max_depth, timeout, summary):
+            yield json.dumps(match) + '\n'
+    except (OSError, PermissionError) as e:
+        yield json.dumps({'error': f"Cannot search directory: {e}"}) + '\n'
+        return
+    yield json.dumps({'done': True, 'count': summary['count'], 'stopped': summary['stopped']}) + '\n'
 
 @app.route('/')
 def index():
-    """Main file manager interface"""
-    global current_directory
+    """Main file manager interface; the directory is given by ?path="""
     try:
-        directory_contents = file_ops.get_directory_contents(current_directory)
+        current_directory = request_directory(request.args.get('path'))
+        if not current_directory.is_dir():
+            raise Exception(f"Cannot access directory: {current_directory}")
+        remember_directory(current_directory)
+        
         current_path = str(current_directory)
         parent_path = str(current_directory.parent) if current_directory.parent != current_directory else None
         
-        # Process files for web display
-        file_list = []
-        for item in directory_contents:
-            if item['name'] == '..':  # Skip parent directory entry
-                continue
-            file_info = {
-                'name': item['name'],
-                'path': str(item['path']),
-                'is_dir': item['type'] == 'Folder',
-                'size': utils.format_size(item['size']) if item['size'] is not None else '',
-                'modified': utils.format_datetime(item['modified'])
-            }
-            file_list.append(file_info)
-        
+        # Rows are loaded incrementally by the page from /api/list
         return render_template('index.html', 
-                             files=file_list, 
                              current_path=current_path,
-                             parent_path=parent_path)
+                             parent_path=parent_path,
+                             page_size=LISTING_PAGE_SIZE)
     except Exception as e:
         return render_template('error.html', error=str(e))
 
+@app.route('/api/list')
+def api_list():
+    """List a directory as paginated JSON, or as NDJSON with format=ndjson"""
+    directory = request_directory(request.args.get('path'))
+    sort_key = request.args.get('sort', 'name')
+    reverse = request.args.get('order', 'asc') == 'desc'
+    
+    stream = request.args.get('format') == 'ndjson'
+    if sort_key not in LISTING_SORT_KEYS and not (stream and sort_key == 'none'):
+        return jsonify({'error': f"Unknown sort key: {sort_key}"}), 400
+    
+    if not directory.is_dir():
+        return jsonify({'error': 'Directory not found'}), 404
+    
+    if stream:
+        return Response(stream_listing(directory, sort_key, reverse), mimetype='application/x-ndjson')
+    
+    try:
+        limit = min(max(int(request.args.get('limit', LISTING_PAGE_SIZE)), 1), LISTING_MAX_PAGE_SIZE)
+        entries = file_ops.sort_entries(file_ops.list_directory(directory), sort_key, reverse)
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            offset = decode_cursor(cursor, entries)
+        else:
+            offset = max(int(request.args.get('offset', 0)), 0)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid offset, limit or cursor'}), 400
+    except (OSError, PermissionError) as e:
+        return jsonify({'error': f"Cannot access directory: {e}"}), 500
+    
+    page = entries[offset:offset + limit]
+    end = offset + len(page)
+    return jsonify({
+        'path': str(directory),
+        'parent': str(directory.parent) if directory.parent != directory else None,
+        'sort': sort_key,
+        'order': 'desc' if reverse else 'asc',
+        'total': len(entries),
+        'offset': offset,
+        'items': [listing_row(Entry.from_record(directory, entry)) for entry in page],
+        'next_cursor': encode_cursor(end, page[-1][0]) if page and end < len(entries) else None
+    })
+
 @app.route('/navigate', methods=['POST'])
 def navigate():
-    """Navigate to a different directory"""
-    global current_directory
+    """Navigate to a different directory by redirecting to its URL"""
     path = request.form.get('path')
     if path:
         try:
             new_path = Path(path).resolve()
             if new_path.exists() and new_path.is_dir():
-                current_directory = new_path
+                return redirect(url_for('index', path=str(new_path)))
         except Exception as e:
             pass  # Stay in current directory if navigation fails
     return redirect(url_for('index'))
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Upload a file to the current directory"""
-    global current_directory
+    """Upload a file to the directory given by the path field"""
     if 'file' not in request.files:
         return jsonify({'error': 'No file selected'}), 400
     
@@ -83,22 +405,92 @@ def upload_file():
         return jsonify({'error': 'No file selected'}), 400
     
     try:
-        filepath = current_directory / file.filename
+        filepath = request_directory(request.form.get('path')) / file.filename
         file.save(str(filepath))
         return jsonify({'success': 'File uploaded successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def upload_error_response(e):
+    """Turn an upload exception into a JSON error response"""
+    if isinstance(e, UploadNotFound):
+        return jsonify({'error': str(e)}), 404
+    if isinstance(e, UploadError):
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'error': str(e)}), 500
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a chunked upload into the given (or last viewed) directory
+
+    Takes JSON or form data with filename and size. Chunks are then sent
+    with PUT /uploads/<id>?offset=N and finished with POST /uploads/<id>/commit.
+    """
+    if upload_manager is None:
+        return jsonify({'error': 'Chunked uploads are not available'}), 503
+    
+    data = request.get_json(silent=True) or request.form
+    try:
+        directory = request_directory(data.get('path'))
+        upload = upload_manager.create(directory, data.get('filename'), data.get('size'))
+        return jsonify({'upload': upload}), 201
+    except Exception as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Get the received ranges of an upload, to resume it"""
+    if upload_manager is None:
+        return jsonify({'error': 'Chunked uploads are not available'}), 503
+    try:
+        return jsonify({'upload': upload_manager.status(upload_id)})
+    except Exception as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Write the raw request body at ?offset= into the upload"""
+    if upload_manager is None:
+        return jsonify({'error': 'Chunked uploads are not available'}), 503
+    try:
+        # Read the body stream directly so Werkzeug never spools it to a temp file
+        upload = upload_manager.write_chunk(upload_id, request.args.get('offset'),
+                                            request.stream, request.content_length)
+        return jsonify({'upload': upload})
+    except Exception as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>/commit', methods=['POST'])
+def commit_upload(upload_id):
+    """Finish an upload by renaming it into place"""
+    if upload_manager is None:
+        return jsonify({'error': 'Chunked uploads are not available'}), 503
+    try:
+        result = upload_manager.commit(upload_id, file_ops)
+        return jsonify({'success': 'File uploaded successfully', 'file': result})
+    except Exception as e:
+        return upload_error_response(e)
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    """Cancel an upload and discard what was received"""
+    if upload_manager is None:
+        return jsonify({'error': 'Chunked uploads are not available'}), 503
+    try:
+        upload_manager.abort(upload_id)
+        return jsonify({'success': 'Upload cancelled'})
+    except Exception as e:
+        return upload_error_response(e)
+
 @app.route('/create_folder', methods=['POST'])
 def create_folder():
-    """Create a new folder in the current directory"""
-    global current_directory
+    """Create a new folder in the directory given by the path field"""
     folder_name = request.form.get('name')
     if not folder_name:
         return jsonify({'error': 'Folder name is required'}), 400
     
     try:
-        new_folder = current_directory / folder_name
+        new_folder = request_directory(request.form.get('path')) / folder_name
         file_ops.create_folder(new_folder)
         return jsonify({'success': 'Folder created successfully'})
     except Exception as e:
@@ -106,18 +498,182 @@ def create_folder():
 
 @app.route('/delete', methods=['POST'])
 def delete_item():
-    """Delete a file or folder"""
+    """Delete a file or folder
+
+    The item is moved out of sight at once and reclaimed by a background
+    job; cancelling the job (POST /jobs/<id>/cancel) restores it until then.
+    """
     item_path = request.form.get('path')
     if not item_path:
         return jsonify({'error': 'Path is required'}), 400
     
     try:
         path = Path(item_path)
-        file_ops.delete_item(path)
-        return jsonify({'success': 'Item deleted successfully'})
+        try:
+            path.lstat()
+        except OSError as e:
+            raise Exception(f"Cannot delete item: {e}")
+        
+        job = job_manager.submit_delete([path])
+        return jsonify({'success': 'Item deleted successfully', 'job': job.to_dict()}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/batch', methods=['POST'])
+def batch():
+    """Run a JSON list of delete, rename and create_folder operations in one request
+
+    The body is {"operations": [...]} (or the bare list), each operation
+    {"op": "delete", "path"}, {"op": "rename", "path", "new_name"} or
+    {"op": "create_folder", "name", "path"}; create_folder defaults to the
+    last viewed directory. Operations run concurrently on a bounded pool
+    and each gets its own result, so one failure does not stop the rest.
+    With ?format=ndjson results stream as they finish, ending with a
+    summary line; otherwise they are returned together in request order.
+    Deleted items are reclaimed by one background job, returned as 'job';
+    cancelling it restores them until then.
+    """
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else data
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'A JSON list of operations is required'}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({'error': f"At most {MAX_BATCH_OPERATIONS} operations per batch"}), 400
+    
+    default_directory = request_directory()
+    deletions = StagedDelete()
+    results = batch_runner.run(operations, default_directory, deletions)
+    
+    def reclaim():
+        """Start reclaiming whatever the batch deleted"""
+        return job_manager.submit_reclaim(deletions).to_dict() if deletions.items else None
+    
+    if request.args.get('format') == 'ndjson':
+        def stream_results():
+            succeeded = failed = 0
+            try:
+                for result in results:
+                    if 'error' in result:
+                        failed += 1
+                    else:
+                        succeeded += 1
+                    yield json.dumps(result) + '\n'
+            finally:
+                # Items staged before a disconnect are still reclaimed, once nothing more can be staged
+                results.close()
+                job = reclaim()
+            yield json.dumps({'done': True, 'succeeded': succeeded, 'failed': failed, 'job': job}) + '\n'
+        return Response(stream_results(), mimetype='application/x-ndjson')
+    
+    results = sorted(results, key=lambda result: result['index'])
+    failed = sum(1 for result in results if 'error' in result)
+    return jsonify({'results': results, 'succeeded': len(results) - failed, 'failed': failed, 'job': reclaim()})
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """List background jobs, newest first"""
+    return jsonify({'jobs': [job.to_dict() for job in job_manager.list()]})
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Start a copy, move, delete, size, duplicates or usage job
+
+    Accepts JSON or form data with kind, paths (a list, or repeated form
+    fields) and dest (copy/move only, defaults to the last viewed directory).
+    Duplicates jobs also take min_size in bytes.
+    """
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind') or request.form.get('kind')
+    paths = data.get('paths') or request.form.getlist('paths')
+    dest = request_directory(data.get('dest') or request.form.get('dest'))
+    
+    if isinstance(paths, str):
+        paths = [paths]
+    if not paths:
+        return jsonify({'error': 'At least one path is required'}), 400
+    
+    if kind == 'copy':
+        job = job_manager.submit_copy(paths, Path(dest))
+    elif kind == 'move':
+        job = job_manager.submit_move(paths, Path(dest))
+    elif kind == 'delete':
+        job = job_manager.submit_delete(paths)
+    elif kind == 'size':
+        if len(paths) != 1:
+            return jsonify({'error': 'Size jobs take exactly one path'}), 400
+        job = job_manager.submit_size(paths[0])
+    elif kind == 'usage':
+        if len(paths) != 1 or not Path(paths[0]).is_dir():
+            return jsonify({'error': 'Usage jobs take exactly one folder'}), 400
+        job = job_manager.submit_usage(paths[0])
+    elif kind == 'duplicates':
+        try:
+            min_size = max(int(data.get('min_size') or request.form.get('min_size') or 1), 1)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid min_size'}), 400
+        job = job_manager.submit_duplicates(paths, min_size)
+    else:
+        return jsonify({'error': f"Unknown job kind: {kind}"}), 400
+    
+    return jsonify({'job': job.to_dict()}), 202
+
+@app.route('/duplicates')
+def duplicates():
+    """Duplicate finder page for the directory given by ?path=; the scan runs as a job"""
+    try:
+        current_directory = request_directory(request.args.get('path'))
+        if not current_directory.is_dir():
+            raise Exception(f"Cannot access directory: {current_directory}")
+        return render_template('duplicates.html', current_path=str(current_directory))
+    except Exception as e:
+        return render_template('error.html', error=str(e))
+
+@app.route('/usage')
+def usage():
+    """Disk usage page for the directory given by ?path=; the scan runs as a job"""
+    try:
+        current_directory = request_directory(request.args.get('path'))
+        if not current_directory.is_dir():
+            raise Exception(f"Cannot access directory: {current_directory}")
+        return render_template('usage.html', current_path=str(current_directory))
+    except Exception as e:
+        return render_template('error.html', error=str(e))
+
+@app.route('/api/usage')
+def api_usage():
+    """Get one folder of a scanned disk usage tree: ?root= names the scan, ?path= the folder
+    
+    Reads the in-memory tree, so drilling down never rescans; while the
+    scan runs the totals are partial and 'scanning' is true. A scan run
+    by another worker is rebuilt from what it has saved so far.
+    """
+    root = request.args.get('root', '')
+    tree = job_manager.usage_tree(root) if root else None
+    if tree is None:
+        return jsonify({'error': 'No disk usage scan for this folder'}), 404
+    
+    node = tree.snapshot(request.args.get('path') or None)
+    if node is None:
+        return jsonify({'error': 'Folder not found in the scan'}), 404
+    return jsonify(node)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Get the status and progress of a job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job': job.to_dict()})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Request cancellation of a job"""
+    if not job_manager.cancel(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    # A deletion undone from the registry may have no job record here
+    job = job_manager.get(job_id)
+    return jsonify({'job': job.to_dict() if job is not None else None})
+
 @app.route('/rename', methods=['POST'])
 def rename_item():
     """Rename a file or folder"""
@@ -135,56 +691,241 @@ def rename_item():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def file_etag(stat):
+    """Build a strong ETag from stat data; it changes whenever the file is replaced or modified"""
+    return f"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+def send_file_cacheable(filepath, **kwargs):
+    """Send a file with Range, ETag and Last-Modified support
+
+    Werkzeug answers If-None-Match / If-Modified-Since with 304 and Range
+    requests with 206. Caches may store the response but must revalidate.
+    """
+    stat = filepath.stat()
+    response = send_file(str(filepath), conditional=True, etag=file_etag(stat),
+                         last_modified=stat.st_mtime, **kwargs)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/download/<path:filename>')
 def download_file(filename):
-    """Download a file"""
-    global current_directory
+    """Download a file from the directory given by ?path="""
     try:
-        filepath = current_directory / filename
+        filepath = request_directory(request.args.get('path')) / filename
         if filepath.exists() and filepath.is_file():
-            return send_file(str(filepath), as_attachment=True)
+            return send_file_cacheable(filepath, as_attachment=True)
         else:
             return jsonify({'error': 'File not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/preview')
+def preview():
+    """Get a thumbnail of an image, or the first lines of a text file, given by ?path=
+
+    ?size= bounds the thumbnail in pixels. Links that carry the file's
+    mtime and size as ?v= change whenever the file does, so those
+    responses are cached for a year; others are revalidated by ETag.
+    """
+    item_path = request.args.get('path')
+    if not item_path:
+        return jsonify({'error': 'Path is required'}), 400
+    try:
+        size = int(request.args.get('size', THUMBNAIL_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Invalid size'}), 400
+    
+    try:
+        filepath = Path(item_path)
+        if not filepath.is_file():
+            return jsonify({'error': 'File not found'}), 404
+        result = previewer.preview(filepath, size)
+    except OSError as e:
+        return jsonify({'error': f"Cannot preview file: {e}"}), 500
+    if result is None:
+        return jsonify({'error': 'No preview available'}), 404
+    
+    mimetype, data, etag = result
+    response = Response(data, content_type=mimetype)
+    response.set_etag(etag)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.cache_control.public = True
+    if request.args.get('v'):
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/view')
+def view_file():
+    """Page through a text file given by ?path=, without downloading it"""
+    item_path = request.args.get('path')
+    if not item_path:
+        return render_template('error.html', error='Path is required')
+    filepath = Path(item_path)
+    if not filepath.is_file():
+        return render_template('error.html', error='File not found')
+    return render_template('view.html', path=str(filepath.resolve()), name=filepath.name,
+                           parent=str(filepath.resolve().parent), page_lines=PAGE_LINES)
+
+@app.route('/api/view')
+def view_page():
+    """Get one page of lines of a text file given by ?path=
+
+    The page starts at ?line= (from 1), at the first line starting at or
+    after byte ?offset=, ends before byte ?before=, or with ?tail=1 is
+    the end of the file; ?count= lines are returned. Tail and paging by
+    offset are answered straight from the file, however large; line
+    numbers need the file indexed up to them, which is done once.
+    """
+    item_path = request.args.get('path')
+    if not item_path:
+        return jsonify({'error': 'Path is required'}), 400
+    try:
+        line, offset, before = (int(request.args[name]) if request.args.get(name) else None
+                                for name in ('line', 'offset', 'before'))
+        count = int(request.args.get('count', PAGE_LINES))
+    except ValueError:
+        return jsonify({'error': 'Invalid line, offset, before or count'}), 400
+    tail = request.args.get('tail', '').lower() in ('1', 'true', 'yes')
+    
+    filepath = Path(item_path)
+    if not filepath.is_file():
+        return jsonify({'error': 'File not found'}), 404
+    try:
+        page = text_viewer.page(filepath, line=line, offset=offset, before=before, tail=tail, count=count)
+    except ValueError as e:
+        return jsonify({'error': f"Invalid page request: {e}"}), 400
+    except OSError as e:
+        return jsonify({'error': f"Cannot read file: {e}"}), 500
+    response = jsonify(page)
+    response.cache_control.no_store = True
+    return response
+
+@app.route('/api/view/follow')
+def follow_file():
+    """Stream lines appended to a text file given by ?path= as server-sent events
+
+    Starts at byte ?offset=, or at the start of the last, unfinished
+    line (the end of the file if it ends with a newline). Each 'lines'
+    event carries {'offset', 'lines', 'next_offset'} and next_offset as
+    its id, so a reconnecting EventSource resumes from Last-Event-ID; a
+    'reset' event means the file was truncated or replaced.
+    """
+    item_path = request.args.get('path')
+    if not item_path:
+        return jsonify({'error': 'Path is required'}), 400
+    offset = request.headers.get('Last-Event-ID') or request.args.get('offset')
+    try:
+        offset = int(offset) if offset not in (None, '') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid offset'}), 400
+    
+    filepath = Path(item_path)
+    if not filepath.is_file():
+        return jsonify({'error': 'File not found'}), 404
+    if not follow_streams.acquire(blocking=False):
+        return jsonify({'error': 'Too many files are being followed; try again later'}), 503
+    try:
+        events = text_viewer.follow(filepath, offset)
+    except OSError as e:
+        follow_streams.release()
+        return jsonify({'error': f"Cannot read file: {e}"}), 500
+    
+    def generate():
+        started = time.monotonic()
+        yield 'retry: 2000\n\n'
+        try:
+            for event in events:
+                if event is None:
+                    # Heartbeat; writing it is how a closed connection is noticed
+                    yield ': keepalive\n\n'
+                else:
+                    name = 'reset' if event.get('reset') else 'lines'
+                    yield f"id: {event['next_offset']}\nevent: {name}\ndata: {json.dumps(event)}\n\n"
+                if time.monotonic() - started > FOLLOW_STREAM_SECONDS:
+                    return
+        finally:
+            events.close()
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Released when the server closes the response, even if the stream never started
+    response.call_on_close(follow_streams.release)
+    return response
+
 @app.route('/search')
 def search():
-    """Search for files and folders"""
+    """Search for files and folders below the directory given by ?path=
+
+    Matches are streamed as they are found, bounded by limit, max_depth
+    and timeout; format=ndjson streams JSON lines instead of HTML.
+    See search_filter_from_args for the name, type, size and date filters.
+    """
     query = request.args.get('q', '')
-    if not query:
-        return redirect(url_for('index'))
+    content_mode = request.args.get('mode') == 'content'
+    if not query and (content_mode or not any(request.args.get(arg) for arg in SEARCH_FILTER_ARGS)):
+        return redirect(url_for('index', path=request.args.get('path')))
     
     try:
-        global current_directory
-        # Implement search functionality
-        results = []
-        query_lower = query.lower()
+        current_directory = request_directory(request.args.get('path'))
+        if not current_directory.is_dir():
+            raise Exception(f"Cannot access directory: {current_directory}")
         
-        # Search in current directory and subdirectories
-        for item in current_directory.rglob('*'):
-            try:
-                if query_lower in item.name.lower():
-                    stat_info = item.stat()
-                    file_info = {
-                        'name': item.name,
-                        'path': str(item),
-                        'is_dir': item.is_dir(),
-                        'size': utils.format_size(stat_info.st_size) if not item.is_dir() else '',
-                        'modified': utils.format_datetime(datetime.fromtimestamp(stat_info.st_mtime))
-                    }
-                    results.append(file_info)
-            except (OSError, PermissionError):
-                # Skip files/directories we can't access
-                continue
+        stream = request.args.get('format') == 'ndjson'
+        regex = request.args.get('regex') == '1'
+        ignore_case = request.args.get('case') != '1'
+        try:
+            limit, max_depth, timeout = search_bounds(request.args)
+            if content_mode:
+                check_pattern(query, regex, ignore_case)
+            else:
+                search_filter = search_filter_from_args(request.args)
+        except ValueError as e:
+            if stream:
+                return jsonify({'error': str(e)}), 400
+            raise
+        
+        # Content mode greps inside files and streams matches as workers find them
+        if content_mode:
+            if stream:
+                return Response(stream_content_matches(current_directory, query, regex, ignore_case,
+                                                       limit, max_depth, timeout),
+                                mimetype='application/x-ndjson')
+            summary = {}
+            return Response(stream_template('content_results.html',
+                                            matches=content_matches(current_directory, query, regex, ignore_case,
+                                                                    limit, max_depth, timeout, summary),
+                                            summary=summary,
+                                            query=query,
+                                            regex=regex,
+                                            match_case=not ignore_case,
+                                            limit=limit,
+                                            timeout=timeout,
+                                            current_path=str(current_directory)))
         
-        # Sort results by name, directories first
-        results.sort(key=lambda x: (not x['is_dir'], x['name'].lower()))
+        if stream:
+            return Response(stream_name_matches(current_directory, search_filter, limit, max_depth, timeout),
+                            mimetype='application/x-ndjson')
         
-        return render_template('search_results.html', 
-                             files=results, 
-                             query=query,
-                             current_path=str(current_directory))
+        # Rows are rendered as the index or walk finds them; the summary is filled in when it ends
+        summary = {}
+        return Response(stream_template('search_results.html',
+                                        files=name_matches(current_directory, search_filter, limit, max_depth,
+                                                           timeout, summary),
+                                        summary=summary,
+                                        query=query,
+                                        filters=request.args,
+                                        match_modes=SEARCH_MATCH_MODES,
+                                        categories=list(COMMON_FILE_EXTENSIONS),
+                                        limit=limit,
+                                        max_depth=max_depth,
+                                        timeout=timeout,
+                                        current_path=str(current_directory)))
     except Exception as e:
         return render_template('error.html', error=str(e))
 
@@ -198,7 +939,7 @@ def api_status():
     """API status endpoint"""
     return jsonify({
         'status': 'running',
-        'current_directory': str(current_directory),
+        'current_directory': str(request_directory(request.args.get('path'))),
         'service': 'file-manager-web'
     })
 